@@ -1,17 +1,21 @@
-import openai
 import json
 import uuid
 import os
 import random
 import time
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime
 from functools import wraps
 from secretcodes import OPENAI_API_KEY
 from flask import (
-    Flask, render_template, send_from_directory, request,
-    jsonify, session, redirect, url_for, send_file, abort
+    Blueprint, Flask, render_template, send_from_directory, request,
+    jsonify, session, redirect, url_for, send_file, abort,
+    Response, stream_with_context, current_app
 )
+import click
+from flask.cli import with_appcontext
 
 # label taxonomy - maps various finding names to standard labels
 group_mapping = {
@@ -45,32 +49,62 @@ group_mapping = {
     'Bone density abnormality/lesion': 'Bone density abnormality/lesion',
     'Spinal curvature abnormality': 'Spinal curvature abnormality'
 }
-from models import db, AccessCode, ActivityLog, Admin, RadgameReportLog, UserCaseLog
+from models import db, AccessCode, ActivityLog, Admin, BoundingBoxLog, GradingJob, RadgameReportLog, UserCaseLog
+from parquet_export import TEST_PHASE_TABLES
 import io
+import csv
+import itertools
+import shutil
+import tempfile
+from scores.crimson_score import get_crimson_score, stream_crimson_score
+from scores.grade_cache import GradeCache
+from scores.llm_backend import get_llm_client
 from scores.style_score import calculate_style_score
+from grading_queue import enqueue_grading_job, get_job as get_grading_job
+from case_index import load_case_index, localize_payload, prebuild_localize_cases
+from db_profile import apply_sqlite_pragmas, engine_options
 import shortuuid
-import pandas as pd
 
 from io import BytesIO
 from config import (
     LOCALIZE_JSON,
     REPORT_METADATA_JSON,
+    CASE_INDEX_PATH,
     REPORT_IMAGE_BASE,
     LOCALIZE_IMAGE_BASE,
-    SHOW_IMAGE_NAME
+    SHOW_IMAGE_NAME,
+    LOCALIZE_MATCHER,
+    LOCALIZE_IOU_THRESHOLD,
+    GRADING_QUEUE_ENABLED,
+    GRADING_CONCURRENT,
+    GRADING_THREADS,
+    GREEN_TIMEOUT_S,
+    STYLE_TIMEOUT_S,
+    GRADING_STREAM_POLL_S,
+    GRADING_STREAM_TIMEOUT_S,
+    GRADE_CACHE_ENABLED,
+    GRADE_CACHE_PATH,
+    GRADE_CACHE_MAX_ENTRIES,
+    GRADE_CACHE_TTL_S,
+    DB_PROFILE,
+    SQLITE_PRAGMAS,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT_S,
+    DB_POOL_RECYCLE_S,
+    DATABASE_URL,
+    MIGRATIONS_DIR,
+    BASE_DIR
 )
 os.environ["RANK"] = "0"
 os.environ["WORLD_SIZE"] = "1"
 os.environ["MASTER_ADDR"] = "localhost"
 os.environ["MASTER_PORT"] = "12355"
-from flask_migrate import Migrate
-from sqlalchemy import inspect, text
-from math import isfinite
+from flask_migrate import Migrate, upgrade as migrate_upgrade
+from sqlalchemy import bindparam, case, exists, func, inspect, select, text
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', str(uuid.uuid4()))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///training.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+bp = Blueprint('radgame', __name__)
+migrate = Migrate()
 
 # practice cases needed before post-test unlocks
 _default_loc = 375
@@ -78,99 +112,185 @@ _default_rep = 150
 LOCALIZE_POST_REQUIRED = _default_loc
 REPORT_POST_REQUIRED = _default_rep
 
-db.init_app(app)
-migrate = Migrate(app, db)
-
-# openai setup
-openai.api_key = os.environ.get('OPENAI_API_KEY', OPENAI_API_KEY)
-client = openai.OpenAI(api_key=openai.api_key)
-
+# shared pool for in-flight CRIMSON/StyleScore calls
+_grading_executor = ThreadPoolExecutor(max_workers=GRADING_THREADS, thread_name_prefix='grading')
+
+# LLM client, grade cache and case data are built on first use, not at import
+_lazy_lock = threading.Lock()
+_client = None
+_grade_cache = None
+_grade_cache_loaded = False
+
+
+# app.config['LLM_CLIENT'] overrides the configured backend (e.g. a fake client in tests)
+def get_client():
+    global _client
+    override = current_app.config.get('LLM_CLIENT')
+    if override is not None:
+        return override
+    if _client is None:
+        with _lazy_lock:
+            if _client is None:
+                # openai setup; RADGAME_LLM_BACKEND swaps in the local stand-in for load testing
+                _client = get_llm_client(api_key=os.environ.get('OPENAI_API_KEY', OPENAI_API_KEY))
+    return _client
+
+
+# persistent grade cache shared across workers; identical submissions skip the LLM
+def get_grade_cache():
+    global _grade_cache, _grade_cache_loaded
+    if not _grade_cache_loaded:
+        with _lazy_lock:
+            if not _grade_cache_loaded:
+                if GRADE_CACHE_ENABLED:
+                    _grade_cache = GradeCache(GRADE_CACHE_PATH, GRADE_CACHE_MAX_ENTRIES, GRADE_CACHE_TTL_S)
+                _grade_cache_loaded = True
+    return _grade_cache
+
+
+# the openai package is only imported once a client is built, so check without importing it
+def _is_openai_error(err):
+    openai = sys.modules.get('openai')
+    return openai is not None and isinstance(err, openai.APIError)
+
+
+def _is_openai_timeout(err):
+    openai = sys.modules.get('openai')
+    return openai is not None and isinstance(err, openai.APITimeoutError)
+
+
+def create_app(test_config=None):
+    # pinned so the flask CLI (which imports this module via the repo's package path) uses the same instance dir
+    app = Flask(__name__, instance_path=os.path.abspath(os.path.join(BASE_DIR, 'instance')))
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', str(uuid.uuid4()))
+    app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['DB_PROFILE'] = DB_PROFILE
+    if test_config:
+        app.config.update(test_config)
+    if 'SQLALCHEMY_ENGINE_OPTIONS' not in app.config:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+            app.config['SQLALCHEMY_DATABASE_URI'], app.config['DB_PROFILE'],
+            DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT_S, SQLITE_PRAGMAS['busy_timeout'], DB_POOL_RECYCLE_S
+        )
 
-# db init and schema updates
-with app.app_context():
-    db.create_all()
-    try:
-        inspector = inspect(db.engine)
-        access_code_columns = [c['name'] for c in inspector.get_columns('access_codes')]
-        if 'localize_mode' not in access_code_columns:
-            try:
-                db.session.execute(text("ALTER TABLE access_codes ADD COLUMN localize_mode VARCHAR(10) DEFAULT 'active'"))
-                db.session.commit()
-            except Exception as add_err:
-                print(f"[Schema Check] Could not add column localize_mode: {add_err}")
-        if 'report_mode' not in access_code_columns:
-            try:
-                db.session.execute(text("ALTER TABLE access_codes ADD COLUMN report_mode VARCHAR(10) DEFAULT 'active'"))
-                db.session.commit()
-            except Exception as add_err:
-                print(f"[Schema Check] Could not add column report_mode: {add_err}")
-        gating_columns = [
-            ('took_localize_pre', "ALTER TABLE access_codes ADD COLUMN took_localize_pre BOOLEAN DEFAULT 0"),
-            ('took_localize_post', "ALTER TABLE access_codes ADD COLUMN took_localize_post BOOLEAN DEFAULT 0"),
-            ('took_report_pre', "ALTER TABLE access_codes ADD COLUMN took_report_pre BOOLEAN DEFAULT 0"),
-            ('took_report_post', "ALTER TABLE access_codes ADD COLUMN took_report_post BOOLEAN DEFAULT 0"),
-            ('localize_cases_completed', "ALTER TABLE access_codes ADD COLUMN localize_cases_completed INTEGER DEFAULT 0"),
-            ('report_cases_completed', "ALTER TABLE access_codes ADD COLUMN report_cases_completed INTEGER DEFAULT 0")
-        ]
-        for col, stmt in gating_columns:
-            if col not in access_code_columns:
-                try:
-                    db.session.execute(text(stmt))
-                    db.session.commit()
-                except Exception as add_err:
-                    print(f"[Schema Check] Could not add column {col}: {add_err}")
-        try:
-            ucl_columns = [c['name'] for c in inspector.get_columns('user_case_logs')]
-            snapshot_cols = [
-                ('localize_cases_completed_snapshot', "ALTER TABLE user_case_logs ADD COLUMN localize_cases_completed_snapshot INTEGER DEFAULT 0")
-            ]
-            for col, stmt in snapshot_cols:
-                if col not in ucl_columns:
-                    try:
-                        db.session.execute(text(stmt))
-                        db.session.commit()
-                    except Exception as sc_err:
-                        print(f"[Schema Check] Could not add user_case_logs column {col}: {sc_err}")
-            try:
-                rrl_cols = [c['name'] for c in inspector.get_columns('radgame_report_logs')]
-                if 'report_cases_completed_snapshot' not in rrl_cols:
-                    try:
-                        db.session.execute(text("ALTER TABLE radgame_report_logs ADD COLUMN report_cases_completed_snapshot INTEGER DEFAULT 0"))
-                        db.session.commit()
-                    except Exception as rrl_err:
-                        print(f"[Schema Check] Could not add radgame_report_logs.report_cases_completed_snapshot: {rrl_err}")
-            except Exception as inner_rrl_err:
-                print(f"[Schema Check] Skipped radgame_report_logs snapshot add: {inner_rrl_err}")
-        except Exception as ucl_err:
-            print(f"[Schema Check] Skipped user_case_logs snapshot add: {ucl_err}")
-
-    except Exception as schema_err:
-        print(f"[Schema Check] Skipped automatic schema add: {schema_err}")
+    db.init_app(app)
+    if app.config['DB_PROFILE'] == 'production':
+        with app.app_context():
+            apply_sqlite_pragmas(db.engine, SQLITE_PRAGMAS)
+    # batch mode so autogenerated ALTERs work on SQLite as well as PostgreSQL
+    migrate.init_app(app, db, directory=MIGRATIONS_DIR, render_as_batch=True)
+    app.register_blueprint(bp)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(backfill_timer_totals_command)
+    app.cli.add_command(check_query_plans_command)
+    return app
+
+
+# db init and schema updates; run once per deploy via `flask --app app init-db`.
+# schema changes are Alembic migrations in migrations/ (the baseline revision also adopts
+# training.db files created before migrations existed)
+def init_db():
+    migrate_upgrade()
     if not Admin.query.filter_by(username='admin').first():
         admin = Admin(username='admin')
         admin.set_password('admin')
         db.session.add(admin)
         db.session.commit()
 
-RUN_ID = str(uuid.uuid4())
 
+# recompute the running timer totals on access_codes from the case logs
+def backfill_timer_totals():
+    try:
+        result = db.session.execute(text(
+            "UPDATE access_codes SET "
+            "localize_time_ms = (SELECT COALESCE(SUM(time_spent_ms), 0) FROM user_case_logs "
+            "WHERE user_case_logs.access_code_id = access_codes.code), "
+            "report_timer_checkpoint_ms = (SELECT COALESCE(MAX(timer_checkpoint_ms), 0) FROM radgame_report_logs "
+            "WHERE radgame_report_logs.access_code_id = access_codes.code)"
+        ))
+        db.session.commit()
+        return result.rowcount
+    except Exception as backfill_err:
+        db.session.rollback()
+        print(f"[Schema Check] Could not backfill timer totals: {backfill_err}")
+        return 0
 
-with open(LOCALIZE_JSON) as f:
-    _localize_list = json.load(f)
 
-def _clip01(v: float) -> float:
-    return max(0.0, min(1.0, v))
+# the per-request queries that must stay on an index as the log tables grow
+def _hot_queries(code, sample_id):
+    return {
+        'progress_summary': db.session.query(
+            func.count(UserCaseLog.id), func.sum(UserCaseLog.correct_count), func.max(UserCaseLog.timer_checkpoint_ms)
+        ).filter(UserCaseLog.access_code_id == code),
+        'report_summary': db.session.query(
+            func.count(RadgameReportLog.id), func.avg(RadgameReportLog.green_score)
+        ).filter(RadgameReportLog.access_code_id == code),
+        'complete_case': db.session.query(func.count(UserCaseLog.id)).filter(UserCaseLog.access_code_id == code),
+        'user_timer_checkpoint': UserCaseLog.query.filter_by(access_code_id=code)
+            .order_by(UserCaseLog.timestamp.desc()).limit(1),
+        'report_history': RadgameReportLog.query.filter_by(access_code_id=code)
+            .order_by(RadgameReportLog.timestamp.desc()),
+        'get_report_case': RadgameReportLog.query.filter_by(access_code_id=code, sample_id=sample_id)
+            .order_by(RadgameReportLog.timestamp.desc()).limit(1),
+        'code_activities': ActivityLog.query.filter_by(access_code_id=code),
+        'code_completions': ActivityLog.query.filter_by(access_code_id=code, activity_type='case_completion')
+            .order_by(ActivityLog.timestamp.desc()),
+        'activity_boxes': BoundingBoxLog.query.filter_by(activity_log_id=1),
+        'claim_grading_job': GradingJob.query.filter_by(status='queued').order_by(GradingJob.created_at.asc()).limit(1),
+        'active_grading_job': GradingJob.query.filter(
+            GradingJob.access_code_id == code, GradingJob.sample_id == sample_id,
+            GradingJob.status.in_(('queued', 'running'))
+        ),
+    }
+
+
+# EXPLAIN QUERY PLAN each hot query; returns {name: [plan lines]} for those that scan a whole table
+def check_query_plans():
+    if db.engine.dialect.name != 'sqlite':
+        print(f"[Query Plans] Skipped: EXPLAIN QUERY PLAN check is SQLite only ({db.engine.dialect.name})")
+        return {}
+    failures = {}
+    with db.engine.connect() as conn:
+        plans = {}
+        for name, query in _hot_queries('ABC123', '0').items():
+            sql = str(query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+            plans[name] = [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+    for name, plan in plans.items():
+        # "SCAN t" is a full table scan; "SCAN t USING [COVERING] INDEX" and "SEARCH t USING ..." are fine
+        if any(line.startswith('SCAN ') and ' USING ' not in line for line in plan):
+            failures[name] = plan
+        print(f"[Query Plans] {'FULL SCAN' if name in failures else 'ok'} {name}: {'; '.join(plan)}")
+    return failures
+
+
+@click.command('check-query-plans')
+@with_appcontext
+def check_query_plans_command():
+    """Fail if a hot per-user query falls back to a full table scan."""
+    failures = check_query_plans()
+    if failures:
+        raise click.ClickException(f"Full table scan in: {', '.join(sorted(failures))}")
+    click.echo('All hot queries use an index')
+
+
+@click.command('backfill-timer-totals')
+@with_appcontext
+def backfill_timer_totals_command():
+    """Recompute access_codes timer totals from user_case_logs / radgame_report_logs."""
+    click.echo(f'Backfilled timer totals for {backfill_timer_totals()} access codes')
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Apply database migrations and seed the default admin."""
+    init_db()
+    click.echo('Database schema is up to date')
+
+RUN_ID = str(uuid.uuid4())
+
 
-def _normalize_boxes_list(boxes):
-    norm = []
-    for b in (boxes or []):
-        try:
-            nb = [float(b[0]), float(b[1]), float(b[2]), float(b[3])]
-            if all(isfinite(v) for v in nb):
-                norm.append([_clip01(v) for v in nb])
-        except Exception:
-            continue
-    return norm
 _ALLOWED_LABELS = set(v for v in group_mapping.values() if v != 'OMIT')
 MERGE_SYNONYMS = {
     'Infiltration': 'Consolidation',
@@ -180,76 +300,49 @@ MERGE_SYNONYMS = {
 if 'Consolidation' in _ALLOWED_LABELS or 'Atelectasis/Fibrotic band' in _ALLOWED_LABELS:
     _ALLOWED_LABELS.update(MERGE_SYNONYMS.keys())
 
-localize_cases_map = {}
-localize_explanations_map = {}
-for item in _localize_list:
-    img = item.get('ImageID')
-    if not img:
-        continue
-    by_label = {}
-    by_label_expl = {}
-    for fnd in (item.get('findings') or []):
-        norm_boxes = _normalize_boxes_list(fnd.get('boxes'))
-        labels = list(filter(None, (fnd.get('labels') or [])))
-        if not labels:
-            continue
-        for lbl in labels:
-            if lbl in MERGE_SYNONYMS:
-                lbl = MERGE_SYNONYMS[lbl]
-            if lbl not in _ALLOWED_LABELS and lbl not in MERGE_SYNONYMS.values():
-                continue
-            if norm_boxes:
-                by_label.setdefault(lbl, []).extend(norm_boxes)
-            else:
-                by_label.setdefault(lbl, [])
-            expl = fnd.get('medgemma_explanation') or None
-            if expl:
-                by_label_expl.setdefault(lbl, []).append(expl.strip())
-    localize_cases_map[img] = by_label
-    if by_label_expl:
-        localize_explanations_map[img] = by_label_expl
-
-_loc_seen = set()
-LOCALIZE_ORDER = []
-for item in _localize_list:
-    cid = item.get('ImageID')
-    if not cid or cid in _loc_seen:
-        continue
-    if cid in localize_cases_map:
-        LOCALIZE_ORDER.append(cid)
-        _loc_seen.add(cid)
-
-class_descs = {}
-
-with open(REPORT_METADATA_JSON) as f:
-    rexgradient_reports = json.load(f)
-    if isinstance(rexgradient_reports, list):
-        rexgradient_reports = {str(i): item for i, item in enumerate(rexgradient_reports)}
-    print(f"Loaded {len(rexgradient_reports)} rexgradient reports")
+# compiled localize/report cases from the prebuilt index (python case_index.py), loaded on
+# first access; rebuilt from the JSON sources if the index is missing or stale
+class _LazyCaseIndex:
+    def __init__(self):
+        self._index = None
+
+    def _load(self):
+        if self._index is None:
+            with _lazy_lock:
+                if self._index is None:
+                    index = load_case_index(LOCALIZE_JSON, REPORT_METADATA_JSON, _ALLOWED_LABELS, MERGE_SYNONYMS,
+                                            CASE_INDEX_PATH)
+                    print(f"Loaded {len(index['rexgradient_reports'])} rexgradient reports")
+                    index['localize_gt_arrays'], index['localize_payloads'] = prebuild_localize_cases(
+                        index['localize_cases_map'], LOCALIZABLE_LABELS_SET, NON_LOCALIZABLE_SET, NONLOCAL_IN_ALL
+                    )
+                    self._index = index
+        return self._index
+
+    def __getattr__(self, name):
+        try:
+            return self._load()[name]
+        except KeyError:
+            raise AttributeError(name)
 
-# filter reports with short comparison fields
-def _is_valid_report_case(case_data):
-    if not isinstance(case_data, dict):
-        return False
-    comparison = case_data.get('Comparison', '')
-    return (not comparison) or len(str(comparison)) < 50
+cases = _LazyCaseIndex()
 
-REPORT_ORDER = [cid for cid, cdata in rexgradient_reports.items() if _is_valid_report_case(cdata)]
+class_descs = {}
 
 # fetch case by index from ordered lists
 def _get_ordered_localize_case(index: int):
-    if not LOCALIZE_ORDER:
+    if not cases.localize_order:
         return None
-    if index < 0 or index >= len(LOCALIZE_ORDER):
+    if index < 0 or index >= len(cases.localize_order):
         return None
-    return LOCALIZE_ORDER[index]
+    return cases.localize_order[index]
 
 def _get_ordered_report_case(index: int):
-    if not REPORT_ORDER:
+    if not cases.report_order:
         return None
-    if index < 0 or index >= len(REPORT_ORDER):
+    if index < 0 or index >= len(cases.report_order):
         return None
-    return REPORT_ORDER[index]
+    return cases.report_order[index]
 
 
 ALL_LABELS = sorted(set(group_mapping.values()) - {'OMIT'})
@@ -270,102 +363,163 @@ NON_LOCALIZABLE_LABELS = [lbl for lbl in ALL_LABELS if lbl in NON_LOCALIZABLE_SE
 LOCALIZABLE_LABELS_SET = set(LOCALIZABLE_LABELS)
 NONLOCAL_IN_ALL = ALL_LABELS_SET & NON_LOCALIZABLE_SET
 
+# prebuilt ground-truth payload for a localize image; read-only, shared between requests
+def _localize_case_payload(image_path):
+    payload = cases.localize_payloads.get(image_path)
+    if payload is None:
+        payload = localize_payload({}, NON_LOCALIZABLE_SET, NONLOCAL_IN_ALL)
+    return payload
+
 LOCALIZE_IMAGE_BASE_ABS = os.path.abspath(LOCALIZE_IMAGE_BASE)
 
-@app.route('/images/<path:filename>')
+@bp.route('/images/<path:filename>')
 def serve_image(filename):
     return send_from_directory(LOCALIZE_IMAGE_BASE_ABS, filename)
 
 
-def generate_access_code(expiration_days=None, localize_mode=None, report_mode=None):
-    while True:
-        code = shortuuid.ShortUUID().random(length=6).upper()
-        if not AccessCode.query.filter_by(code=code).first():
-            break
+ACCESS_CODE_LENGTH = 6
+MAX_CODES_PER_REQUEST = 1000
+
+
+def _code_modes(localize_mode=None, report_mode=None):
     if localize_mode not in ('active','passive'):
         localize_mode = 'active'
     if report_mode not in ('active','passive'):
         report_mode = 'active'
     report_version = 'guided' if report_mode == 'passive' else 'practice'
-    
-    access_code = AccessCode(
-        code=code,
-        report_version=report_version,
-        localize_mode=localize_mode,
-        report_mode=report_mode
-    )
-    db.session.add(access_code)
-    db.session.commit()
-    return code
+    return {'localize_mode': localize_mode, 'report_mode': report_mode, 'report_version': report_version}
+
+
+def _code_mode_plan(count, localize_mode=None, report_mode=None, mix=None):
+    if mix is None:
+        mix = [{'count': count, 'localize_mode': localize_mode, 'report_mode': report_mode}]
+    plan = []
+    for group in mix:
+        plan.extend([_code_modes(group.get('localize_mode'), group.get('report_mode'))] * int(group.get('count', 0)))
+    return plan
+
+
+def generate_access_code(expiration_days=None, localize_mode=None, report_mode=None):
+    return bulk_generate_codes(1, expiration_days, localize_mode=localize_mode, report_mode=report_mode)[0]
+
+# a cohort's codes are drawn in memory, checked against the table with one IN query per round
+# (a second round only happens on a collision) and inserted with a single commit.
+# mix: optional list of {'count', 'localize_mode', 'report_mode'} groups that replaces count.
+def bulk_generate_codes(count, expiration_days=None, localize_mode=None, report_mode=None, mix=None):
+    plan = _code_mode_plan(count, localize_mode, report_mode, mix)
+    if not plan:
+        return []
 
-def bulk_generate_codes(count, expiration_days=None, localize_mode=None, report_mode=None):
+    generator = shortuuid.ShortUUID()
     codes = []
-    for _ in range(count):
-        code = generate_access_code(expiration_days, localize_mode=localize_mode, report_mode=report_mode)
-        codes.append(code)
+    seen = set()
+    while len(codes) < len(plan):
+        candidates = set()
+        while len(candidates) < len(plan) - len(codes):
+            candidate = generator.random(length=ACCESS_CODE_LENGTH).upper()
+            if candidate not in seen:
+                candidates.add(candidate)
+        seen |= candidates
+        taken = {row.code for row in db.session.query(AccessCode.code).filter(AccessCode.code.in_(candidates))}
+        codes.extend(sorted(candidates - taken))
+
+    db.session.bulk_insert_mappings(AccessCode, [dict(modes, code=code) for code, modes in zip(codes, plan)])
+    db.session.commit()
     return codes
-def get_analytics_csv():
-    codes = AccessCode.query.all()
-    data = []
-    for code in codes:
-        activities = ActivityLog.query.filter_by(
-            access_code_id=code.code,
-            activity_type='case_completion'
-        ).all()
-        
-        case_activities = len(activities)
-        correct_cases = sum(1 for act in activities if act.is_correct)
-        
-        iou_scores = [act.get_metadata().get('iou_score', 0) for act in activities]
-        avg_iou = sum(iou_scores) / len(iou_scores) if iou_scores else 0
-        
-        total_user_boxes = 0
-        total_correct_boxes = 0
-        total_images_processed = 0
-        total_session_time_ms = 0
-        
-        for activity in activities:
-            metadata = activity.get_metadata()
-            boxes = metadata.get('bounding_boxes', {})
-            user_boxes = boxes.get('user_submission', [])
-            gt_boxes = boxes.get('ground_truth', [])
-            total_user_boxes += len(user_boxes)
-            total_images_processed += metadata.get('images_processed', 0)
-            total_session_time_ms += metadata.get('session_time_ms', 0)
-            
-            if user_boxes and gt_boxes:
-                for user_box in user_boxes:
-                    for gt_box in gt_boxes:
-                        if user_box['label'] == gt_box['label']:
-                            coords1 = user_box['coordinates']
-                            coords2 = gt_box['coordinates']
-                            x1 = max(coords1[0], coords2[0])
-                            y1 = max(coords1[1], coords2[1])
-                            x2 = min(coords1[2], coords2[2])
-                            y2 = min(coords1[3], coords2[3])
-                            
-                            if x2 > x1 and y2 > y1:
-                                intersection = (x2 - x1) * (y2 - y1)
-                                area1 = (coords1[2] - coords1[0]) * (coords1[3] - coords1[1])
-                                area2 = (coords2[2] - coords2[0]) * (coords2[3] - coords2[1])
-                                union = area1 + area2 - intersection
-                                iou = intersection / union if union > 0 else 0
-                                
-                                if iou > 0.4:
-                                    total_correct_boxes += 1
-                                    break
-        
+
+ANALYTICS_CSV_COLUMNS = [
+    'code', 'status', 'created_at', 'first_login', 'last_login', 'login_attempts', 'total_cases',
+    'correct_cases', 'accuracy', 'avg_iou_score', 'total_boxes_drawn', 'correct_boxes', 'box_accuracy',
+    'total_images_processed', 'total_session_time', 'avg_session_time_per_case'
+]
+EXPORT_CHUNK_SIZE = 500
+
+# analytics CSV rows for one chunk of access codes
+def _analytics_rows(codes):
+    import numpy as np
+    from scores.localize_score import matched_user_boxes
+    code_ids = [ac.code for ac in codes]
+    case_stats = AccessCode.case_completion_stats(code_ids)
+
+    completed = (ActivityLog.activity_type == 'case_completion', ActivityLog.access_code_id.in_(code_ids))
+    # metadata scalars are summed in SQL from their own columns; no metadata is decoded here
+    per_code = {
+        code_id: {'iou': iou or 0.0, 'images': images or 0, 'session_ms': session_ms or 0}
+        for code_id, iou, images, session_ms in (
+            db.session.query(
+                ActivityLog.access_code_id, func.sum(ActivityLog.iou_score),
+                func.sum(ActivityLog.images_processed), func.sum(ActivityLog.session_time_ms)
+            )
+            .filter(*completed)
+            .group_by(ActivityLog.access_code_id)
+        )
+    }
+
+    # boxes come from bounding_box_logs; metadata boxes only for activities with no logged boxes
+    box_rows = (
+        db.session.query(
+            BoundingBoxLog.activity_log_id, ActivityLog.access_code_id, BoundingBoxLog.label,
+            BoundingBoxLog.is_ground_truth, BoundingBoxLog.x1, BoundingBoxLog.y1, BoundingBoxLog.x2, BoundingBoxLog.y2
+        )
+        .join(ActivityLog, ActivityLog.id == BoundingBoxLog.activity_log_id)
+        .filter(*completed)
+        .all()
+    )
+    unlogged = (
+        db.session.query(ActivityLog.id, ActivityLog.access_code_id, ActivityLog.activity_metadata)
+        .filter(*completed, ~exists().where(BoundingBoxLog.activity_log_id == ActivityLog.id))
+    )
+    for activity_id, code_id, metadata in unlogged:
+        boxes = metadata.get('bounding_boxes') if isinstance(metadata, dict) else None
+        if not isinstance(boxes, dict):
+            continue
+        for is_gt, key in ((True, 'ground_truth'), (False, 'user_submission')):
+            for box in (boxes.get(key) or []):
+                try:
+                    box_rows.append((activity_id, code_id, box['label'], is_gt,
+                                     *[float(v) for v in box['coordinates'][:4]]))
+                except Exception:
+                    continue
+
+    code_index = {ac.code: i for i, ac in enumerate(codes)}
+    key_ids = {}
+    user_keys, user_boxes, user_codes, gt_keys, gt_boxes = [], [], [], [], []
+    for activity_id, code_id, label, is_gt, x1, y1, x2, y2 in box_rows:
+        key = key_ids.setdefault((activity_id, label), len(key_ids))
+        if is_gt:
+            gt_keys.append(key)
+            gt_boxes.append((x1, y1, x2, y2))
+        else:
+            user_keys.append(key)
+            user_boxes.append((x1, y1, x2, y2))
+            user_codes.append(code_index.get(code_id, -1))
+    matched = matched_user_boxes(
+        np.asarray(user_keys, dtype=np.int64), np.asarray(user_boxes, dtype=float).reshape(-1, 4),
+        np.asarray(gt_keys, dtype=np.int64), np.asarray(gt_boxes, dtype=float).reshape(-1, 4)
+    )
+    user_codes = np.asarray(user_codes, dtype=np.int64)
+    known = user_codes >= 0
+    user_box_totals = np.bincount(user_codes[known], minlength=len(codes))
+    correct_box_totals = np.bincount(user_codes[known], weights=matched[known], minlength=len(codes))
+
+    def format_time(ms):
+        if ms == 0:
+            return "00:00:00"
+        hours = int(ms // (1000 * 60 * 60))
+        minutes = int((ms % (1000 * 60 * 60)) // (1000 * 60))
+        seconds = int((ms % (1000 * 60)) // 1000)
+        return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+    for i, code in enumerate(codes):
+        case_activities, correct_cases = case_stats.get(code.code, (0, 0))
+        totals = per_code.get(code.code, {'iou': 0.0, 'images': 0, 'session_ms': 0})
+        avg_iou = totals['iou'] / case_activities if case_activities > 0 else 0
+        total_user_boxes = int(user_box_totals[i])
+        total_correct_boxes = int(correct_box_totals[i])
+        total_session_time_ms = totals['session_ms']
         avg_session_time_per_case = total_session_time_ms / case_activities if case_activities > 0 else 0
-        
-        def format_time(ms):
-            if ms == 0:
-                return "00:00:00"
-            hours = int(ms // (1000 * 60 * 60))
-            minutes = int((ms % (1000 * 60 * 60)) // (1000 * 60))
-            seconds = int((ms % (1000 * 60)) // 1000)
-            return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-        
-        data.append({
+
+        yield {
             'code': code.code,
             'status': code.status,
             'created_at': code.created_at,
@@ -379,89 +533,150 @@ def get_analytics_csv():
             'total_boxes_drawn': total_user_boxes,
             'correct_boxes': total_correct_boxes,
             'box_accuracy': f"{(total_correct_boxes / total_user_boxes * 100):.1f}%" if total_user_boxes > 0 else "N/A",
-            'total_images_processed': total_images_processed,
+            'total_images_processed': totals['images'],
             'total_session_time': format_time(total_session_time_ms),
             'avg_session_time_per_case': format_time(avg_session_time_per_case)
-        })
-    
-    df = pd.DataFrame(data)
-    csv_buffer = io.StringIO()
-    df.to_csv(csv_buffer, index=False)
-    return csv_buffer.getvalue()
+        }
+
+# access codes in fixed-size chunks off a server-side cursor
+def _iter_code_chunks(chunk_size=EXPORT_CHUNK_SIZE):
+    chunk = []
+    for ac in AccessCode.query.yield_per(chunk_size):
+        chunk.append(ac)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# CSV text one chunk of codes at a time, so memory is bounded by the chunk size
+def iter_analytics_csv(chunk_size=EXPORT_CHUNK_SIZE):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=ANALYTICS_CSV_COLUMNS, lineterminator='\n')
+    writer.writeheader()
+    yield buffer.getvalue()
+    for codes in _iter_code_chunks(chunk_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(_analytics_rows(codes))
+        yield buffer.getvalue()
+
+def get_analytics_csv():
+    return ''.join(iter_analytics_csv())
+
+# (activity, metadata) pairs off a server-side cursor; each batch loads its boxes in one query
+# instead of one lazy load per activity, and builds metadata the same way as ActivityLog.get_metadata()
+def _iter_activities_with_metadata(query, batch_size=EXPORT_CHUNK_SIZE):
+    batch = []
+
+    def _flush(batch):
+        boxes_by_activity = {}
+        for box in BoundingBoxLog.query.filter(BoundingBoxLog.activity_log_id.in_([a.id for a in batch])):
+            boxes_by_activity.setdefault(box.activity_log_id, []).append(box)
+        for activity in batch:
+            metadata = activity.metadata_dict()
+            boxes = boxes_by_activity.get(activity.id)
+            if boxes:
+                metadata['bounding_boxes'] = {
+                    'ground_truth': [box.to_dict() for box in boxes if box.is_ground_truth],
+                    'user_submission': [box.to_dict() for box in boxes if not box.is_ground_truth]
+                }
+            yield activity, metadata
+
+    for activity in query.yield_per(batch_size):
+        batch.append(activity)
+        if len(batch) >= batch_size:
+            yield from _flush(batch)
+            batch = []
+    if batch:
+        yield from _flush(batch)
+
+def _detailed_activity_record(activity, metadata):
+    boxes = metadata.get('bounding_boxes', {})
+    return {
+        'case_id': activity.case_id,
+        'timestamp': activity.timestamp.isoformat(),
+        'is_correct': activity.is_correct,
+        'iou_score': metadata.get('iou_score'),
+        'ground_truth_boxes': boxes.get('ground_truth', []),
+        'user_boxes': boxes.get('user_submission', []),
+        'images_processed': metadata.get('images_processed', 0),
+        'session_time_ms': metadata.get('session_time_ms', 0),
+        'session_time_formatted': metadata.get('session_time_formatted', '00:00:00'),
+        'current_correct': metadata.get('current_correct', 0),
+        'current_incorrect': metadata.get('current_incorrect', 0),
+        'total_correct': metadata.get('total_correct', 0),
+        'total_incorrect': metadata.get('total_incorrect', 0),
+        'total_cases': metadata.get('total_cases', 0),
+        'nonlocalizable_selections': metadata.get('nonlocalizable_selections', {}),
+        'image_id': metadata.get('image_id', 'unknown')
+    }
 
 def get_detailed_analytics(code=None):
     query = ActivityLog.query.filter_by(activity_type='case_completion')
     if code:
         query = query.filter_by(access_code_id=code)
-    activities = query.all()
-    detailed_data = []
-    
-    for activity in activities:
-        metadata = activity.get_metadata()
-        boxes = metadata.get('bounding_boxes', {})
-        
-        detailed_data.append({
-            'access_code': activity.access_code_id,
-            'case_id': activity.case_id,
-            'timestamp': activity.timestamp.isoformat(),
-            'is_correct': activity.is_correct,
-            'iou_score': metadata.get('iou_score'),
-            'ground_truth_boxes': boxes.get('ground_truth', []),
-            'user_boxes': boxes.get('user_submission', []),
-            'images_processed': metadata.get('images_processed', 0),
-            'session_time_ms': metadata.get('session_time_ms', 0),
-            'session_time_formatted': metadata.get('session_time_formatted', '00:00:00'),
-            'current_correct': metadata.get('current_correct', 0),
-            'current_incorrect': metadata.get('current_incorrect', 0),
-            'total_correct': metadata.get('total_correct', 0),
-            'total_incorrect': metadata.get('total_incorrect', 0),
-            'total_cases': metadata.get('total_cases', 0),
-            'nonlocalizable_selections': metadata.get('nonlocalizable_selections', {}),
-            'image_id': metadata.get('image_id', 'unknown')
-        })
-    
-    return detailed_data
+    return [
+        dict(access_code=activity.access_code_id, **_detailed_activity_record(activity, metadata))
+        for activity, metadata in _iter_activities_with_metadata(query.order_by(ActivityLog.id))
+    ]
+
+# JSON text for a top-level object; values that are iterators are written as arrays
+# one element at a time, and (key, iterator) pair streams from _JsonObjectStream nest
+def iter_json_object(fields):
+    yield '{'
+    for i, (key, value) in enumerate(fields):
+        yield ('' if i == 0 else ',') + '\n  ' + json.dumps(key) + ': '
+        if isinstance(value, _JsonObjectStream):
+            yield from value.render('  ')
+        elif isinstance(value, (dict, list, str, int, float, bool, type(None))):
+            yield json.dumps(value)
+        else:
+            yield from _iter_json_array(value, '  ')
+    yield '\n}\n'
+
+def _iter_json_array(items, indent):
+    empty = True
+    for item in items:
+        yield ('[' if empty else ',') + '\n' + indent + '  ' + json.dumps(item, default=str)
+        empty = False
+    yield '[]' if empty else '\n' + indent + ']'
+
+class _JsonObjectStream:
+    def __init__(self, pairs):
+        self.pairs = pairs
+
+    def render(self, indent):
+        empty = True
+        for key, items in self.pairs:
+            yield ('{' if empty else ',') + '\n' + indent + '  ' + json.dumps(key) + ': '
+            yield from _iter_json_array(items, indent + '  ')
+            empty = False
+        yield '{}' if empty else '\n' + indent + '}'
+
+def _iter_analytics_by_code():
+    query = ActivityLog.query.filter_by(activity_type='case_completion').order_by(ActivityLog.access_code_id, ActivityLog.id)
+    records = (
+        (activity.access_code_id, _detailed_activity_record(activity, metadata))
+        for activity, metadata in _iter_activities_with_metadata(query)
+    )
+    for code, group in itertools.groupby(records, key=lambda pair: pair[0]):
+        yield code, (record for _, record in group)
+
+def iter_detailed_analytics_json():
+    return iter_json_object([
+        ('export_time', datetime.utcnow().isoformat()),
+        ('analytics_by_code', _JsonObjectStream(_iter_analytics_by_code()))
+    ])
 
 def export_detailed_analytics_json(output_path=None):
-    activities = ActivityLog.query.filter_by(activity_type='case_completion').all()
-    analytics_by_code = {}
-    for activity in activities:
-        code = activity.access_code_id
-        if code not in analytics_by_code:
-            analytics_by_code[code] = []
-            
-        metadata = activity.get_metadata()
-        boxes = metadata.get('bounding_boxes', {})
-        
-        analytics_by_code[code].append({
-            'case_id': activity.case_id,
-            'timestamp': activity.timestamp.isoformat(),
-            'is_correct': activity.is_correct,
-            'iou_score': metadata.get('iou_score'),
-            'ground_truth_boxes': boxes.get('ground_truth', []),
-            'user_boxes': boxes.get('user_submission', []),
-            'images_processed': metadata.get('images_processed', 0),
-            'session_time_ms': metadata.get('session_time_ms', 0),
-            'session_time_formatted': metadata.get('session_time_formatted', '00:00:00'),
-            'current_correct': metadata.get('current_correct', 0),
-            'current_incorrect': metadata.get('current_incorrect', 0),
-            'total_correct': metadata.get('total_correct', 0),
-            'total_incorrect': metadata.get('total_incorrect', 0),
-            'total_cases': metadata.get('total_cases', 0),
-            'nonlocalizable_selections': metadata.get('nonlocalizable_selections', {}),
-            'image_id': metadata.get('image_id', 'unknown')
-        })
-    
-    export_data = {
-        'export_time': datetime.utcnow().isoformat(),
-        'analytics_by_code': analytics_by_code
-    }
-    
     if output_path:
         with open(output_path, 'w') as f:
-            json.dump(export_data, f, indent=2)
-    
-    return export_data
+            for fragment in iter_detailed_analytics_json():
+                f.write(fragment)
+        with open(output_path) as f:
+            return json.load(f)
+    return json.loads(''.join(iter_detailed_analytics_json()))
 
 
 def ensure_access_code():
@@ -483,112 +698,50 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     session.clear()
-    return redirect(url_for('main_menu'))
+    return redirect(url_for('.main_menu'))
 
-@app.route('/selection')
+@bp.route('/selection')
 @login_required
 def selection():
-    return redirect(url_for('main_menu'))
+    return redirect(url_for('.main_menu'))
 
-@app.route('/main-menu')
+@bp.route('/main-menu')
 @login_required
 def main_menu():
     return render_template('main_menu.html')
 
-# compute IoU between two boxes
-def _iou(box1, box2):
-    x1 = max(box1[0], box2[0])
-    y1 = max(box1[1], box2[1])
-    x2 = min(box1[2], box2[2])
-    y2 = min(box1[3], box2[3])
-    if x2 <= x1 or y2 <= y1:
-        return 0.0
-    inter = (x2 - x1) * (y2 - y1)
-    a1 = max(box1[2] - box1[0], 0) * max(box1[3] - box1[1], 0)
-    a2 = max(box2[2] - box2[0], 0) * max(box2[3] - box2[1], 0)
-    union = a1 + a2 - inter
-    if union <= 0:
-        return 0.0
-    return inter / union
-
-# score a localization case against ground truth
-def _compute_case_scores(image_id, selections, iou_thresh=0.3):
-    label_box_map = localize_cases_map.get(image_id, {})
-    gt_label_set = set(label_box_map.keys())
-    gt_boxes = {lbl: [list(b) for b in (boxes or [])] for lbl, boxes in label_box_map.items() if lbl in LOCALIZABLE_LABELS_SET}
-    user_boxes = selections.get('user_boxes', []) or []
-
-    correct = 0
-    incorrect = 0
-    enriched_boxes = []
-    grouped_indices = {}
-    for ub in user_boxes:
-        lbl = ub.get('label')
-        coords = ub.get('coordinates') or []
-        if not lbl or not isinstance(coords, (list, tuple)) or len(coords) != 4:
-            enriched_boxes.append({'label': lbl, 'coordinates': coords, 'iou': 0.0})
-            continue
-        try:
-            c = [float(coords[0]), float(coords[1]), float(coords[2]), float(coords[3])]
-        except Exception:
-            c = None
-        if not c:
-            enriched_boxes.append({'label': lbl, 'coordinates': coords, 'iou': 0.0})
-            continue
-        idx = len(enriched_boxes)
-        enriched_boxes.append({'label': lbl, 'coordinates': c, 'iou': 0.0})
-        grouped_indices.setdefault(lbl, []).append(idx)
-
-    for lbl, gts in gt_boxes.items():
-        user_idxs = grouped_indices.get(lbl, [])
-        used = [False] * len(user_idxs)
-        for g in gts:
-            best_iou = 0.0
-            best_local_idx = -1
-            for local_i, box_global_index in enumerate(user_idxs):
-                if used[local_i]:
-                    continue
-                u = enriched_boxes[box_global_index]['coordinates']
-                iou = _iou(g, u)
-                if iou > best_iou:
-                    best_iou = iou
-                    best_local_idx = local_i
-            if best_local_idx >= 0 and best_iou >= iou_thresh:
-                used[best_local_idx] = True
-                enriched_boxes[user_idxs[best_local_idx]]['iou'] = float(best_iou)
+# score localization cases against ground truth, all boxes in one IoU pass; items are
+# (image_id, selections) and the result is (correct, incorrect, enriched_boxes) per item
+def _compute_case_scores_batch(items, iou_thresh=LOCALIZE_IOU_THRESHOLD, matcher=LOCALIZE_MATCHER):
+    from scores.localize_score import score_cases
+    # GT boxes come from the per-label arrays prebuilt when the case index is loaded
+    gt_arrays = cases.localize_gt_arrays
+    box_items = [(gt_arrays.get(image_id, {}), selections.get('user_boxes', []) or []) for image_id, selections in items]
+
+    results = []
+    for (image_id, selections), (correct, incorrect, enriched_boxes) in zip(items, score_cases(box_items, iou_thresh, matcher)):
+        label_box_map = cases.localize_cases_map.get(image_id, {})
+        nonlocal_map = selections.get('nonlocalizable', {}) or {}
+        for lbl in NONLOCAL_IN_ALL:
+            chosen = bool(nonlocal_map.get(lbl))
+            present = lbl in label_box_map
+            if present and chosen:
                 correct += 1
-            else:
+            elif present and not chosen:
                 incorrect += 1
-        for local_i, box_global_index in enumerate(user_idxs):
-            if not used[local_i]:
-                u = enriched_boxes[box_global_index]['coordinates']
-                best_any = 0.0
-                for g in gts:
-                    best_any = max(best_any, _iou(g, u))
-                enriched_boxes[box_global_index]['iou'] = float(best_any)
+            elif not present and chosen:
                 incorrect += 1
+        results.append((int(correct), int(incorrect), enriched_boxes))
+    return results
 
-    for lbl, idxs in grouped_indices.items():
-        if lbl not in gt_boxes:
-            incorrect += len(idxs)
-
-    nonlocal_map = selections.get('nonlocalizable', {}) or {}
-    for lbl in NONLOCAL_IN_ALL:
-        chosen = bool(nonlocal_map.get(lbl))
-        present = lbl in gt_label_set
-        if present and chosen:
-            correct += 1
-        elif present and not chosen:
-            incorrect += 1
-        elif not present and chosen:
-            incorrect += 1
-
-    return int(correct), int(incorrect), enriched_boxes
+# score a localization case against ground truth
+def _compute_case_scores(image_id, selections, iou_thresh=LOCALIZE_IOU_THRESHOLD, matcher=LOCALIZE_MATCHER):
+    return _compute_case_scores_batch([(image_id, selections)], iou_thresh, matcher)[0]
 
-@app.route('/api/progress/status')
+@bp.route('/api/progress/status')
 @login_required
 def progress_status():
     access = AccessCode.query.filter_by(code=session['access_code']).first()
@@ -605,40 +758,101 @@ def progress_status():
     })
 
 # snapshot and heartbeat for progress tracking
-@app.route('/api/progress/snapshot', methods=['POST'])
+@bp.route('/api/progress/snapshot', methods=['POST'])
 @login_required
 def progress_snapshot():
     return jsonify({'status': 'ok'})
 
-@app.route('/api/progress/heartbeat', methods=['POST'])
+@bp.route('/api/progress/heartbeat', methods=['POST'])
 @login_required
 def progress_heartbeat():
     return jsonify({'status': 'ok'})
+# cumulative localize time: running total on access_codes, or one SQL SUM if it was never populated
+def _localize_time_total(access, access_code_id):
+    if access is not None and access.localize_time_ms is not None:
+        return int(access.localize_time_ms)
+    total = db.session.query(func.coalesce(func.sum(UserCaseLog.time_spent_ms), 0)).filter(
+        UserCaseLog.access_code_id == access_code_id
+    ).scalar()
+    return int(total or 0)
+
+# last report timer checkpoint: running max on access_codes, or one SQL MAX if it was never populated
+def _report_checkpoint_total(access, access_code_id):
+    if access is not None and access.report_timer_checkpoint_ms is not None:
+        return int(access.report_timer_checkpoint_ms)
+    latest = db.session.query(func.coalesce(func.max(RadgameReportLog.timer_checkpoint_ms), 0)).filter(
+        RadgameReportLog.access_code_id == access_code_id
+    ).scalar()
+    return int(latest or 0)
+
+# add one localize case and its time to the running totals with a single UPDATE, so concurrent
+# submissions can't overwrite each other's increments. the UPDATE holds the row until commit, so
+# the values read back belong to this submission. returns (localize_time_ms, localize_cases_completed)
+def _add_localize_case(access_code_id, time_spent_ms):
+    logged_total = select(func.coalesce(func.sum(UserCaseLog.time_spent_ms), 0)).where(
+        UserCaseLog.access_code_id == access_code_id
+    ).scalar_subquery()
+    AccessCode.query.filter_by(code=access_code_id).update({
+        AccessCode.localize_time_ms: func.coalesce(AccessCode.localize_time_ms, logged_total) + int(time_spent_ms or 0),
+        AccessCode.localize_cases_completed: func.coalesce(AccessCode.localize_cases_completed, 0) + 1
+    }, synchronize_session=False)
+    time_total, completed = db.session.query(AccessCode.localize_time_ms, AccessCode.localize_cases_completed).filter_by(
+        code=access_code_id
+    ).one()
+    return int(time_total), int(completed)
+
+# same for the report timer checkpoint; returns (report_timer_checkpoint_ms, report_cases_completed).
+# the completed counter is capped, so callers update it themselves while the row is held
+def _add_report_time(access_code_id, time_spent_ms):
+    logged_latest = select(func.coalesce(func.max(RadgameReportLog.timer_checkpoint_ms), 0)).where(
+        RadgameReportLog.access_code_id == access_code_id
+    ).scalar_subquery()
+    AccessCode.query.filter_by(code=access_code_id).update({
+        AccessCode.report_timer_checkpoint_ms: func.coalesce(AccessCode.report_timer_checkpoint_ms, logged_latest) + int(time_spent_ms or 0)
+    }, synchronize_session=False)
+    checkpoint, completed = db.session.query(AccessCode.report_timer_checkpoint_ms, AccessCode.report_cases_completed).filter_by(
+        code=access_code_id
+    ).one()
+    return int(checkpoint), int(completed or 0)
+
+# guided report pages send an absolute checkpoint: keep the larger of it and the stored one, and
+# count the case when the page advances; one UPDATE like the helpers above.
+# returns (report_timer_checkpoint_ms, report_cases_completed)
+def _log_guided_report_time(access_code_id, timer_checkpoint_ms, advance):
+    logged_latest = select(func.coalesce(func.max(RadgameReportLog.timer_checkpoint_ms), 0)).where(
+        RadgameReportLog.access_code_id == access_code_id
+    ).scalar_subquery()
+    stored = func.coalesce(AccessCode.report_timer_checkpoint_ms, logged_latest)
+    # CASE rather than GREATEST/MAX(a, b), which SQLite and PostgreSQL spell differently
+    values = {AccessCode.report_timer_checkpoint_ms: case((stored < timer_checkpoint_ms, timer_checkpoint_ms), else_=stored)}
+    if advance:
+        values[AccessCode.report_cases_completed] = func.coalesce(AccessCode.report_cases_completed, 0) + 1
+    AccessCode.query.filter_by(code=access_code_id).update(values, synchronize_session=False)
+    checkpoint, completed = db.session.query(AccessCode.report_timer_checkpoint_ms, AccessCode.report_cases_completed).filter_by(
+        code=access_code_id
+    ).one()
+    return int(checkpoint), int(completed or 0)
+
 # aggregate user progress stats
-@app.route('/api/progress/summary')
+@bp.route('/api/progress/summary')
 @login_required
 def progress_summary():
     access = AccessCode.query.filter_by(code=session['access_code']).first()
     if not access:
         return jsonify({'error': 'not found'}), 404
-    rows = (
-        UserCaseLog.query
-        .filter_by(access_code_id=access.code)
-        .order_by(UserCaseLog.timestamp.asc())
-        .all()
+    # one aggregate query instead of loading every case row
+    cases_total, correct_conditions, incorrect_conditions, total_time_ms, last_timer_checkpoint_ms = (
+        db.session.query(
+            func.count(UserCaseLog.id),
+            func.coalesce(func.sum(UserCaseLog.correct_count), 0),
+            func.coalesce(func.sum(UserCaseLog.incorrect_count), 0),
+            func.coalesce(func.sum(UserCaseLog.time_spent_ms), 0),
+            func.coalesce(func.max(UserCaseLog.timer_checkpoint_ms), 0)
+        )
+        .filter(UserCaseLog.access_code_id == access.code)
+        .one()
     )
 
-    cases_total = len(rows)
-    correct_conditions = sum(int(r.correct_count or 0) for r in rows)
-    incorrect_conditions = sum(int(r.incorrect_count or 0) for r in rows)
-    total_time_ms = sum(int(r.time_spent_ms or 0) for r in rows)
-    last_timer_checkpoint_ms = 0
-    if rows:
-        try:
-            last_timer_checkpoint_ms = max(int(r.timer_checkpoint_ms or 0) for r in rows)
-        except Exception:
-            last_timer_checkpoint_ms = 0
-
     def _fmt(ms: int) -> str:
         if not ms:
             return "00:00:00"
@@ -657,27 +871,24 @@ def progress_summary():
     'last_timer_checkpoint_ms': int(last_timer_checkpoint_ms)
     })
 
-@app.route('/api/report/summary')
+@bp.route('/api/report/summary')
 @login_required
 def report_summary():
     access = AccessCode.query.filter_by(code=session.get('access_code')).first()
     if not access:
         return jsonify({'error': 'not found'}), 404
-    from sqlalchemy import func
-    rows = RadgameReportLog.query.filter_by(access_code_id=access.code).order_by(RadgameReportLog.timestamp.asc()).all()
-    report_count = len(rows)
-    avg_green = db.session.query(func.avg(RadgameReportLog.green_score)).filter(
-        RadgameReportLog.access_code_id == access.code,
-        RadgameReportLog.green_score.isnot(None)
-    ).scalar()
+    # avg() skips NULL scores, matching the old green_score IS NOT NULL filter
+    report_count, avg_green, total_time_ms, last_timer_checkpoint_ms = (
+        db.session.query(
+            func.count(RadgameReportLog.id),
+            func.avg(RadgameReportLog.green_score),
+            func.coalesce(func.sum(RadgameReportLog.time_spent_ms), 0),
+            func.coalesce(func.max(RadgameReportLog.timer_checkpoint_ms), 0)
+        )
+        .filter(RadgameReportLog.access_code_id == access.code)
+        .one()
+    )
     avg_green = float(avg_green) if avg_green is not None else None
-    total_time_ms = sum(int(r.time_spent_ms or 0) for r in rows)
-    last_timer_checkpoint_ms = 0
-    if rows:
-        try:
-            last_timer_checkpoint_ms = max(int(r.timer_checkpoint_ms or 0) for r in rows)
-        except Exception:
-            last_timer_checkpoint_ms = 0
     def _fmt(ms: int) -> str:
         if not ms:
             return "00:00:00"
@@ -692,45 +903,41 @@ def report_summary():
         'total_time_formatted': _fmt(int(total_time_ms)),
         'last_timer_checkpoint_ms': int(last_timer_checkpoint_ms)
     })
-@app.route('/')
+@bp.route('/')
 def index():
-    return redirect(url_for('main_menu'))
+    return redirect(url_for('.main_menu'))
 
-@app.route('/localize')
+@bp.route('/localize')
 @login_required
 def localize_practice():
     access = AccessCode.query.filter_by(code=session.get('access_code')).first()
     completed = int(access.localize_cases_completed) if access else 0
     chosen_case = _get_ordered_localize_case(completed)
     if chosen_case is None:
-        chosen_case = LOCALIZE_ORDER[-1]
+        chosen_case = cases.localize_order[-1]
     image_path = chosen_case
     try:
         print(f"[DeterministicLocalize] access={access.code if access else 'NA'} completed={completed} selected={chosen_case}")
     except Exception:
         pass
 
-    label_box_map = localize_cases_map.get(image_path, {})
-    explanation_map = localize_explanations_map.get(image_path, {})
-    actual = {lbl: ([] if lbl in NON_LOCALIZABLE_SET else list(boxes)) for lbl, boxes in label_box_map.items()}
-    detailed_map = {lbl: '' for lbl in label_box_map}
-    detailed_names = {lbl: lbl for lbl in label_box_map}
-    nonlocalizable_presence = {lbl: (lbl in label_box_map) for lbl in NONLOCAL_IN_ALL}
+    payload = _localize_case_payload(image_path)
+    explanation_map = cases.localize_explanations_map.get(image_path, {})
 
     if access and getattr(access, 'localize_mode', None) == 'passive':
-        return redirect(url_for('localize_guided'))
+        return redirect(url_for('.localize_guided'))
     return render_template(
         'index.html',
         image_path=image_path,
         image_name=os.path.basename(image_path),
         case_index=(completed + 1),
-        total_cases=len(LOCALIZE_ORDER) if LOCALIZE_ORDER else 0,
+        total_cases=len(cases.localize_order) if cases.localize_order else 0,
         localizable_labels=LOCALIZABLE_LABELS,
         non_localizable_labels=NON_LOCALIZABLE_LABELS,
-        actual=actual,
-        nonlocalizable_presence=nonlocalizable_presence,
-        detailed_classes=detailed_map,
-        detailed_names=detailed_names,
+        actual=payload['actual'],
+        nonlocalizable_presence=payload['nonlocalizable_presence'],
+        detailed_classes=payload['detailed_classes'],
+        detailed_names=payload['detailed_names'],
     medgemma_explanations=explanation_map,
         run_id=RUN_ID,
         access_code=session.get('access_code'),
@@ -738,55 +945,51 @@ def localize_practice():
         localize_required=LOCALIZE_POST_REQUIRED
     )
 
-@app.route('/localize-guided')
+@bp.route('/localize-guided')
 @login_required
 def localize_guided():
     access = AccessCode.query.filter_by(code=session.get('access_code')).first()
     current_index = int(access.localize_cases_completed) if access else 0
     current_case_candidate = _get_ordered_localize_case(current_index)
     if current_case_candidate is None:
-        current_case_candidate = LOCALIZE_ORDER[-1] if LOCALIZE_ORDER else ''
+        current_case_candidate = cases.localize_order[-1] if cases.localize_order else ''
     image_path = current_case_candidate
     session['passive_localize_current_case'] = image_path
     session['passive_localize_last_ts'] = time.time()
-    label_box_map = localize_cases_map.get(image_path, {})
-    actual = {lbl: ([] if lbl in NON_LOCALIZABLE_SET else list(boxes)) for lbl, boxes in label_box_map.items()}
-    detailed_map = {lbl: '' for lbl in label_box_map}
-    detailed_names = {lbl: lbl for lbl in label_box_map}
-    nonlocalizable_presence = {lbl: (lbl in label_box_map) for lbl in NONLOCAL_IN_ALL}
+    payload = _localize_case_payload(image_path)
     return render_template(
         'localize_guided.html',
         image_path=image_path,
         image_name=os.path.basename(image_path) if image_path else '',
         localizable_labels=LOCALIZABLE_LABELS,
         non_localizable_labels=NON_LOCALIZABLE_LABELS,
-        actual=actual,
-        nonlocalizable_presence=nonlocalizable_presence,
-        detailed_classes=detailed_map,
-        detailed_names=detailed_names,
+        actual=payload['actual'],
+        nonlocalizable_presence=payload['nonlocalizable_presence'],
+        detailed_classes=payload['detailed_classes'],
+        detailed_names=payload['detailed_names'],
         run_id=RUN_ID,
         access_code=session.get('access_code'),
         show_image_name=SHOW_IMAGE_NAME
     )
 
 # get next case for guided localization mode
-@app.route('/api/localize/guided/next')
+@bp.route('/api/localize/guided/next')
 @login_required
 def api_localize_guided_next():
-    if not LOCALIZE_ORDER:
+    if not cases.localize_order:
         return jsonify({'error': 'no_cases'}), 404
     access = AccessCode.query.filter_by(code=session.get('access_code')).first()
     current_case = session.get('passive_localize_current_case')
     if not access:
-        if not current_case or current_case not in localize_cases_map:
+        if not current_case or current_case not in cases.localize_cases_map:
             current_case = _get_ordered_localize_case(0)
             session['passive_localize_current_case'] = current_case
         session.setdefault('passive_localize_last_ts', time.time())
     else:
         expected_index = int(access.localize_cases_completed or 0)
         expected_case = _get_ordered_localize_case(expected_index)
-        if expected_case is None and LOCALIZE_ORDER:
-            expected_case = LOCALIZE_ORDER[-1]
+        if expected_case is None and cases.localize_order:
+            expected_case = cases.localize_order[-1]
         if expected_case:
             current_case = expected_case
             session['passive_localize_current_case'] = current_case
@@ -806,18 +1009,7 @@ def api_localize_guided_next():
             else:
                 delta_ms = 0
 
-            prev_rows = (
-                UserCaseLog.query
-                .filter_by(access_code_id=access.code)
-                .order_by(UserCaseLog.timestamp.asc())
-                .all()
-            )
-            prev_total_time = sum(int(r.time_spent_ms or 0) for r in prev_rows)
-            timer_checkpoint_ms = int(prev_total_time + delta_ms)
-
-            current_val = int(access.localize_cases_completed or 0)
-            new_total = current_val + 1
-            access.localize_cases_completed = new_total
+            timer_checkpoint_ms, new_total = _add_localize_case(access.code, delta_ms)
 
             log_row = UserCaseLog(
                 access_code_id=access.code,
@@ -841,8 +1033,8 @@ def api_localize_guided_next():
     try:
         if access:
             next_case = _get_ordered_localize_case(int(access.localize_cases_completed))
-            if next_case is None and LOCALIZE_ORDER:
-                next_case = LOCALIZE_ORDER[-1]
+            if next_case is None and cases.localize_order:
+                next_case = cases.localize_order[-1]
         else:
             next_case = current_case
     except Exception:
@@ -850,26 +1042,22 @@ def api_localize_guided_next():
     session['passive_localize_current_case'] = next_case
     session['passive_localize_last_ts'] = time.time()
 
-    label_box_map = localize_cases_map.get(next_case, {})
-    actual = {lbl: ([] if lbl in NON_LOCALIZABLE_SET else list(boxes)) for lbl, boxes in label_box_map.items()}
-    detailed_map = {lbl: '' for lbl in label_box_map}
-    detailed_names = {lbl: lbl for lbl in label_box_map}
-    nonlocalizable_presence = {lbl: (lbl in label_box_map) for lbl in NONLOCAL_IN_ALL}
+    payload = _localize_case_payload(next_case)
 
     return jsonify({
         'image_path': next_case,
         'image_name': os.path.basename(next_case),
         'localizable_labels': LOCALIZABLE_LABELS,
         'non_localizable_labels': NON_LOCALIZABLE_LABELS,
-        'actual': actual,
-        'nonlocalizable_presence': nonlocalizable_presence,
-        'detailed_classes': detailed_map,
-        'detailed_names': detailed_names,
+        'actual': payload['actual'],
+        'nonlocalizable_presence': payload['nonlocalizable_presence'],
+        'detailed_classes': payload['detailed_classes'],
+        'detailed_names': payload['detailed_names'],
         'timer_checkpoint_ms': timer_checkpoint_ms,
         'localize_cases_completed': new_total
     })
 
-@app.route('/report')
+@bp.route('/report')
 @login_required
 def report():
     access_code = AccessCode.query.filter_by(code=session['access_code']).first()
@@ -881,13 +1069,13 @@ def report():
             return render_template('report_guided.html', run_id=RUN_ID, access_code=access_code.code)
     return render_template('report.html', run_id=RUN_ID, access_code=access_code.code if access_code else None)
 
-@app.route('/report-guided')
+@bp.route('/report-guided')
 @login_required
 def report_guided():
     access_code = AccessCode.query.filter_by(code=session['access_code']).first()
     return render_template('report_guided.html', run_id=RUN_ID, access_code=access_code.code if access_code else None)
 
-@app.route('/api/user/version')
+@bp.route('/api/user/version')
 @login_required
 def get_user_version():
     access_code = AccessCode.query.filter_by(code=session['access_code']).first()
@@ -898,7 +1086,7 @@ def get_user_version():
         return jsonify({'report_version': explicit or derived_version})
     return jsonify({'report_version': 'practice'})
 
-@app.route('/api/user/info')
+@bp.route('/api/user/info')
 @login_required
 def get_user_info():
     access = AccessCode.query.filter_by(code=session.get('access_code')).first()
@@ -911,7 +1099,7 @@ def get_user_info():
         'report_mode': rmode
     })
 # fetch report case with images and metadata
-@app.route('/api/report/case')
+@bp.route('/api/report/case')
 @login_required
 def get_report_case():
     access = AccessCode.query.filter_by(code=session.get('access_code')).first()
@@ -926,7 +1114,7 @@ def get_report_case():
     case_index = completed
     case_id = None
     if requested_case_id:
-        if requested_case_id in rexgradient_reports:
+        if requested_case_id in cases.rexgradient_reports:
             case_id = requested_case_id
         else:
             return jsonify({'error': 'Case not found'}), 404
@@ -934,7 +1122,7 @@ def get_report_case():
         case_id = _get_ordered_report_case(case_index)
     if not case_id:
         return jsonify({'error': 'No valid cases available'}), 404
-    case = rexgradient_reports.get(case_id, {})
+    case = cases.rexgradient_reports.get(case_id, {})
     
     image_paths = []
     for img_path in case.get('ImagePath', []):
@@ -962,7 +1150,7 @@ def get_report_case():
             next_case_id = _get_ordered_report_case(completed)
             if auto_skip_completed and next_case_id and case_id != next_case_id:
                 case_id = next_case_id
-                case = rexgradient_reports.get(case_id, {})
+                case = cases.rexgradient_reports.get(case_id, {})
                 image_paths = []
                 for img_path in case.get('ImagePath', []):
                     filename = os.path.basename(img_path)
@@ -987,7 +1175,7 @@ def get_report_case():
         'next_case_id': next_case_id
     })
 
-@app.route('/api/report/guided/log', methods=['POST'])
+@bp.route('/api/report/guided/log', methods=['POST'])
 @login_required
 def guided_report_log():
     access = AccessCode.query.filter_by(code=session.get('access_code')).first()
@@ -1002,10 +1190,8 @@ def guided_report_log():
     if not case_id:
         return jsonify({'error': 'missing case_id'}), 400
     try:
-        current_completed = int(access.report_cases_completed or 0)
         advance_after = bool(data.get('advance_after'))
-        if advance_after:
-            access.report_cases_completed = current_completed + 1
+        _, cases_completed = _log_guided_report_time(access.code, timer_checkpoint_ms, advance_after)
         log = RadgameReportLog(
             access_code_id=access.code,
             sample_id=str(case_id),
@@ -1013,33 +1199,278 @@ def guided_report_log():
             green_score=None,
             green_score_std=None,
             green_summary=None,
-            report_cases_completed_snapshot=int(getattr(access, 'report_cases_completed', 0)),
+            report_cases_completed_snapshot=cases_completed,
             time_spent_ms=time_spent_ms,
             timer_checkpoint_ms=timer_checkpoint_ms
         )
         db.session.add(log)
         db.session.commit()
-        return jsonify({'ok': True, 'cases_completed': int(access.report_cases_completed or 0)})
+        return jsonify({'ok': True, 'cases_completed': cases_completed})
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'db', 'detail': str(e)}), 500
-@app.route('/api/debug/ordering')
+@bp.route('/api/debug/ordering')
 @login_required
 def debug_ordering():
     access = AccessCode.query.filter_by(code=session.get('access_code')).first()
     return jsonify({
-        'localize_first5': LOCALIZE_ORDER[:5],
-        'report_first5': REPORT_ORDER[:5],
+        'localize_first5': cases.localize_order[:5],
+        'report_first5': cases.report_order[:5],
         'localize_completed': int(getattr(access, 'localize_cases_completed', 0)) if access else 0,
         'report_completed': int(getattr(access, 'report_cases_completed', 0)) if access else 0
     })
 
-@app.route('/report/image/<path:filename>')
+@bp.route('/report/image/<path:filename>')
 @login_required
 def serve_report_image(filename):
     return send_from_directory(REPORT_IMAGE_BASE, filename)
 
-@app.route('/api/report/submit', methods=['POST'])
+# patient context strings for the CRIMSON prompt
+def _report_patient_context(case_data):
+    raw_age = case_data.get('PatientAge') or case_data.get('patient_age') or case_data.get('Age') or ''
+    age_val = None
+    if isinstance(raw_age, str):
+        try:
+            age_val = int(''.join([c for c in raw_age if c.isdigit()]) or '0') or None
+        except Exception:
+            age_val = None
+    elif isinstance(raw_age, (int, float)):
+        try:
+            age_val = int(raw_age)
+        except Exception:
+            age_val = None
+    indication_val = case_data.get('Indication') or case_data.get('indication') or ''
+    age_str = str(age_val) if age_val is not None else 'Unknown'
+    indication_str = indication_val if indication_val else 'None provided'
+    return age_str, indication_str
+
+def _grade_report_findings(case_id, case_data, findings, llm_client, timeout=None):
+    age_str, indication_str = _report_patient_context(case_data)
+    print(f"Findings: {case_data.get('Findings', '')}")
+    print(case_id)
+    return get_crimson_score(findings, case_data.get('Findings', ''), age_str, indication_str, llm_client,
+                             timeout=timeout, cache=get_grade_cache())
+
+# block further practice submissions if cap reached or post-test already taken
+def _report_submission_blocked(access_row):
+    if not access_row:
+        return None
+    if access_row.took_report_pre and int(access_row.report_cases_completed or 0) >= REPORT_POST_REQUIRED:
+        return 'practice_complete'
+    if access_row.took_report_post:
+        return 'post_test_completed'
+    return None
+
+# create report log entry for a graded submission; returns (log, (error_payload, status) or None)
+def _record_report_grade(access_code_id, case_id, findings, time_spent_ms, grade):
+    try:
+        # Fetch current report cases completed BEFORE increment for snapshot
+        access_row = AccessCode.query.filter_by(code=access_code_id).first()
+        pre_increment_total = int(access_row.report_cases_completed or 0) if access_row else 0
+        blocked = _report_submission_blocked(access_row)
+        if blocked:
+            return None, ({'error': blocked}, 403)
+        # Determine cumulative checkpoint for continuous timer
+        if access_row:
+            new_checkpoint, pre_increment_total = _add_report_time(access_code_id, time_spent_ms)
+        else:
+            new_checkpoint = _report_checkpoint_total(None, access_code_id) + int(time_spent_ms or 0)
+        full_llm_payload = {
+            'explanation': grade['summary'],
+            'errors': grade['errors'],
+            'matched_findings': grade['matched_findings'],
+            'raw_model_json': grade['raw_model_json']
+        }
+        report_log = RadgameReportLog(
+            access_code_id=access_code_id,
+            sample_id=case_id,
+            findings=findings,
+            green_score=float(grade['green_score']),
+            green_score_std=float(grade['green_score_std']),
+            green_summary=full_llm_payload,
+            report_cases_completed_snapshot=pre_increment_total + 1,
+            time_spent_ms=time_spent_ms,
+            timer_checkpoint_ms=new_checkpoint
+        )
+
+        db.session.add(report_log)
+        # Increment practice report counter on access code
+        if access_row and pre_increment_total < REPORT_POST_REQUIRED:
+            access_row.report_cases_completed = pre_increment_total + 1
+        db.session.commit()
+        return report_log, None
+    except Exception as db_error:
+        print(f"Database Error: {db_error}")
+        db.session.rollback()
+        return None, ({'error': f"Database error: {db_error}"}, 500)
+
+# latest graded report log for a (code, case), or None if the case was never graded
+def _graded_report_log(access_code_id, case_id):
+    log = RadgameReportLog.query.filter_by(access_code_id=access_code_id, sample_id=case_id).order_by(RadgameReportLog.timestamp.desc()).first()
+    return log if log and log.green_score is not None else None
+
+# result payload rebuilt from an already graded report log (a duplicate submission)
+def _graded_report_payload(existing_log, case_id):
+    existing_payload = existing_log.green_summary if isinstance(existing_log.green_summary, dict) else {}
+    errors_payload = existing_payload.get('errors') or {}
+    matched_findings_payload = existing_payload.get('matched_findings') or []
+    case_data_cached = cases.rexgradient_reports.get(case_id, {}) if case_id else {}
+    return {
+        'green_score': float(existing_log.green_score),
+        'summary': existing_payload.get('explanation') or existing_payload.get('Explanation') or '',
+        'errors': {
+            'a': list(errors_payload.get('a', []) or []),
+            'b': list(errors_payload.get('b', []) or []),
+            'c': list(errors_payload.get('c', []) or []),
+            'd': list(errors_payload.get('d', []) or []),
+        },
+        'matched_findings': list(matched_findings_payload),
+        'ground_truth': {
+            'findings': case_data_cached.get('Findings', ''),
+            'impressions': case_data_cached.get('Impressions', '')
+        },
+        'timer_checkpoint_ms': existing_log.timer_checkpoint_ms,
+        'duplicate': True
+    }
+
+def _default_style_data(status):
+    return {
+        'style_score': 0,
+        'systematic_evaluation_score': 0,
+        'organization_language_score': 0,
+        'systematic_evaluation_recommendation': '',
+        'organization_language_recommendation': '',
+        'status': status
+    }
+
+def _compute_style_data(findings, llm_client, timeout=None):
+    try:
+        style_response, style_score = calculate_style_score(findings, llm_client, timeout=timeout, cache=get_grade_cache())
+        return {
+            'style_score': style_score,
+            'systematic_evaluation_score': float(style_response.systematic_evaluation_score),
+            'organization_language_score': float(style_response.organization_language_score),
+            'systematic_evaluation_recommendation': style_response.systematic_evaluation_recommendation,
+            'organization_language_recommendation': style_response.organization_language_recommendation,
+            'status': 'ok'
+        }
+    except Exception as style_error:
+        print(f"StyleScore error: {style_error}")
+        # Set default values if StyleScore fails
+        return _default_style_data('error')
+
+# kick off StyleScore in the background; returns (future, finish_style) where finish_style() yields style data.
+# the timeout counts from submission, so time spent grading CRIMSON is not added on top.
+def _start_style_grading(findings, llm_client):
+    started = time.monotonic()
+    style_future = _grading_executor.submit(_compute_style_data, findings, llm_client, STYLE_TIMEOUT_S)
+
+    def finish_style():
+        remaining = max(0.0, STYLE_TIMEOUT_S - (time.monotonic() - started))
+        try:
+            return style_future.result(timeout=remaining)
+        except FutureTimeoutError:
+            # drops the call if it never got a thread; a running one ends at its own SDK timeout
+            style_future.cancel()
+            print(f"StyleScore timed out after {STYLE_TIMEOUT_S}s")
+            return _default_style_data('timeout')
+
+    return style_future, finish_style
+
+# start CRIMSON and StyleScore grading; returns (grade, finish_style) where finish_style() yields style data.
+# in concurrent mode both LLM calls are in flight together and the style call never holds up the grade.
+# GREEN_TIMEOUT_S bounds the CRIMSON call itself (SDK timeout, no retries) rather than the wait on the
+# future, so time queued for a grading thread does not eat the budget and no thread outlives it.
+def _start_report_grading(case_id, case_data, findings, llm_client):
+    if not GRADING_CONCURRENT:
+        grade = _grade_report_findings(case_id, case_data, findings, llm_client, GREEN_TIMEOUT_S)
+        return grade, lambda: _compute_style_data(findings, llm_client, STYLE_TIMEOUT_S)
+
+    style_future, finish_style = _start_style_grading(findings, llm_client)
+    green_future = _grading_executor.submit(_grade_report_findings, case_id, case_data, findings, llm_client, GREEN_TIMEOUT_S)
+    try:
+        grade = green_future.result()
+    except Exception:
+        style_future.cancel()
+        raise
+
+    return grade, finish_style
+
+def _report_result_payload(case_data, grade, report_log, style_data):
+    return {
+        'green_score': grade['green_score'],
+        'summary': grade['summary'],
+        'errors': grade['errors'],
+        'matched_findings': grade['matched_findings'],
+        'ground_truth': {
+            'findings': case_data.get('Findings', ''),
+            'impressions': case_data.get('Impressions', '')
+        },
+        'timer_checkpoint_ms': report_log.timer_checkpoint_ms,
+        'style_data': style_data
+    }
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _sse_response(events):
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# events sent once a grade is final: error buckets first, then style feedback, then the full result
+def _report_result_events(result):
+    yield _sse('errors', {
+        'green_score': result['green_score'],
+        'errors': result['errors'],
+        'matched_findings': result['matched_findings'],
+        'ground_truth': result['ground_truth'],
+        'timer_checkpoint_ms': result['timer_checkpoint_ms']
+    })
+    yield _sse('style', result['style_data'])
+    yield _sse('done', result)
+
+# grade inline and stream progress: queued -> grading -> explanation tokens -> errors -> style -> done
+def _stream_report_grading(access_code_id, case_id, case_data, findings, time_spent_ms, llm_client):
+    def events():
+        yield _sse('status', {'state': 'queued'})
+        style_future, finish_style = None, None
+        if GRADING_CONCURRENT:
+            style_future, finish_style = _start_style_grading(findings, llm_client)
+        yield _sse('status', {'state': 'grading'})
+        try:
+            age_str, indication_str = _report_patient_context(case_data)
+            grade = None
+            for kind, value in stream_crimson_score(findings, case_data.get('Findings', ''), age_str, indication_str,
+                                                    llm_client, timeout=GREEN_TIMEOUT_S, cache=get_grade_cache()):
+                if kind == 'explanation':
+                    yield _sse('explanation', {'delta': value})
+                else:
+                    grade = value
+        except Exception as e:
+            if style_future:
+                style_future.cancel()
+            if _is_openai_timeout(e):
+                print(f"GREEN grading timed out after {GREEN_TIMEOUT_S}s")
+                yield _sse('failed', {'error': 'Grading timed out, please try again.'})
+                return
+            print(f"Error streaming GREEN score: {e}")
+            yield _sse('failed', {'error': f"A server error occurred: {e}"})
+            return
+        report_log, error_response = _record_report_grade(access_code_id, case_id, findings, time_spent_ms, grade)
+        if error_response:
+            if style_future:
+                style_future.cancel()
+            yield _sse('failed', error_response[0])
+            return
+        style_data = finish_style() if finish_style else _compute_style_data(findings, llm_client, STYLE_TIMEOUT_S)
+        yield from _report_result_events(_report_result_payload(case_data, grade, report_log, style_data))
+
+    return _sse_response(events())
+
+@bp.route('/api/report/submit', methods=['POST'])
 @login_required
 def submit_report():
     access_code = AccessCode.query.filter_by(code=session['access_code']).first()
@@ -1054,51 +1485,22 @@ def submit_report():
     time_spent_ms = int(data.get('time_spent_ms') or 0)
 
     try:
-        existing_log = RadgameReportLog.query.filter_by(access_code_id=session['access_code'], sample_id=case_id).order_by(RadgameReportLog.timestamp.desc()).first()
-        if existing_log and existing_log.green_score is not None:
-            existing_payload = {}
-            try:
-                if existing_log.green_summary:
-                    existing_payload = json.loads(existing_log.green_summary)
-            except Exception:
-                existing_payload = {}
-            errors_payload = existing_payload.get('errors') or {}
-            matched_findings_payload = existing_payload.get('matched_findings') or []
-            case_data_cached = rexgradient_reports.get(case_id, {}) if case_id else {}
-            return jsonify({
-                'green_score': float(existing_log.green_score),
-                'summary': existing_payload.get('explanation') or existing_payload.get('Explanation') or '',
-                'errors': {
-                    'a': list(errors_payload.get('a', []) or []),
-                    'b': list(errors_payload.get('b', []) or []),
-                    'c': list(errors_payload.get('c', []) or []),
-                    'd': list(errors_payload.get('d', []) or []),
-                },
-                'matched_findings': list(matched_findings_payload),
-                'ground_truth': {
-                    'findings': case_data_cached.get('Findings', ''),
-                    'impressions': case_data_cached.get('Impressions', '')
-                },
-                'timer_checkpoint_ms': existing_log.timer_checkpoint_ms,
-                'duplicate': True
-            })
+        existing_log = _graded_report_log(session['access_code'], case_id)
+        if existing_log:
+            return jsonify(_graded_report_payload(existing_log, case_id))
     except Exception:
         pass
     
-    case_data = rexgradient_reports.get(case_id)
+    case_data = cases.rexgradient_reports.get(case_id)
     if not case_data:
         print(f"[submit_report] Case not found, auto-skipping: {case_id}")
         try:
             access_row = AccessCode.query.filter_by(code=session['access_code']).first()
-            current_val = int(access_row.report_cases_completed or 0) if access_row else 0
-            prev_rows = RadgameReportLog.query.filter_by(access_code_id=session['access_code']).order_by(RadgameReportLog.timestamp.asc()).all()
-            prev_checkpoint = 0
-            if prev_rows:
-                try:
-                    prev_checkpoint = max(int(r.timer_checkpoint_ms or 0) for r in prev_rows)
-                except Exception:
-                    prev_checkpoint = sum(int(r.time_spent_ms or 0) for r in prev_rows)
-            new_checkpoint = int(prev_checkpoint + (time_spent_ms or 0))
+            if access_row:
+                new_checkpoint, current_val = _add_report_time(session['access_code'], time_spent_ms)
+            else:
+                current_val = 0
+                new_checkpoint = _report_checkpoint_total(None, session['access_code']) + int(time_spent_ms or 0)
             if access_row and current_val < REPORT_POST_REQUIRED:
                 access_row.report_cases_completed = current_val + 1
             placeholder_payload = {
@@ -1112,7 +1514,7 @@ def submit_report():
                 findings='',
                 green_score=1.0,
                 green_score_std=0.0,
-                green_summary=json.dumps(placeholder_payload),
+                green_summary=placeholder_payload,
                 report_cases_completed_snapshot=(current_val + 1 if access_row else 0),
                 time_spent_ms=time_spent_ms,
                 timer_checkpoint_ms=new_checkpoint
@@ -1131,223 +1533,121 @@ def submit_report():
             db.session.rollback()
             return jsonify({'error': 'case_not_found', 'detail': str(skip_err)}), 500
     
-    reference = f"Findings: {case_data.get('Findings', '')}"
-    hypothesis = f"Findings: {findings}"
-    raw_age = case_data.get('PatientAge') or case_data.get('patient_age') or case_data.get('Age') or ''
-    age_val = None
-    if isinstance(raw_age, str):
-        try:
-            age_val = int(''.join([c for c in raw_age if c.isdigit()]) or '0') or None
-        except Exception:
-            age_val = None
-    elif isinstance(raw_age, (int, float)):
-        try:
-            age_val = int(raw_age)
-        except Exception:
-            age_val = None
-    indication_val = case_data.get('Indication') or case_data.get('indication') or ''
-    age_str = str(age_val) if age_val is not None else 'Unknown'
-    indication_str = indication_val if indication_val else 'None provided'
-
-    print(reference)
-    print(case_id)
-    
-    try:
-        prompt = (f'''
-                Objective:
-
-                Evaluate the accuracy of a candidate radiology report in comparison to a reference
-                radiology report composed by expert radiologists. Only include positive findings, not normal findings. 
-                Do not include notes unrelated to clinical findings. 
-                
-                Process Overview:
-                You will be presented with:
-                1. The criteria for making a judgment.
-                2. The reference radiology report.
-                3. The candidate radiology report.
-                4. The desired format for your assessment.
-                
-                1. Criteria for Judgment:
-                For each candidate report, determine only the clinically significant errors.
-
-                Errors can fall into one of these categories:
-                    a) False report of a finding in the candidate.
-                    b) Missing a finding present in the reference.
-                    c) Misidentification of a finding's anatomic location/position.
-                    d) Misassessment of the severity of a finding.
-
-                Note: Concentrate on the clinical findings rather than the report's writing style.
-                Evaluate only the findings that appear in both reports. 
-                
-                Patient Context:
-                    Age: {age_str}
-                    Indication: {indication_str}
-
-                IMPORTANT NOTES: 
-                    - Evaluate only positive findings, not normal findings. If a finding is normal, it should not be counted in the errors.
-                    - Ignore all references to prior findings and studies. DO NOT COUNT THEM AS ERRORS.
-                    - Do NOT penalize the candidate report for omitting specific numeric measurements (e.g., size or dimensions of a nodule/lesion) if the underlying finding is correctly identified. Missing measurements alone is fine since the user writing the candidate report can't measure. They should only be penalized for missing the finding itself.
-                    - Do NOT penalize omission of age-appropriate findings that are NOT clinically significant in the context of the indication and patient age.
-                    - Do NOT hallucinate or infer findings absent from both reports.
-             
-                2. Reference Report:
-                {reference}
-           
-                3. Candidate Report:
-                {hypothesis}
-            
-                4. Reporting Your Assessment:
-                Format your output as a JSON. Follow this specific format for your output, even if no errors are found:
-                ```
-                {{
-                    "Explanation": "<Explanation>",
-                    "ClinicallySignificantErrors": {{
-                        "a": ["<Error 1>", "<Error 2>", "...", "<Error n>"],
-                        "b": ["<Error 1>", "<Error 2>", "...", "<Error n>"],
-                        "c": ["<Error 1>", "<Error 2>", "...", "<Error n>"],
-                        "d": ["<Error 1>", "<Error 2>", "...", "<Error n>"]
-                    }},
-                    "MatchedFindings": ["<Finding 1>", "<Finding 2>", "...", "<Finding n>"]
-                }}
-                '''
-        )
-
-        completion = client.chat.completions.create(
-            model="o3",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that provides radiology report grades."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
-        )
-
-        print(f"OpenAI completion response: {completion.choices[0].message.content}")
-        response_data = json.loads(completion.choices[0].message.content)
-        summary = response_data.get('Explanation')
-        raw_errors = response_data.get('ClinicallySignificantErrors') or {}
-        # normalize error buckets to arrays
-        ClinicallySignificantErrors = {
-            'a': list(raw_errors.get('a', []) or []),
-            'b': list(raw_errors.get('b', []) or []),
-            'c': list(raw_errors.get('c', []) or []),
-            'd': list(raw_errors.get('d', []) or []),
-        }
-        MatchedFindings = list(response_data.get('MatchedFindings') or [])
-
-        # compute GREEN score from matched findings and errors
-        total_matched = len(MatchedFindings)
-        total_sig_errors = len(ClinicallySignificantErrors['a']) + \
-                            len(ClinicallySignificantErrors['b']) + \
-                            len(ClinicallySignificantErrors['c']) + \
-                            len(ClinicallySignificantErrors['d'])
-
-        if total_sig_errors == 0:
-            green_score = 1.0
-        else:
-            green_score = total_matched / (total_matched + total_sig_errors) 
-
-        std_score = 1 - green_score  # std_score is the inverse of green_score
-
-        # Create report log entry
+    if GRADING_QUEUE_ENABLED:
+        access_row = AccessCode.query.filter_by(code=session['access_code']).first()
+        blocked = _report_submission_blocked(access_row)
+        if blocked:
+            return jsonify({'error': blocked}), 403
         try:
-            # Fetch current report cases completed BEFORE increment for snapshot
-            access_row = AccessCode.query.filter_by(code=session['access_code']).first()
-            pre_increment_total = int(access_row.report_cases_completed or 0) if access_row else 0
-            # Block further practice submissions if cap reached or post-test already taken
-            if access_row and access_row.took_report_pre and pre_increment_total >= REPORT_POST_REQUIRED:
-                return jsonify({'error': 'practice_complete'}), 403
-            if access_row and access_row.took_report_post:
-                return jsonify({'error': 'post_test_completed'}), 403
-            # Determine cumulative checkpoint for continuous timer
-            prev_rows = RadgameReportLog.query.filter_by(access_code_id=session['access_code']).order_by(RadgameReportLog.timestamp.asc()).all()
-            prev_checkpoint = 0
-            if prev_rows:
-                try:
-                    prev_checkpoint = max(int(r.timer_checkpoint_ms or 0) for r in prev_rows)
-                except Exception:
-                    prev_checkpoint = sum(int(r.time_spent_ms or 0) for r in prev_rows)
-            new_checkpoint = int(prev_checkpoint + (time_spent_ms or 0))
-            full_llm_payload = {
-                'explanation': summary,
-                'errors': ClinicallySignificantErrors,
-                'matched_findings': MatchedFindings,
-                'raw_model_json': response_data
-            }
-            report_log = RadgameReportLog(
-                access_code_id=session['access_code'],
-                sample_id=case_id,
-                findings=findings,
-                #impression=impressions,
-                green_score=float(green_score),
-                green_score_std=float(std_score),
-                green_summary=json.dumps(full_llm_payload),
-                report_cases_completed_snapshot=pre_increment_total + 1,
-                time_spent_ms=time_spent_ms,
-                timer_checkpoint_ms=new_checkpoint
-            )
-            
-            db.session.add(report_log)
-            # Increment practice report counter on access code
-            if access_row:
-                try:
-                    current_val = int(access_row.report_cases_completed or 0)
-                except Exception:
-                    current_val = 0
-                if current_val < REPORT_POST_REQUIRED:
-                    access_row.report_cases_completed = current_val + 1
-            db.session.commit()
-        except Exception as db_error:
-            print(f"Database Error: {db_error}")
+            job = enqueue_grading_job(session['access_code'], case_id, findings, time_spent_ms)
+        except Exception as queue_err:
             db.session.rollback()
-            return jsonify({'error': f"Database error: {db_error}"}), 500
-        
-        # Calculate StyleScore
-        style_data = {}
-        try:
-            style_response, style_score = calculate_style_score(findings, client)
-            style_data = {
-                'style_score': style_score,
-                'systematic_evaluation_score': float(style_response.systematic_evaluation_score),
-                'organization_language_score': float(style_response.organization_language_score),
-                'systematic_evaluation_recommendation': style_response.systematic_evaluation_recommendation,
-                'organization_language_recommendation': style_response.organization_language_recommendation
-            }
-        except Exception as style_error:
-            print(f"StyleScore error: {style_error}")
-            # Set default values if StyleScore fails
-            style_data = {
-                'style_score': 0,
-                'systematic_evaluation_score': 0,
-                'organization_language_score': 0,
-                'systematic_evaluation_recommendation': '',
-                'organization_language_recommendation': ''
-            }
-
+            return jsonify({'error': f"Could not queue report for grading: {queue_err}"}), 500
         return jsonify({
-            'green_score': green_score,
-            'summary': summary,
-            'errors': ClinicallySignificantErrors,
-            'matched_findings': MatchedFindings,
-            'ground_truth': {
-                'findings': case_data.get('Findings', ''),
-                'impressions': case_data.get('Impressions', '')
-            },
-            'timer_checkpoint_ms': report_log.timer_checkpoint_ms,
-            'style_data': style_data
-        })
+            'job_id': job.id,
+            'status': job.status,
+            'poll_url': url_for('.get_report_job', job_id=job.id),
+            'events_url': url_for('.stream_report_job', job_id=job.id)
+        }), 202
+
+    if request.args.get('stream') in ('1', 'true'):
+        return _stream_report_grading(session['access_code'], case_id, case_data, findings, time_spent_ms, get_client())
+
+    try:
+        grade, finish_style = _start_report_grading(case_id, case_data, findings, get_client())
+        report_log, error_response = _record_report_grade(session['access_code'], case_id, findings, time_spent_ms, grade)
+        if error_response:
+            payload, status = error_response
+            return jsonify(payload), status
+        style_data = finish_style()
+        return jsonify(_report_result_payload(case_data, grade, report_log, style_data))
 
-    except openai.APIError as e:
-        print(f"OpenAI API Error: {e}")
-        return jsonify({'error': f"An error occurred with the OpenAI API: {e}"}), 500
     except Exception as e:
+        if _is_openai_timeout(e):
+            print(f"GREEN grading timed out after {GREEN_TIMEOUT_S}s")
+            return jsonify({'error': 'Grading timed out, please try again.'}), 504
+        if _is_openai_error(e):
+            print(f"OpenAI API Error: {e}")
+            return jsonify({'error': f"An error occurred with the OpenAI API: {e}"}), 500
         print(f"Error getting GREEN score: {e}")
         return jsonify({'error': f"A server error occurred: {e}"}), 500
 
-@app.route('/test_openai') # openai endpoint works! 
+# grade a queued submission; called by grading_queue.py workers.
+# a retried or requeued job may already have its report log committed (the worker failed or died
+# after _record_report_grade), so an existing grade for the case is returned instead of grading
+# again, which would add a second log row and count the case twice
+def process_grading_job(job, llm_client=None):
+    existing_log = _graded_report_log(job.access_code_id, job.sample_id)
+    if existing_log:
+        previous = (
+            GradingJob.query
+            .filter(GradingJob.access_code_id == job.access_code_id, GradingJob.sample_id == job.sample_id,
+                    GradingJob.status == 'done', GradingJob.id != job.id)
+            .order_by(GradingJob.finished_at.desc())
+            .first()
+        )
+        if previous and isinstance(previous.result_json, dict) and previous.result_json.get('style_data'):
+            return previous.result_json
+        return dict(_graded_report_payload(existing_log, job.sample_id), style_data=_default_style_data('unavailable'))
+    llm_client = llm_client or get_client()
+    case_data = cases.rexgradient_reports.get(job.sample_id)
+    if not case_data:
+        return {'error': 'case_not_found'}
+    grade, finish_style = _start_report_grading(job.sample_id, case_data, job.findings, llm_client)
+    report_log, error_response = _record_report_grade(job.access_code_id, job.sample_id, job.findings, job.time_spent_ms, grade)
+    if error_response:
+        return error_response[0]
+    style_data = finish_style()
+    return _report_result_payload(case_data, grade, report_log, style_data)
+
+@bp.route('/api/report/jobs/<job_id>')
+@login_required
+def get_report_job(job_id):
+    job = get_grading_job(job_id)
+    if not job or job.access_code_id != session.get('access_code'):
+        return jsonify({'error': 'job not found'}), 404
+    return jsonify(job.to_dict())
+
+# server-sent events for a queued job; explanation arrives whole since workers grade out of process
+@bp.route('/api/report/jobs/<job_id>/events')
+@login_required
+def stream_report_job(job_id):
+    job = get_grading_job(job_id)
+    if not job or job.access_code_id != session.get('access_code'):
+        return jsonify({'error': 'job not found'}), 404
+
+    def events():
+        last_state = None
+        deadline = time.monotonic() + GRADING_STREAM_TIMEOUT_S
+        while time.monotonic() < deadline:
+            db.session.expire_all()
+            current = get_grading_job(job_id)
+            if current is None:
+                yield _sse('failed', {'error': 'job not found'})
+                return
+            if current.status == 'failed':
+                yield _sse('failed', {'error': current.error or 'Grading failed'})
+                return
+            if current.status == 'done':
+                result = current.to_dict().get('result') or {}
+                if result.get('summary'):
+                    yield _sse('explanation', {'delta': result['summary']})
+                yield from _report_result_events(result)
+                return
+            state = 'grading' if current.status == 'running' else current.status
+            if state != last_state:
+                last_state = state
+                yield _sse('status', {'state': state})
+            time.sleep(GRADING_STREAM_POLL_S)
+        yield _sse('failed', {'error': 'Grading timed out, please try again.'})
+
+    return _sse_response(events())
+
+@bp.route('/test_openai') # openai endpoint works! 
 def test_openai():
     try:
         prompt = "Hello, this is a test. Please respond with a short story"
-        completion = client.chat.completions.create(
+        completion = get_client().chat.completions.create(
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are a test assistant that only returns JSON."},
@@ -1368,7 +1668,7 @@ def test_openai():
         }), 500
 
 # log completed case with scoring
-@app.route('/api/complete_case', methods=['POST'])
+@bp.route('/api/complete_case', methods=['POST'])
 @login_required
 def complete_case():
     # Store a row into user_case_logs each time the user advances to next case
@@ -1407,30 +1707,23 @@ def complete_case():
     incorrect_count = int(data.get('incorrect_count')) if isinstance(data.get('incorrect_count'), int) else computed_incorrect
     if not case_id:
         return jsonify({'error': 'case_id is required'}), 400
-    # Determine new checkpoint as cumulative time so far (sum of previous + this case's time)
-    prev_rows = (
-        UserCaseLog.query
-        .filter_by(access_code_id=session['access_code'])
-        .order_by(UserCaseLog.timestamp.asc())
-        .all()
-    )
-    prev_total_time = sum(int(r.time_spent_ms or 0) for r in prev_rows)
-    timer_checkpoint_ms = int(prev_total_time + (time_spent_ms or 0))
-
     # Fetch access code row early for snapshot values
     access = AccessCode.query.filter_by(code=session['access_code']).first()
+    # Determine new checkpoint as cumulative time so far (sum of previous + this case's time),
+    # bumping the running totals on the access code (only if record exists) before the log row is added
     if access:
-        next_localize_total = int(access.localize_cases_completed or 0) + 1
+        timer_checkpoint_ms, next_localize_total = _add_localize_case(session['access_code'], time_spent_ms)
         report_total = int(access.report_cases_completed or 0)
     else:
         # Fallbacks if access row missing (should not normally happen)
-        next_localize_total = len(prev_rows) + 1
+        timer_checkpoint_ms = int(_localize_time_total(None, session['access_code']) + (time_spent_ms or 0))
+        next_localize_total = UserCaseLog.query.filter_by(access_code_id=session['access_code']).count() + 1
         report_total = 0
 
     row = UserCaseLog(
         access_code_id=session['access_code'],
         case_id=str(case_id),
-        selections_json=json.dumps(selections),
+        selections_json=selections,
         time_spent_ms=time_spent_ms,
         timer_checkpoint_ms=timer_checkpoint_ms,
         correct_count=correct_count,
@@ -1438,15 +1731,11 @@ def complete_case():
         localize_cases_completed_snapshot=next_localize_total
     )
     db.session.add(row)
-
-    # Persist increment to access code (only if record exists)
-    if access:
-        access.localize_cases_completed = next_localize_total
     db.session.commit()
     # Return updated summary so UI can refresh banner immediately
     return progress_summary()
 
-@app.route('/api/user_timer_checkpoint', methods=['POST'])
+@bp.route('/api/user_timer_checkpoint', methods=['POST'])
 @login_required
 def user_timer_checkpoint():
     """Update the timer checkpoint for the most recent case row for this user.
@@ -1482,11 +1771,11 @@ def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if 'admin_id' not in session:
-            return redirect(url_for('admin_login'))
+            return redirect(url_for('.admin_login'))
         return f(*args, **kwargs)
     return decorated_function
 
-@app.route('/admin/login', methods=['GET', 'POST'])
+@bp.route('/admin/login', methods=['GET', 'POST'])
 def admin_login():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -1494,30 +1783,57 @@ def admin_login():
         admin = Admin.query.filter_by(username=username).first()
         if admin and admin.check_password(password):
             session['admin_id'] = admin.id
-            return redirect(url_for('admin_dashboard'))
+            return redirect(url_for('.admin_dashboard'))
         return render_template('admin/login.html', error='Invalid credentials')
     return render_template('admin/login.html')
 
-@app.route('/admin/logout')
+@bp.route('/admin/logout')
 def admin_logout():
     session.pop('admin_id', None)
-    return redirect(url_for('admin_login'))
+    return redirect(url_for('.admin_login'))
 
-@app.route('/admin/dashboard')
+@bp.route('/admin/dashboard')
 @admin_required
 def admin_dashboard():
     return render_template('admin/dashboard.html')
 
-@app.route('/admin/generate_codes', methods=['POST'])
+@bp.route('/admin/generate_codes', methods=['POST'])
 @admin_required
 def admin_generate_codes():
-    data = request.get_json()
+    data = request.get_json() or {}
     localize_mode = data.get('localize_mode') or 'active'
     report_mode = data.get('report_mode') or 'active'
-    codes = bulk_generate_codes(1, None, localize_mode=localize_mode, report_mode=report_mode)
-    return jsonify({'codes': codes, 'localize_mode': localize_mode, 'report_mode': report_mode})
+    mix = data.get('mix')
+    try:
+        if mix is not None and not all(isinstance(group, dict) and int(group.get('count', 0)) >= 0 for group in mix):
+            raise ValueError
+        plan = _code_mode_plan(int(data.get('count', 1)), localize_mode, report_mode, mix)
+    except (TypeError, ValueError):
+        plan = None
+    if not plan or len(plan) > MAX_CODES_PER_REQUEST:
+        return jsonify({'error': f'count must be between 1 and {MAX_CODES_PER_REQUEST}'}), 400
+
+    codes = bulk_generate_codes(len(plan), None, localize_mode=localize_mode, report_mode=report_mode, mix=mix)
+    return jsonify({
+        'codes': codes,
+        'count': len(codes),
+        'localize_mode': localize_mode,
+        'report_mode': report_mode,
+        'assignments': [
+            {'code': code, 'localize_mode': modes['localize_mode'], 'report_mode': modes['report_mode']}
+            for code, modes in zip(codes, plan)
+        ]
+    })
+
+@bp.route('/admin/grade_cache')
+@admin_required
+def admin_grade_cache_stats():
+    grade_cache = get_grade_cache()
+    if grade_cache is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(grade_cache.stats(), enabled=True))
 
-@app.route('/admin/analytics')
+@bp.route('/admin/analytics')
 @admin_required
 def admin_analytics():
     format_type = request.args.get('format', 'json')
@@ -1530,21 +1846,17 @@ def admin_analytics():
         return jsonify({'detailed_analytics': detailed_data})
     
     if format_type == 'csv':
-        csv_data = get_analytics_csv()
-        return send_file(
-            io.StringIO(csv_data),
+        return Response(
+            stream_with_context(iter_analytics_csv()),
             mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'access_codes_analytics_{datetime.now().strftime("%Y%m%d")}.csv'
+            headers={'Content-Disposition': f'attachment; filename=access_codes_analytics_{datetime.now().strftime("%Y%m%d")}.csv'}
         )
     elif format_type == 'json-download':
         # Export detailed JSON
-        json_data = export_detailed_analytics_json()
-        return send_file(
-            io.StringIO(json.dumps(json_data, indent=2)),
+        return Response(
+            stream_with_context(iter_detailed_analytics_json()),
             mimetype='application/json',
-            as_attachment=True,
-            download_name=f'detailed_analytics_{datetime.now().strftime("%Y%m%d")}.json'
+            headers={'Content-Disposition': f'attachment; filename=detailed_analytics_{datetime.now().strftime("%Y%m%d")}.json'}
         )
     
     # Default JSON: minimal fields used by admin dashboard
@@ -1565,16 +1877,40 @@ def admin_analytics():
 
     return jsonify({'codes': enriched})
 
-@app.route('/admin/export_code_json')
+# research export: partitioned Parquet dataset of all trainee logs, zipped (optionally ?code=... to scope it)
+@bp.route('/admin/export_parquet')
+@admin_required
+def admin_export_parquet():
+    from parquet_export import export_parquet
+    codes = request.args.getlist('code') or None
+    work_dir = tempfile.mkdtemp(prefix='radgame_parquet_')
+    try:
+        dataset_dir = os.path.join(work_dir, 'radgame_parquet')
+        export_parquet(dataset_dir, codes=codes)
+        # parquet pages are already compressed, so the archive just stores them
+        archive = shutil.make_archive(dataset_dir, 'zip', dataset_dir)
+    except ImportError as err:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return jsonify({'error': str(err)}), 501
+    except Exception as err:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return jsonify({'error': str(err)}), 500
+    response = send_file(
+        archive,
+        mimetype='application/zip',
+        as_attachment=True,
+        download_name=f'radgame_parquet_{datetime.utcnow().strftime("%Y%m%d")}.zip'
+    )
+    response.call_on_close(lambda: shutil.rmtree(work_dir, ignore_errors=True))
+    return response
+
+@bp.route('/admin/export_code_json')
 @admin_required
 def admin_export_code_json():
     code_value = request.args.get('code')
     if not code_value:
         return jsonify({'error': 'Missing code'}), 400
     try:
-        # Ensure schema so queries below don't fail on older DBs
-        ensure_test_logs_schema_runtime()
-
         ac = AccessCode.query.filter_by(code=code_value).first()
         if not ac:
             return jsonify({'error': 'Code not found'}), 404
@@ -1597,56 +1933,54 @@ def admin_export_code_json():
             'localize_cases_completed': getattr(ac, 'localize_cases_completed', 0),
             'report_cases_completed': getattr(ac, 'report_cases_completed', 0)
         }
+        # test-phase log tables only exist on databases created by the study build
+        existing_tables = set(inspect(db.engine).get_table_names())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        # Activities (include all types) - raw metadata only; no derived accuracy fields
-        acts = ActivityLog.query.filter_by(access_code_id=code_value).all()
-        activities = []
-        for a in acts:
-            activities.append({
+    # Activities (include all types) - raw metadata only; no derived accuracy fields
+    def _activities():
+        query = ActivityLog.query.filter_by(access_code_id=code_value).order_by(ActivityLog.id)
+        for a, metadata in _iter_activities_with_metadata(query):
+            yield {
                 'id': a.id,
                 'type': a.activity_type,
                 'case_id': a.case_id,
                 'timestamp': a.timestamp.isoformat() if a.timestamp else None,
                 'is_correct': a.is_correct,
-                'metadata': a.get_metadata()
-            })
+                'metadata': metadata
+            }
 
-        # User case logs (localize practice)
-        ucls = UserCaseLog.query.filter_by(access_code_id=code_value).all()
-        user_case_logs = [u.to_dict() for u in ucls]
-
-        # Report logs
-        rls = RadgameReportLog.query.filter_by(access_code_id=code_value).all()
-        report_logs = [r.to_dict() for r in rls]
-
-        # Localize and Report test logs
-        ltls = LocalizeTestCaseLog.query.filter_by(access_code_id=code_value).all()
-        localize_test_case_logs = [l.to_dict() for l in ltls]
-        rtls = ReportTestCaseLog.query.filter_by(access_code_id=code_value).all()
-        report_test_case_logs = [r.to_dict() for r in rtls]
-
-        export = {
-            'export_time': datetime.utcnow().isoformat(),
-            'code_summary': base,
-            'activities': activities,
-            'user_case_logs': user_case_logs,
-            'report_logs': report_logs,
-            'localize_test_case_logs': localize_test_case_logs,
-            'report_test_case_logs': report_test_case_logs
-        }
+    def _rows(model):
+        query = model.query.filter_by(access_code_id=code_value).order_by(model.id)
+        return (row.to_dict() for row in query.yield_per(EXPORT_CHUNK_SIZE))
 
-        from flask import Response
-        payload = json.dumps(export, indent=2)
-        filename = f"radgame_export_{code_value}_{datetime.utcnow().strftime('%Y%m%d')}.json"
-        return Response(
-            payload,
-            mimetype='application/json',
-            headers={'Content-Disposition': f'attachment; filename={filename}'}
+    def _test_rows(table):
+        if table not in existing_tables:
+            return []
+        result = db.session.execute(
+            text(f"SELECT * FROM {table} WHERE access_code_id = :code ORDER BY id"), {'code': code_value}
         )
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return (dict(row._mapping) for row in result)
+
+    # each section is written as it is read, so the first bytes go out before the logs are scanned
+    payload = iter_json_object([
+        ('export_time', datetime.utcnow().isoformat()),
+        ('code_summary', base),
+        ('activities', _activities()),
+        ('user_case_logs', _rows(UserCaseLog)),
+        ('report_logs', _rows(RadgameReportLog)),
+        ('localize_test_case_logs', _test_rows('localize_test_case_logs')),
+        ('report_test_case_logs', _test_rows('report_test_case_logs'))
+    ])
+    filename = f"radgame_export_{code_value}_{datetime.utcnow().strftime('%Y%m%d')}.json"
+    return Response(
+        stream_with_context(payload),
+        mimetype='application/json',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
 
-@app.route('/admin/update_code_modes', methods=['POST'])
+@bp.route('/admin/update_code_modes', methods=['POST'])
 @admin_required
 def admin_update_code_modes():
     data = request.get_json() or {}
@@ -1672,56 +2006,109 @@ def admin_update_code_modes():
     db.session.commit()
     return jsonify({'status': 'updated', 'code': code_value, 'localize_mode': access_code.localize_mode, 'report_mode': access_code.report_mode})
 
-@app.route('/admin/delete_code', methods=['POST'])
+PURGE_CHUNK_SIZE = 500
+MAX_PURGE_CODES = 20000
+
+
+# set-based delete of access codes and every row that references them, children first so
+# the foreign keys hold. runs in the caller's transaction; codes=None deletes every code.
+# code lists are bound in chunks to stay under the database's bound-parameter limit.
+def purge_access_codes(codes=None):
+    existing_tables = set(inspect(db.engine).get_table_names())
+    test_tables = [table for table in TEST_PHASE_TABLES if table in existing_tables]
+    counts = {}
+
+    def _add(table, deleted):
+        counts[table] = counts.get(table, 0) + max(deleted or 0, 0)
+
+    if codes is None:
+        chunks = [None]
+    else:
+        codes = list(dict.fromkeys(codes))
+        chunks = [codes[i:i + PURGE_CHUNK_SIZE] for i in range(0, len(codes), PURGE_CHUNK_SIZE)]
+    for chunk in chunks:
+        def _scoped(model, column='access_code_id'):
+            query = model.query
+            if chunk is not None:
+                query = query.filter(getattr(model, column).in_(chunk))
+            return query
+
+        activity_ids = select(ActivityLog.id)
+        if chunk is not None:
+            activity_ids = activity_ids.where(ActivityLog.access_code_id.in_(chunk))
+        _add('bounding_box_logs', BoundingBoxLog.query.filter(
+            BoundingBoxLog.activity_log_id.in_(activity_ids)).delete(synchronize_session=False))
+        for model in (ActivityLog, UserCaseLog, RadgameReportLog, GradingJob):
+            _add(model.__tablename__, _scoped(model).delete(synchronize_session=False))
+        for table in test_tables:
+            if chunk is None:
+                result = db.session.execute(text(f"DELETE FROM {table}"))
+            else:
+                result = db.session.execute(
+                    text(f"DELETE FROM {table} WHERE access_code_id IN :codes").bindparams(
+                        bindparam('codes', expanding=True)),
+                    {'codes': chunk}
+                )
+            _add(table, result.rowcount)
+        _add('access_codes', _scoped(AccessCode, 'code').delete(synchronize_session=False))
+    return counts
+
+@bp.route('/admin/delete_code', methods=['POST'])
 @admin_required
 def admin_delete_code():
     data = request.get_json() or {}
     code_value = data.get('code')
     if not code_value:
         return jsonify({'error': 'Missing code'}), 400
-    access_code = AccessCode.query.filter_by(code=code_value).first()
-    if not access_code:
+    if not db.session.get(AccessCode, code_value):
         return jsonify({'error': 'Code not found'}), 404
     try:
-        # Delete dependent logs (reports first, then activities + bounding boxes via relationship cascade if configured)
-        from models import ActivityLog, RadgameReportLog, BoundingBoxLog
-        # Delete bounding boxes via activity logs
-        activities = ActivityLog.query.filter_by(access_code_id=code_value).all()
-        for act in activities:
-            # bounding boxes removed via session.delete on each
-            for bb in act.bounding_boxes:
-                db.session.delete(bb)
-            db.session.delete(act)
-        # Delete report logs
-        RadgameReportLog.query.filter_by(access_code_id=code_value).delete()
-        db.session.delete(access_code)
+        deleted = purge_access_codes([code_value])
         db.session.commit()
-        return jsonify({'status': 'deleted', 'code': code_value})
+        return jsonify({'status': 'deleted', 'code': code_value, 'deleted': deleted})
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/admin/delete_all_codes', methods=['POST'])
+@bp.route('/admin/delete_all_codes', methods=['POST'])
 @admin_required
 def admin_delete_all_codes():
     try:
-        from models import ActivityLog, RadgameReportLog, BoundingBoxLog, AccessCode
-        # Delete in order to satisfy FKs
-        # Delete bounding boxes
-        BoundingBoxLog.query.delete()
-        # Delete activity logs
-        ActivityLog.query.delete()
-        # Delete report logs
-        RadgameReportLog.query.delete()
-        deleted = AccessCode.query.delete()
+        deleted = purge_access_codes()
         db.session.commit()
-        return jsonify({'status': 'all_deleted', 'count': deleted})
+        return jsonify({'status': 'all_deleted', 'count': deleted.get('access_codes', 0), 'deleted': deleted})
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+# remove a whole cohort (e.g. the codes handed out to one class) in a single transaction
+@bp.route('/admin/purge_codes', methods=['POST'])
+@admin_required
+def admin_purge_codes():
+    data = request.get_json() or {}
+    codes = data.get('codes')
+    if isinstance(codes, str):
+        codes = codes.replace(',', ' ').split()
+    if not isinstance(codes, list) or not codes or not all(isinstance(c, str) for c in codes):
+        return jsonify({'error': 'Missing codes'}), 400
+    codes = [c.strip().upper() for c in codes if c.strip()]
+    if len(codes) > MAX_PURGE_CODES:
+        return jsonify({'error': f'At most {MAX_PURGE_CODES} codes per purge'}), 400
+    try:
+        deleted = purge_access_codes(codes)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+    return jsonify({
+        'status': 'purged',
+        'requested': len(set(codes)),
+        'count': deleted.get('access_codes', 0),
+        'deleted': deleted
+    })
+
 # Make access_code and run_id available in all templates
-@app.context_processor
+@bp.app_context_processor
 def inject_globals():
     return {
         'access_code': session.get('access_code'),
@@ -1730,5 +2117,8 @@ def inject_globals():
     }
 
 if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        init_db()
     app.run(debug=True, port=5000)
     # app.run(host='0.0.0.0', debug=True, port=5000)
\ No newline at end of file
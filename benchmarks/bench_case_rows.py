@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.process_participant_reports import build_case_rows
+
+# compares the grouped case assembly in create_excel_report with the previous
+# per-case boolean filtering, for growing numbers of cases per participant
+
+
+def per_case_filtering(df):
+    pre_cases = df[df['Test Type'] == 'pre'].copy()
+    post_cases = df[df['Test Type'] == 'post'].copy()
+    rows = []
+    for case_idx in sorted(df['Case'].unique()):
+        case_pre = pre_cases[pre_cases['Case'] == case_idx]
+        case_post = post_cases[post_cases['Case'] == case_idx]
+        if case_pre.empty and case_post.empty:
+            continue
+        ref_row = case_pre.iloc[0] if not case_pre.empty else case_post.iloc[0]
+        rows.append({
+            'case_idx': case_idx,
+            'ground_truth': ref_row['Ground Truth'] or '',
+            'age': ref_row['Age'],
+            'indication': ref_row['Indication'],
+            'pre_text': case_pre.iloc[0]['Report Text'] if not case_pre.empty else '',
+            'post_text': case_post.iloc[0]['Report Text'] if not case_post.empty else '',
+        })
+    return rows
+
+
+def make_participant_frame(n_cases):
+    records = []
+    for i in range(n_cases):
+        for test_type in ('pre', 'post'):
+            records.append({
+                'Case': f"case{i:05d}",
+                'Age': 40 + i % 50,
+                'Indication': 'cough',
+                'Ground Truth': f"Finding {i % 7}.",
+                'Test Type': test_type,
+                'Report Text': f"Report {i} ({test_type})",
+            })
+    return pd.DataFrame(records)
+
+
+def timed(fn, df, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(df)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark per-participant case assembly')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 500, 1000, 5000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'cases':>8} {'filtering (s)':>15} {'grouped (s)':>13} {'speedup':>9}")
+    for n in args.sizes:
+        df = make_participant_frame(n)
+        assert per_case_filtering(df) == build_case_rows(df)
+        old = timed(per_case_filtering, df, args.repeat)
+        new = timed(build_case_rows, df, args.repeat)
+        print(f"{n:>8} {old:>15.4f} {new:>13.4f} {old / new:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# concurrent /api/complete_case load against a fresh SQLite file per database profile,
+# or against a scratch PostgreSQL database given with --database-url. each worker process stands in for an app worker and runs several threads, one
+# trainee per thread, posting case completions as fast as they are answered.
+
+
+def _worker(profile, db_uri, codes, duration_s, results):
+    import app as radgame
+
+    flask_app = radgame.create_app({
+        'SQLALCHEMY_DATABASE_URI': db_uri,
+        'DB_PROFILE': profile,
+        # raise route errors into the client so lock timeouts can be told apart from other failures
+        'PROPAGATE_EXCEPTIONS': True
+    })
+    with flask_app.app_context():
+        case_ids = list(radgame.cases.localize_order[:50])
+
+    stats = {'ok': 0, 'locked': 0, 'failed': 0, 'latencies': []}
+    lock = threading.Lock()
+    barrier = threading.Barrier(len(codes))
+
+    def trainee(code):
+        client = flask_app.test_client()
+        with client.session_transaction() as sess:
+            sess['access_code'] = code
+        barrier.wait()
+        deadline = time.perf_counter() + duration_s
+        i = 0
+        while time.perf_counter() < deadline:
+            payload = {
+                'case_id': case_ids[i % len(case_ids)],
+                'time_spent_ms': 1000,
+                'selections': {
+                    'localize_selected_labels': ['Nodule/Mass'],
+                    'nonlocalizable': {},
+                    'user_boxes': [{'label': 'Nodule/Mass', 'coordinates': [0.1, 0.1, 0.3, 0.3]}]
+                }
+            }
+            started = time.perf_counter()
+            try:
+                response = client.post('/api/complete_case', json=payload)
+                outcome = 'ok' if response.status_code == 200 else 'failed'
+            except Exception as err:
+                outcome = 'locked' if 'locked' in str(err) else 'failed'
+            elapsed = time.perf_counter() - started
+            with lock:
+                stats[outcome] += 1
+                if outcome == 'ok':
+                    stats['latencies'].append(elapsed)
+            i += 1
+
+    threads = [threading.Thread(target=trainee, args=(code,)) for code in codes]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    results.put(stats)
+
+
+def run_profile(profile, workers, threads, duration_s, database_url=None):
+    import app as radgame
+    from models import db, AccessCode
+
+    if database_url:
+        db_uri = database_url
+    else:
+        db_dir = tempfile.mkdtemp(prefix='radgame_bench_')
+        db_uri = f"sqlite:///{os.path.join(db_dir, 'bench.db')}"
+    flask_app = radgame.create_app({'SQLALCHEMY_DATABASE_URI': db_uri, 'DB_PROFILE': profile})
+    codes = [f"B{i:05d}" for i in range(workers * threads)]
+    with flask_app.app_context():
+        if database_url:
+            # the scratch server database is reused between profiles; start each run from an empty schema
+            db.drop_all()
+            with db.engine.begin() as conn:
+                conn.execute(db.text("DROP TABLE IF EXISTS alembic_version"))
+        radgame.init_db()
+        db.session.add_all([AccessCode(code=code) for code in codes])
+        db.session.commit()
+        db.engine.dispose()
+
+    ctx = multiprocessing.get_context('fork')
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(target=_worker, args=(profile, db_uri, codes[w * threads:(w + 1) * threads], duration_s, results))
+        for w in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    merged = {'ok': 0, 'locked': 0, 'failed': 0, 'latencies': []}
+    for _ in procs:
+        stats = results.get()
+        for key in ('ok', 'locked', 'failed'):
+            merged[key] += stats[key]
+        merged['latencies'].extend(stats['latencies'])
+    for p in procs:
+        p.join()
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark concurrent case completions per database profile')
+    parser.add_argument('--profiles', nargs='+', default=['default', 'production'])
+    parser.add_argument('--workers', type=int, default=4, help='Worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='Concurrent trainees per worker')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load per profile')
+    parser.add_argument('--database-url', default=None,
+                        help='Scratch PostgreSQL URI to benchmark instead of a temporary SQLite file (its tables are dropped)')
+    args = parser.parse_args()
+
+    print(f"{args.workers} workers x {args.threads} trainees, {args.duration:.0f}s per profile")
+    print(f"{'profile':>12} {'completions/s':>14} {'locked':>8} {'failed':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for profile in args.profiles:
+        stats = run_profile(profile, args.workers, args.threads, args.duration, args.database_url)
+        latencies = sorted(stats['latencies']) or [0.0]
+        p50 = latencies[len(latencies) // 2] * 1000
+        p95 = latencies[int(len(latencies) * 0.95)] * 1000
+        print(f"{profile:>12} {stats['ok'] / args.duration:>14.1f} {stats['locked']:>8} {stats['failed']:>8} "
+              f"{p50:>8.1f} {p95:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scores.localize_score import keyed_iou, score_case, score_cases
+
+# compares scores/localize_score.py with the pair-at-a-time loops it replaced:
+# case scoring in app.py (_iou / _compute_case_scores) and the any-overlap test in
+# make_localize_test_scores.py, over synthetic cases with growing numbers of boxes.
+# also times the 'optimal' matcher (scipy if installed, else the built-in solver)
+
+
+def loop_iou(box1, box2):
+    x1 = max(box1[0], box2[0])
+    y1 = max(box1[1], box2[1])
+    x2 = min(box1[2], box2[2])
+    y2 = min(box1[3], box2[3])
+    if x2 <= x1 or y2 <= y1:
+        return 0.0
+    inter = (x2 - x1) * (y2 - y1)
+    a1 = max(box1[2] - box1[0], 0) * max(box1[3] - box1[1], 0)
+    a2 = max(box2[2] - box2[0], 0) * max(box2[3] - box2[1], 0)
+    union = a1 + a2 - inter
+    if union <= 0:
+        return 0.0
+    return inter / union
+
+
+def loop_score_case(gt_boxes, user_boxes, iou_thresh=0.3):
+    correct = 0
+    incorrect = 0
+    enriched_boxes = []
+    grouped_indices = {}
+    for ub in user_boxes:
+        idx = len(enriched_boxes)
+        enriched_boxes.append({'label': ub['label'], 'coordinates': [float(v) for v in ub['coordinates']], 'iou': 0.0})
+        grouped_indices.setdefault(ub['label'], []).append(idx)
+    for lbl, gts in gt_boxes.items():
+        user_idxs = grouped_indices.get(lbl, [])
+        used = [False] * len(user_idxs)
+        for g in gts:
+            best_iou = 0.0
+            best_local_idx = -1
+            for local_i, box_global_index in enumerate(user_idxs):
+                if used[local_i]:
+                    continue
+                iou = loop_iou(g, enriched_boxes[box_global_index]['coordinates'])
+                if iou > best_iou:
+                    best_iou = iou
+                    best_local_idx = local_i
+            if best_local_idx >= 0 and best_iou >= iou_thresh:
+                used[best_local_idx] = True
+                enriched_boxes[user_idxs[best_local_idx]]['iou'] = float(best_iou)
+                correct += 1
+            else:
+                incorrect += 1
+        for local_i, box_global_index in enumerate(user_idxs):
+            if not used[local_i]:
+                u = enriched_boxes[box_global_index]['coordinates']
+                enriched_boxes[box_global_index]['iou'] = float(max([loop_iou(g, u) for g in gts] + [0.0]))
+                incorrect += 1
+    for lbl, idxs in grouped_indices.items():
+        if lbl not in gt_boxes:
+            incorrect += len(idxs)
+    return correct, incorrect, enriched_boxes
+
+
+def loop_any_overlap(gt_list, candidates, threshold=0.25):
+    for g in gt_list:
+        for u in candidates:
+            if loop_iou(g, u) >= threshold:
+                return True
+    return False
+
+
+# every (gt_list, candidates) pair in one keyed IoU pass, as make_localize_test_scores.py does
+def batch_any_overlap(pairs, threshold=0.25):
+    gt_keys, gt_boxes, user_keys, user_boxes = [], [], [], []
+    for key, (gt_list, candidates) in enumerate(pairs):
+        gt_keys.extend([key] * len(gt_list))
+        gt_boxes.extend(gt_list)
+        user_keys.extend([key] * len(candidates))
+        user_boxes.extend(candidates)
+    gt_idx, _, iou = keyed_iou(gt_keys, gt_boxes, user_keys, user_boxes)
+    matched = {gt_keys[i] for i in gt_idx[iou >= threshold].tolist()}
+    return [key in matched for key in range(len(pairs))]
+
+
+def random_box(rng, near=None):
+    if near is not None:
+        jitter = [rng.uniform(-0.05, 0.05) for _ in range(4)]
+        return [near[0] + jitter[0], near[1] + jitter[1], near[2] + jitter[2], near[3] + jitter[3]]
+    x, y = rng.uniform(0, 0.7), rng.uniform(0, 0.7)
+    return [x, y, x + rng.uniform(0.05, 0.3), y + rng.uniform(0.05, 0.3)]
+
+
+def make_cases(n_cases, boxes_per_label, labels=3, seed=0):
+    rng = random.Random(seed)
+    items = []
+    for _ in range(n_cases):
+        gt_boxes = {f"label{l}": [random_box(rng) for _ in range(boxes_per_label)] for l in range(labels)}
+        user_boxes = []
+        for label, gts in gt_boxes.items():
+            for g in gts:
+                user_boxes.append({'label': label, 'coordinates': random_box(rng, g if rng.random() < 0.6 else None)})
+        user_boxes.append({'label': 'unlisted', 'coordinates': random_box(rng)})
+        rng.shuffle(user_boxes)
+        items.append((gt_boxes, user_boxes))
+    return items
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark localization scoring')
+    parser.add_argument('--cases', type=int, default=2000, help='Cases per size')
+    parser.add_argument('--boxes', type=int, nargs='+', default=[1, 3, 10, 30], help='GT boxes per label')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{args.cases} cases, 3 labels each; times in seconds")
+    print(f"{'boxes/label':>11} {'loop':>9} {'per case':>9} {'batch':>9} {'speedup':>8}"
+          f" {'optimal':>9} {'us/case':>8} {'any loop':>9} {'any batch':>9} {'speedup':>8}")
+    for boxes in args.boxes:
+        items = make_cases(args.cases, boxes)
+        expected = [loop_score_case(gt, user) for gt, user in items]
+        assert [score_case(gt, user) for gt, user in items] == expected
+        assert score_cases(items) == expected
+        old = timed(lambda: [loop_score_case(gt, user) for gt, user in items], args.repeat)
+        single = timed(lambda: [score_case(gt, user) for gt, user in items], args.repeat)
+        batch = timed(lambda: score_cases(items), args.repeat)
+        # the optimal matcher never matches fewer GT boxes than greedy
+        assert all(o[0] >= g[0] for o, g in zip(score_cases(items, matcher='optimal'), expected))
+        optimal = timed(lambda: score_cases(items, matcher='optimal'), args.repeat)
+
+        pairs = [(gts, [u['coordinates'] for u in user if u['label'] == label])
+                 for gt, user in items for label, gts in gt.items()]
+        assert [loop_any_overlap(g, c) for g, c in pairs] == batch_any_overlap(pairs)
+        any_old = timed(lambda: [loop_any_overlap(g, c) for g, c in pairs], args.repeat)
+        any_new = timed(lambda: batch_any_overlap(pairs), args.repeat)
+        print(f"{boxes:>11} {old:>9.4f} {single:>9.4f} {batch:>9.4f} {old / batch:>7.1f}x"
+              f" {optimal:>9.4f} {optimal / len(items) * 1e6:>8.0f} {any_old:>9.4f} {any_new:>9.4f} {any_old / any_new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
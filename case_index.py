@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import time
+from math import isfinite
+
+# precompiled case index. the localize and report datasets are compiled once into
+# a pickle stamped with a format version and digests of the source files and label
+# config; app workers load that instead of re-parsing and re-normalizing the JSON.
+# a missing or stale index is rebuilt from source on load, so it can never serve
+# outdated cases. build it ahead of time with: python case_index.py
+
+CASE_INDEX_VERSION = 1
+
+
+def _clip01(v: float) -> float:
+    return max(0.0, min(1.0, v))
+
+
+def _normalize_boxes_list(boxes):
+    norm = []
+    for b in (boxes or []):
+        try:
+            nb = [float(b[0]), float(b[1]), float(b[2]), float(b[3])]
+            if all(isfinite(v) for v in nb):
+                norm.append([_clip01(v) for v in nb])
+        except Exception:
+            continue
+    return norm
+
+
+# filter reports with short comparison fields
+def _is_valid_report_case(case_data):
+    if not isinstance(case_data, dict):
+        return False
+    comparison = case_data.get('Comparison', '')
+    return (not comparison) or len(str(comparison)) < 50
+
+
+def compile_localize_cases(localize_list, allowed_labels, merge_synonyms):
+    localize_cases_map = {}
+    localize_explanations_map = {}
+    for item in localize_list:
+        img = item.get('ImageID')
+        if not img:
+            continue
+        by_label = {}
+        by_label_expl = {}
+        for fnd in (item.get('findings') or []):
+            norm_boxes = _normalize_boxes_list(fnd.get('boxes'))
+            labels = list(filter(None, (fnd.get('labels') or [])))
+            if not labels:
+                continue
+            for lbl in labels:
+                if lbl in merge_synonyms:
+                    lbl = merge_synonyms[lbl]
+                if lbl not in allowed_labels and lbl not in merge_synonyms.values():
+                    continue
+                if norm_boxes:
+                    by_label.setdefault(lbl, []).extend(norm_boxes)
+                else:
+                    by_label.setdefault(lbl, [])
+                expl = fnd.get('medgemma_explanation') or None
+                if expl:
+                    by_label_expl.setdefault(lbl, []).append(expl.strip())
+        localize_cases_map[img] = by_label
+        if by_label_expl:
+            localize_explanations_map[img] = by_label_expl
+
+    loc_seen = set()
+    localize_order = []
+    for item in localize_list:
+        cid = item.get('ImageID')
+        if not cid or cid in loc_seen:
+            continue
+        if cid in localize_cases_map:
+            localize_order.append(cid)
+            loc_seen.add(cid)
+    return localize_cases_map, localize_explanations_map, localize_order
+
+
+def compile_report_cases(reports):
+    if isinstance(reports, list):
+        reports = {str(i): item for i, item in enumerate(reports)}
+    report_order = [cid for cid, cdata in reports.items() if _is_valid_report_case(cdata)]
+    return reports, report_order
+
+
+# the ground-truth fields the localize pages and the guided API serve for one image
+def localize_payload(label_box_map, non_localizable_labels, nonlocal_labels):
+    return {
+        'actual': {lbl: ([] if lbl in non_localizable_labels else list(boxes)) for lbl, boxes in label_box_map.items()},
+        'nonlocalizable_presence': {lbl: (lbl in label_box_map) for lbl in nonlocal_labels},
+        'detailed_classes': {lbl: '' for lbl in label_box_map},
+        'detailed_names': {lbl: lbl for lbl in label_box_map},
+    }
+
+
+# per-image structures derived from the compiled index when it is loaded, so requests never rebuild them:
+#   gt_arrays: {image: {label: read-only (n, 4) float array}} for the localizable labels, used for scoring
+#   payloads: {image: localize_payload()}, shared between requests and never modified
+def prebuild_localize_cases(localize_cases_map, localizable_labels, non_localizable_labels, nonlocal_labels):
+    import numpy as np
+    gt_arrays = {}
+    payloads = {}
+    for img, label_box_map in localize_cases_map.items():
+        arrays = {}
+        for lbl, boxes in label_box_map.items():
+            if lbl in localizable_labels:
+                arr = np.asarray(boxes or [], dtype=float).reshape(-1, 4)
+                arr.setflags(write=False)
+                arrays[lbl] = arr
+        gt_arrays[img] = arrays
+        payloads[img] = localize_payload(label_box_map, non_localizable_labels, nonlocal_labels)
+    return gt_arrays, payloads
+
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+# everything that determines the compiled index; any change forces a rebuild
+def case_index_stamp(localize_json, report_json, allowed_labels, merge_synonyms):
+    labels = json.dumps([sorted(allowed_labels), sorted(merge_synonyms.items())])
+    return {
+        'version': CASE_INDEX_VERSION,
+        'localize_sha256': _file_digest(localize_json),
+        'report_sha256': _file_digest(report_json),
+        'labels_sha256': hashlib.sha256(labels.encode('utf-8')).hexdigest()
+    }
+
+
+def build_case_index(localize_json, report_json, allowed_labels, merge_synonyms, output_path=None):
+    stamp = case_index_stamp(localize_json, report_json, allowed_labels, merge_synonyms)
+    with open(localize_json) as f:
+        localize_list = json.load(f)
+    with open(report_json) as f:
+        reports = json.load(f)
+    localize_cases_map, localize_explanations_map, localize_order = compile_localize_cases(
+        localize_list, allowed_labels, merge_synonyms
+    )
+    reports, report_order = compile_report_cases(reports)
+    index = {
+        'stamp': stamp,
+        'localize_cases_map': localize_cases_map,
+        'localize_explanations_map': localize_explanations_map,
+        'localize_order': localize_order,
+        'rexgradient_reports': reports,
+        'report_order': report_order
+    }
+    if output_path:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+            # write then rename so concurrently starting workers never read a partial file
+            tmp_path = f"{output_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, output_path)
+        except OSError as write_err:
+            print(f"[Case Index] Could not write {output_path}: {write_err}")
+    return index
+
+
+def load_case_index(localize_json, report_json, allowed_labels, merge_synonyms, index_path=None):
+    stamp = case_index_stamp(localize_json, report_json, allowed_labels, merge_synonyms)
+    if index_path and os.path.exists(index_path):
+        try:
+            with open(index_path, 'rb') as f:
+                index = pickle.load(f)
+            if index.get('stamp') == stamp:
+                return index
+            print(f"[Case Index] {index_path} is stale, rebuilding")
+        except Exception as load_err:
+            print(f"[Case Index] Could not read {index_path}, rebuilding: {load_err}")
+    return build_case_index(localize_json, report_json, allowed_labels, merge_synonyms, index_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile the localize and report datasets into the prebuilt case index')
+    parser.add_argument('-o', '--output', help='Index path (defaults to CASE_INDEX_PATH from config.py)')
+    parser.add_argument('--force', action='store_true', help='Rebuild even if the existing index is current')
+    args = parser.parse_args()
+
+    from config import CASE_INDEX_PATH, LOCALIZE_JSON, REPORT_METADATA_JSON
+    # the label taxonomy lives with the app
+    from app import _ALLOWED_LABELS, MERGE_SYNONYMS
+    output = args.output or CASE_INDEX_PATH
+
+    started = time.perf_counter()
+    if args.force:
+        index = build_case_index(LOCALIZE_JSON, REPORT_METADATA_JSON, _ALLOWED_LABELS, MERGE_SYNONYMS, output)
+    else:
+        index = load_case_index(LOCALIZE_JSON, REPORT_METADATA_JSON, _ALLOWED_LABELS, MERGE_SYNONYMS, output)
+    print(f"Case index {output} ready in {time.perf_counter() - started:.2f}s: "
+          f"{len(index['localize_order'])} localize cases, {len(index['report_order'])} report cases "
+          f"({os.path.getsize(output) / 1024:.0f} KB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# connection tuning for the app database, selected by DB_PROFILE in config.py.
+# 'production' is what a classroom needs on SQLite: WAL lets readers run alongside the
+# single writer, busy_timeout makes concurrent writers queue for the lock instead of
+# failing with "database is locked", and the pool is sized for threaded workers.
+# on PostgreSQL the same profile sizes the pool per app process and keeps connections healthy.
+
+DB_PROFILES = ('production', 'default')
+
+
+def _is_memory_sqlite(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(uri, profile, pool_size, max_overflow, pool_timeout_s, busy_timeout_ms, pool_recycle_s=None):
+    if profile not in DB_PROFILES:
+        raise ValueError(f"Unknown database profile: {profile} (expected one of {', '.join(DB_PROFILES)})")
+    url = make_url(uri)
+    # in-memory SQLite is a single shared connection; leave it on SQLAlchemy's own pool
+    if profile == 'default' or _is_memory_sqlite(url):
+        return {}
+    options = {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout_s
+    }
+    if url.get_backend_name() == 'sqlite':
+        # sqlite3's own lock wait, matched to the busy_timeout pragma
+        options['connect_args'] = {'timeout': busy_timeout_ms / 1000.0}
+    else:
+        # networked servers drop idle connections; test on checkout and recycle ahead of their timeouts
+        options['pool_pre_ping'] = True
+        if pool_recycle_s:
+            options['pool_recycle'] = pool_recycle_s
+    return options
+
+
+def apply_sqlite_pragmas(engine, pragmas):
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
@@ -3,6 +3,7 @@
 import argparse
 import ast
 import csv
+import importlib.util
 import json
 import os
 import re
@@ -15,11 +16,8 @@ import pandas as pd
 from tqdm import tqdm
 
 # openai check
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
+OPENAI_AVAILABLE = importlib.util.find_spec("openai") is not None
+if not OPENAI_AVAILABLE:
     print("Warning: openai package not installed")
 
 try:
@@ -27,6 +25,9 @@ try:
 except ImportError:
     SECRET_FILE_KEY = None
 
+from config import LLM_BACKEND
+from scores.llm_backend import get_llm_client
+
 SCRIPT_DIR = Path(__file__).resolve().parent
 DATA_DIR = SCRIPT_DIR / "data"
 
@@ -49,13 +50,15 @@ PRIOR_PATTERN = re.compile(
 
 
 def get_openai_client():
-    """Initialize OpenAI client."""
+    """Initialize the LLM client (OpenAI unless RADGAME_LLM_BACKEND selects a stand-in)."""
+    if LLM_BACKEND == 'fake':
+        return get_llm_client()
     if not OPENAI_AVAILABLE:
         raise SystemExit("OpenAI package not installed. Run: pip install openai")
     api_key = os.environ.get("OPENAI_API_KEY") or SECRET_FILE_KEY
-    if not api_key:
+    if not api_key and LLM_BACKEND == 'openai':
         raise SystemExit("OPENAI_API_KEY not set in environment or secretcodes.py")
-    return OpenAI(api_key=api_key)
+    return get_llm_client(api_key=api_key)
 
 
 def is_adult_years(age):
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from sqlalchemy import and_, or_
+
+from config import GRADING_STALE_AFTER_S
+from models import db, GradingJob
+from scores.llm_backend import LLM_BACKENDS, get_llm_client
+
+# persistent report grading queue backed by the grading_jobs table.
+# the web app enqueues submissions; workers started from this script claim
+# and grade them, so worker count scales independently of the web server.
+
+ACTIVE_STATUSES = ('queued', 'running')
+MAX_ATTEMPTS = 3
+# how often each worker thread looks for orphaned running jobs (seconds)
+STALE_SWEEP_INTERVAL_S = 30.0
+
+
+def _stale_cutoff(stale_after_s: float) -> datetime:
+    return datetime.utcnow() - timedelta(seconds=stale_after_s)
+
+
+def enqueue_grading_job(access_code_id: str, sample_id: str, findings: str, time_spent_ms: int = 0,
+                        stale_after_s: float = GRADING_STALE_AFTER_S) -> GradingJob:
+    cutoff = _stale_cutoff(stale_after_s)
+    same_case = and_(GradingJob.access_code_id == access_code_id, GradingJob.sample_id == str(sample_id))
+    # reuse an in-flight job for the same case so double clicks don't grade twice
+    existing = (
+        GradingJob.query
+        .filter(same_case, or_(GradingJob.status == 'queued',
+                               and_(GradingJob.status == 'running', GradingJob.started_at >= cutoff)))
+        .order_by(GradingJob.created_at.desc())
+        .first()
+    )
+    if existing:
+        return existing
+    # a job orphaned by a dead worker is abandoned, not handed back; the resubmission replaces it
+    GradingJob.query.filter(same_case, GradingJob.status == 'running', GradingJob.started_at < cutoff).update({
+        'status': 'failed',
+        'error': 'Worker stopped responding; replaced by a resubmission',
+        'finished_at': datetime.utcnow()
+    }, synchronize_session=False)
+    job = GradingJob(
+        id=str(uuid.uuid4()),
+        access_code_id=access_code_id,
+        sample_id=str(sample_id),
+        findings=findings or '',
+        time_spent_ms=int(time_spent_ms or 0),
+        status='queued'
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def get_job(job_id: str) -> Optional[GradingJob]:
+    return db.session.get(GradingJob, job_id)
+
+
+def claim_next_job(worker_id: str) -> Optional[GradingJob]:
+    while True:
+        candidate = (
+            GradingJob.query
+            .filter_by(status='queued')
+            .order_by(GradingJob.created_at.asc())
+            .first()
+        )
+        if not candidate:
+            return None
+        # conditional update so only one worker wins the claim
+        claimed = (
+            GradingJob.query
+            .filter_by(id=candidate.id, status='queued')
+            .update({
+                'status': 'running',
+                'worker_id': worker_id,
+                'started_at': datetime.utcnow(),
+                'attempts': GradingJob.attempts + 1
+            }, synchronize_session=False)
+        )
+        db.session.commit()
+        if claimed == 1:
+            db.session.expire_all()
+            return db.session.get(GradingJob, candidate.id)
+
+
+def complete_job(job: GradingJob, result: dict):
+    job.status = 'done'
+    job.result_json = result
+    job.error = None
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+def fail_job(job: GradingJob, error: str, retry: bool = False):
+    if retry and int(job.attempts or 0) < MAX_ATTEMPTS:
+        job.status = 'queued'
+        job.worker_id = None
+    else:
+        job.status = 'failed'
+        job.finished_at = datetime.utcnow()
+    job.error = error
+    db.session.commit()
+
+
+# put jobs orphaned by a crashed worker back on the queue; ones that already used up their
+# attempts (e.g. a job that keeps killing its worker) are failed instead
+def requeue_stale_jobs(stale_after_s: float = GRADING_STALE_AFTER_S) -> int:
+    stale = and_(GradingJob.status == 'running', GradingJob.started_at < _stale_cutoff(stale_after_s))
+    GradingJob.query.filter(stale, GradingJob.attempts >= MAX_ATTEMPTS).update({
+        'status': 'failed',
+        'error': 'Worker stopped responding',
+        'finished_at': datetime.utcnow()
+    }, synchronize_session=False)
+    count = (
+        GradingJob.query
+        .filter(stale, GradingJob.attempts < MAX_ATTEMPTS)
+        .update({'status': 'queued', 'worker_id': None}, synchronize_session=False)
+    )
+    db.session.commit()
+    return count
+
+
+def run_worker(flask_app, process_job: Callable[[GradingJob], dict], worker_id: str,
+               poll_interval: float = 1.0, stop_event: Optional[threading.Event] = None,
+               max_jobs: Optional[int] = None, stale_after_s: float = GRADING_STALE_AFTER_S) -> int:
+    processed = 0
+    next_sweep = 0.0
+    with flask_app.app_context():
+        while not (stop_event and stop_event.is_set()):
+            if max_jobs is not None and processed >= max_jobs:
+                break
+            # jobs orphaned by another worker that died are picked up without waiting for a restart
+            if time.monotonic() >= next_sweep:
+                next_sweep = time.monotonic() + STALE_SWEEP_INTERVAL_S
+                try:
+                    requeued = requeue_stale_jobs(stale_after_s)
+                    if requeued:
+                        print(f"[GradingWorker {worker_id}] Requeued {requeued} stale jobs")
+                except Exception as sweep_err:
+                    db.session.rollback()
+                    print(f"[GradingWorker {worker_id}] Stale job sweep failed: {sweep_err}")
+            try:
+                job = claim_next_job(worker_id)
+            except Exception as claim_err:
+                db.session.rollback()
+                print(f"[GradingWorker {worker_id}] Claim failed: {claim_err}")
+                time.sleep(poll_interval)
+                continue
+            if not job:
+                if max_jobs is not None:
+                    break
+                time.sleep(poll_interval)
+                continue
+            try:
+                result = process_job(job)
+                if result.get('error'):
+                    fail_job(job, result['error'])
+                else:
+                    complete_job(job, result)
+            except Exception as job_err:
+                db.session.rollback()
+                print(f"[GradingWorker {worker_id}] Job {job.id} failed: {job_err}")
+                fail_job(job, str(job_err), retry=True)
+            processed += 1
+    return processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run report grading workers against the persistent job queue')
+    parser.add_argument('--threads', type=int, default=1, help='Worker threads in this process')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between polls when idle')
+    parser.add_argument('--stale-after', type=float, default=GRADING_STALE_AFTER_S,
+                        help='Requeue running jobs started more than this many seconds ago')
+    parser.add_argument('--drain', action='store_true', help='Exit once the queue is empty')
+    parser.add_argument('--llm-backend', choices=LLM_BACKENDS,
+                        help="LLM backend for this worker (defaults to the app's RADGAME_LLM_BACKEND)")
+    parser.add_argument('--fake-llm', action='store_true', help='Grade with the deterministic local fake LLM')
+    parser.add_argument('--fake-latency', type=float, default=0.0, help='Seconds of simulated latency per fake LLM call')
+    args = parser.parse_args()
+
+    import app as radgame
+
+    flask_app = radgame.create_app()
+    llm_client = None
+    if args.fake_llm:
+        from scores.fake_llm import FakeLLMClient
+        llm_client = FakeLLMClient(latency_s=args.fake_latency)
+    elif args.llm_backend:
+        llm_client = get_llm_client(args.llm_backend)
+
+    host = f"{socket.gethostname()}-{os.getpid()}"
+    stop_event = threading.Event()
+    threads = [
+        threading.Thread(
+            target=run_worker,
+            args=(flask_app, lambda job: radgame.process_grading_job(job, llm_client), f"{host}-{i}"),
+            kwargs={'poll_interval': args.poll_interval, 'stop_event': stop_event, 'stale_after_s': args.stale_after},
+            daemon=True
+        )
+        for i in range(max(1, args.threads))
+    ]
+    print(f"Starting {len(threads)} grading worker thread(s)")
+    for t in threads:
+        t.start()
+    try:
+        while any(t.is_alive() for t in threads):
+            if args.drain:
+                with flask_app.app_context():
+                    pending = GradingJob.query.filter(GradingJob.status.in_(ACTIVE_STATUSES)).count()
+                if not pending:
+                    break
+            time.sleep(args.poll_interval)
+    except KeyboardInterrupt:
+        print("Stopping grading workers")
+    stop_event.set()
+    for t in threads:
+        t.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from scores.fake_llm import fake_content_for
+
+# local OpenAI-compatible chat completions server for load testing grading offline.
+# answers /v1/chat/completions with schema-valid CRIMSON / StyleScore JSON from
+# scores.fake_llm, with configurable latency and injected errors. point the app at
+# it with RADGAME_LLM_BACKEND=standin (and RADGAME_LLM_STANDIN_URL if not on :8808).
+
+# latency_s is the mean, jitter_s the +/- spread; errors pick a status from error_statuses
+PROFILES = {
+    'instant': {'latency_s': 0.0, 'jitter_s': 0.0, 'error_rate': 0.0, 'error_statuses': (500,)},
+    'fast': {'latency_s': 1.0, 'jitter_s': 0.5, 'error_rate': 0.0, 'error_statuses': (500,)},
+    'o3': {'latency_s': 25.0, 'jitter_s': 15.0, 'error_rate': 0.01, 'error_statuses': (500, 503)},
+    'flaky': {'latency_s': 2.0, 'jitter_s': 1.5, 'error_rate': 0.1, 'error_statuses': (500, 502, 503)},
+    'rate-limited': {'latency_s': 1.0, 'jitter_s': 0.5, 'error_rate': 0.3, 'error_statuses': (429,)},
+}
+RETRY_AFTER_S = 1
+STREAM_CHUNK_SIZE = 16
+
+
+class StandinState:
+    def __init__(self, profile, seed=None):
+        self.profile = profile
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counters = {'requests': 0, 'errors': 0, 'in_flight': 0, 'max_in_flight': 0}
+
+    def sample(self):
+        with self._lock:
+            latency = self.profile['latency_s'] + self._rng.uniform(-1, 1) * self.profile['jitter_s']
+            status = None
+            if self._rng.random() < self.profile['error_rate']:
+                status = self._rng.choice(self.profile['error_statuses'])
+        return max(0.0, latency), status
+
+    def bump(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+            if name == 'in_flight':
+                self.counters['max_in_flight'] = max(self.counters['max_in_flight'], self.counters['in_flight'])
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counters, profile=self.profile)
+
+
+def _completion_body(content, model):
+    return {
+        'id': f"chatcmpl-{uuid.uuid4().hex}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': content},
+            'finish_reason': 'stop'
+        }],
+        'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+    }
+
+
+def _chunk_body(completion_id, model, delta, finish_reason=None):
+    return {
+        'id': completion_id,
+        'object': 'chat.completion.chunk',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+    }
+
+
+def make_handler(state):
+    class StandinHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip('/') == '/stats':
+                return self._send_json(200, state.snapshot())
+            if self.path.rstrip('/') == '/v1/models':
+                return self._send_json(200, {'object': 'list', 'data': [{'id': 'o3', 'object': 'model'}]})
+            self._send_json(404, {'error': {'message': 'not found'}})
+
+        def do_POST(self):
+            if self.path.rstrip('/') != '/v1/chat/completions':
+                return self._send_json(404, {'error': {'message': 'not found'}})
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                request_body = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                return self._send_json(400, {'error': {'message': 'invalid JSON body'}})
+
+            state.bump('requests')
+            state.bump('in_flight')
+            try:
+                latency, error_status = state.sample()
+                if error_status:
+                    state.bump('errors')
+                    time.sleep(min(latency, 1.0))
+                    headers = {'Retry-After': str(RETRY_AFTER_S)} if error_status == 429 else None
+                    return self._send_json(error_status, {
+                        'error': {'message': f"stand-in injected error {error_status}", 'type': 'standin_error'}
+                    }, headers)
+
+                model = request_body.get('model', 'o3')
+                try:
+                    content = fake_content_for(request_body.get('messages') or [])
+                except ValueError as e:
+                    return self._send_json(400, {'error': {'message': str(e), 'type': 'invalid_request_error'}})
+                if request_body.get('stream'):
+                    return self._stream(content, model, latency)
+                time.sleep(latency)
+                self._send_json(200, _completion_body(content, model))
+            finally:
+                state.bump('in_flight', -1)
+
+        # server-sent event chunks in the OpenAI streaming format, latency spread across chunks
+        def _stream(self, content, model, latency):
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            pieces = [content[i:i + STREAM_CHUNK_SIZE] for i in range(0, len(content), STREAM_CHUNK_SIZE)]
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            events = [_chunk_body(completion_id, model, {'role': 'assistant', 'content': ''})]
+            events += [_chunk_body(completion_id, model, {'content': piece}) for piece in pieces]
+            events.append(_chunk_body(completion_id, model, {}, 'stop'))
+            for event in events:
+                time.sleep(latency / len(events))
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+    return StandinHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local OpenAI-compatible stand-in for CRIMSON / StyleScore grading')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8808)
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='fast', help='Latency / error profile')
+    parser.add_argument('--latency', type=float, help='Override mean latency in seconds')
+    parser.add_argument('--jitter', type=float, help='Override latency jitter in seconds')
+    parser.add_argument('--error-rate', type=float, help='Override fraction of requests that fail')
+    parser.add_argument('--seed', type=int, help='Seed latency and error sampling for repeatable runs')
+    args = parser.parse_args()
+
+    profile = dict(PROFILES[args.profile])
+    if args.latency is not None:
+        profile['latency_s'] = args.latency
+    if args.jitter is not None:
+        profile['jitter_s'] = args.jitter
+    if args.error_rate is not None:
+        profile['error_rate'] = args.error_rate
+
+    state = StandinState(profile, seed=args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    server.daemon_threads = True
+    print(f"LLM stand-in ({args.profile}) listening on http://{args.host}:{args.port}/v1 "
+          f"latency={profile['latency_s']}s±{profile['jitter_s']}s error_rate={profile['error_rate']}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping LLM stand-in")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 import json
 import os
 from glob import glob
-from typing import Dict, List, Tuple
+from typing import Dict, Tuple
+
+from scores.localize_score import keyed_iou, parse_box
 
 # IoU threshold for box matching
 IOU_THRESHOLD = 0.25
@@ -29,22 +31,6 @@ PARTICIPANT_GLOB = os.path.join("data", "participant_jsons", "radgame_export_*.j
 OUTPUT_PATH = os.path.join("data", "localize_test_scores.json")
 
 
-def iou(box_a: List[float], box_b: List[float]) -> float:
-    x1 = max(box_a[0], box_b[0])
-    y1 = max(box_a[1], box_b[1])
-    x2 = min(box_a[2], box_b[2])
-    y2 = min(box_a[3], box_b[3])
-    inter_w = max(0.0, x2 - x1)
-    inter_h = max(0.0, y2 - y1)
-    inter = inter_w * inter_h
-    if inter <= 0:
-        return 0.0
-    area_a = max(0.0, (box_a[2] - box_a[0])) * max(0.0, (box_a[3] - box_a[1]))
-    area_b = max(0.0, (box_b[2] - box_b[0])) * max(0.0, (box_b[3] - box_b[1]))
-    denom = area_a + area_b - inter
-    return inter / denom if denom > 0 else 0.0
-
-
 def load_ground_truth(path: str):
     with open(path, 'r') as f:
         data = json.load(f)
@@ -74,50 +60,53 @@ def labels_match(user_label: str, gt_label: str, case_index: int) -> bool:
     return False
 
 
-def match_boxes(gt_boxes, user_boxes, case_index: int):
+# parsed coordinates of the boxes that have usable ones; malformed boxes are left out of matching
+def _parsed_coords(boxes):
+    return [c for c in (parse_box(b.get("coordinates")) for b in boxes) if c is not None]
+
+
+# the (GT boxes, candidate user boxes) to compare for each GT label of one image
+def _label_groups(gt_boxes, user_boxes, case_index: int):
     gt_by_label = {}
     for g in gt_boxes:
         lbl = canonical_label(g.get("label"))
         gt_by_label.setdefault(lbl, []).append(g)
-    user_by_label = {}
-    for u in user_boxes:
-        ulab = u.get("label")
-        coords = u.get("coordinates")
-        if not ulab or not coords:
-            continue
-        can = canonical_label(ulab)
-        user_by_label.setdefault(can, []).append(u)
-
-    correct = 0
-    incorrect = 0
 
+    groups = []
     for gt_label, gt_list in gt_by_label.items():
-        user_candidates = []
-        for u in user_boxes:
-            if labels_match(u.get("label"), gt_label, case_index):
-                user_candidates.append(u)
-        matched = False
-        if user_candidates:
-            for g in gt_list:
-                g_coords = g.get("coordinates")
-                for u in user_candidates:
-                    val = iou(g_coords, u.get("coordinates"))
-                    if val >= IOU_THRESHOLD:
-                        matched = True
-                        break
-                if matched:
-                    break
-        if matched:
-            correct += 1
-        else:
-            incorrect += 1
+        user_candidates = [u for u in user_boxes if labels_match(u.get("label"), gt_label, case_index)]
+        groups.append((_parsed_coords(gt_list), _parsed_coords(user_candidates)))
+    extra = set(canonical_label(u.get("label")) for u in user_boxes if u.get("label")) - set(gt_by_label)
+    return groups, len(extra)
+
+
+# (correct, incorrect) per image from its _label_groups(); a GT label is correct when any
+# candidate box overlaps any of its GT boxes at IOU_THRESHOLD, and each user label with no
+# GT counterpart is incorrect. the pairs of every image are scored in one IoU pass
+def _score_label_groups(label_groups):
+    gt_keys, gt_coords, user_keys, user_coords = [], [], [], []
+    key = 0
+    for groups, _ in label_groups:
+        for gts, users in groups:
+            gt_keys.extend([key] * len(gts))
+            gt_coords.extend(gts)
+            user_keys.extend([key] * len(users))
+            user_coords.extend(users)
+            key += 1
+    gt_idx, _, iou = keyed_iou(gt_keys, gt_coords, user_keys, user_coords)
+    matched_keys = {gt_keys[i] for i in gt_idx[iou >= IOU_THRESHOLD].tolist()}
+
+    results = []
+    key = 0
+    for groups, extra_labels in label_groups:
+        correct = sum(1 for k in range(key, key + len(groups)) if k in matched_keys)
+        results.append((correct, len(groups) - correct + extra_labels))
+        key += len(groups)
+    return results
 
-    for user_label in set(canonical_label(u.get("label")) for u in user_boxes if u.get("label")):
-        if user_label in gt_by_label:
-            continue
-        incorrect += 1
 
-    return correct, incorrect
+def match_boxes(gt_boxes, user_boxes, case_index: int):
+    return _score_label_groups([_label_groups(gt_boxes, user_boxes, case_index)])[0]
 
 
 def score_nonlocalizable(gt_nonloc: Dict[str, bool], user_nonloc: Dict[str, bool]):
@@ -141,6 +130,7 @@ def process_participant(file_path: str, gt_index):
     code = pdata.get("code_summary", {}).get("code") or os.path.basename(file_path).split('_')[2]
     results = {"pre": {"images": {}, "total_correct": 0, "total_incorrect": 0},
                "post": {"images": {}, "total_correct": 0, "total_incorrect": 0}}
+    pending = []
     for entry in pdata.get("localize_test_case_logs", []):
         image_id = entry.get("image_id")
         test_type = entry.get("test_type")
@@ -159,11 +149,15 @@ def process_participant(file_path: str, gt_index):
             gt_boxes = []
         if user_boxes is None:
             user_boxes = []
-        try:
-            box_correct, box_incorrect = match_boxes(gt_boxes, user_boxes, case_index)
-        except Exception as e:
-            print(f"DEBUG match_boxes error code={code} image={image_id} test={test_type}: {e}")
-            continue
+        malformed = sum(1 for u in user_boxes if u.get("coordinates") and parse_box(u.get("coordinates")) is None)
+        if malformed:
+            print(f"Warning: ignoring {malformed} malformed box(es) for {code} image {image_id} ({test_type})")
+        label_groups = _label_groups(gt_boxes, user_boxes, case_index)
+        pending.append((image_id, test_type, gt, user_nonloc, label_groups))
+
+    # box matching for all of this participant's images at once
+    box_scores = _score_label_groups([entry[4] for entry in pending])
+    for (image_id, test_type, gt, user_nonloc, _), (box_correct, box_incorrect) in zip(pending, box_scores):
         nl_correct, nl_incorrect = score_nonlocalizable(gt["nonlocalizable"], user_nonloc)
         img_correct = box_correct + nl_correct
         img_incorrect = box_incorrect + nl_incorrect
@@ -0,0 +1,200 @@
+"""baseline schema, adopting databases created before migrations
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-17 00:00:00
+
+Fresh databases (SQLite or PostgreSQL) get every table and index. training.db files
+created by db.create_all() plus the old start-up probes / migrate_db.py are brought to
+the same schema in place: missing tables, columns and indexes are added, columns
+those scripts used to drop are dropped, and the access code timer totals are backfilled.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001_baseline'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _tables():
+    return {
+        'admins': lambda: op.create_table(
+            'admins',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('username', sa.String(length=80), nullable=False, unique=True),
+            sa.Column('password_hash', sa.String(length=200), nullable=False)
+        ),
+        'access_codes': lambda: op.create_table(
+            'access_codes',
+            sa.Column('code', sa.String(length=10), primary_key=True),
+            sa.Column('status', sa.String(length=10), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('first_login_at', sa.DateTime(), nullable=True),
+            sa.Column('last_login_at', sa.DateTime(), nullable=True),
+            sa.Column('login_attempts', sa.Integer(), nullable=True),
+            *[column() for column in ACCESS_CODE_COLUMNS.values()]
+        ),
+        'activity_logs': lambda: op.create_table(
+            'activity_logs',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('access_code_id', sa.String(length=10), sa.ForeignKey('access_codes.code'), nullable=False),
+            sa.Column('activity_type', sa.String(length=50), nullable=False),
+            sa.Column('case_id', sa.String(length=50), nullable=True),
+            sa.Column('timestamp', sa.DateTime(), nullable=True),
+            sa.Column('is_correct', sa.Boolean(), nullable=True),
+            sa.Column('activity_metadata', sa.Text(), nullable=True)
+        ),
+        'bounding_box_logs': lambda: op.create_table(
+            'bounding_box_logs',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('activity_log_id', sa.Integer(), sa.ForeignKey('activity_logs.id'), nullable=False),
+            sa.Column('label', sa.String(length=50), nullable=False),
+            sa.Column('x1', sa.Float(), nullable=False),
+            sa.Column('y1', sa.Float(), nullable=False),
+            sa.Column('x2', sa.Float(), nullable=False),
+            sa.Column('y2', sa.Float(), nullable=False),
+            sa.Column('is_ground_truth', sa.Boolean(), nullable=False),
+            sa.Column('confidence_score', sa.Float(), nullable=True)
+        ),
+        'radgame_report_logs': lambda: op.create_table(
+            'radgame_report_logs',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('access_code_id', sa.String(length=10), sa.ForeignKey('access_codes.code'), nullable=False),
+            sa.Column('sample_id', sa.String(length=128), nullable=False),
+            sa.Column('findings', sa.Text(), nullable=False),
+            sa.Column('timestamp', sa.DateTime(), nullable=True),
+            sa.Column('llm_feedback', sa.Text(), nullable=True),
+            sa.Column('green_score', sa.Float(), nullable=True),
+            sa.Column('green_score_std', sa.Float(), nullable=True),
+            sa.Column('green_summary', sa.Text(), nullable=True),
+            *[column() for column in REPORT_LOG_COLUMNS.values()]
+        ),
+        'user_case_logs': lambda: op.create_table(
+            'user_case_logs',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('access_code_id', sa.String(length=10), sa.ForeignKey('access_codes.code'), nullable=False),
+            sa.Column('case_id', sa.String(length=128), nullable=False),
+            sa.Column('selections_json', sa.Text(), nullable=False),
+            sa.Column('time_spent_ms', sa.Integer(), nullable=False, server_default='0'),
+            *[column() for column in CASE_LOG_COLUMNS.values()],
+            sa.Column('correct_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('incorrect_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('timestamp', sa.DateTime(), nullable=True)
+        ),
+        'grading_jobs': lambda: op.create_table(
+            'grading_jobs',
+            sa.Column('id', sa.String(length=36), primary_key=True),
+            sa.Column('access_code_id', sa.String(length=10), sa.ForeignKey('access_codes.code'), nullable=False),
+            sa.Column('sample_id', sa.String(length=128), nullable=False),
+            sa.Column('findings', sa.Text(), nullable=False),
+            sa.Column('time_spent_ms', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('status', sa.String(length=16), nullable=False, server_default='queued'),
+            sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('worker_id', sa.String(length=64), nullable=True),
+            sa.Column('result_json', sa.Text(), nullable=True),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('started_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True)
+        ),
+    }
+
+
+# columns that older databases may be missing, keyed by name
+ACCESS_CODE_COLUMNS = {
+    'report_version': lambda: sa.Column('report_version', sa.String(length=20), nullable=True, server_default='practice'),
+    'localize_mode': lambda: sa.Column('localize_mode', sa.String(length=10), nullable=True, server_default='active'),
+    'report_mode': lambda: sa.Column('report_mode', sa.String(length=10), nullable=True, server_default='active'),
+    'took_localize_pre': lambda: sa.Column('took_localize_pre', sa.Boolean(), nullable=True, server_default=sa.false()),
+    'took_localize_post': lambda: sa.Column('took_localize_post', sa.Boolean(), nullable=True, server_default=sa.false()),
+    'took_report_pre': lambda: sa.Column('took_report_pre', sa.Boolean(), nullable=True, server_default=sa.false()),
+    'took_report_post': lambda: sa.Column('took_report_post', sa.Boolean(), nullable=True, server_default=sa.false()),
+    'localize_cases_completed': lambda: sa.Column('localize_cases_completed', sa.Integer(), nullable=True, server_default='0'),
+    'report_cases_completed': lambda: sa.Column('report_cases_completed', sa.Integer(), nullable=True, server_default='0'),
+    # running timer totals; no server default so adopted rows stay NULL until backfilled below
+    'localize_time_ms': lambda: sa.Column('localize_time_ms', sa.Integer(), nullable=True),
+    'report_timer_checkpoint_ms': lambda: sa.Column('report_timer_checkpoint_ms', sa.Integer(), nullable=True),
+}
+CASE_LOG_COLUMNS = {
+    'timer_checkpoint_ms': lambda: sa.Column('timer_checkpoint_ms', sa.Integer(), nullable=False, server_default='0'),
+    'localize_cases_completed_snapshot': lambda: sa.Column(
+        'localize_cases_completed_snapshot', sa.Integer(), nullable=False, server_default='0'),
+}
+REPORT_LOG_COLUMNS = {
+    'report_cases_completed_snapshot': lambda: sa.Column(
+        'report_cases_completed_snapshot', sa.Integer(), nullable=False, server_default='0'),
+    'time_spent_ms': lambda: sa.Column('time_spent_ms', sa.Integer(), nullable=False, server_default='0'),
+    'timer_checkpoint_ms': lambda: sa.Column('timer_checkpoint_ms', sa.Integer(), nullable=False, server_default='0'),
+}
+ADOPTED_COLUMNS = {
+    'access_codes': ACCESS_CODE_COLUMNS,
+    'user_case_logs': CASE_LOG_COLUMNS,
+    'radgame_report_logs': REPORT_LOG_COLUMNS,
+}
+# columns migrate_db.py used to remove with hand-written SQLite table rebuilds
+OBSOLETE_COLUMNS = {
+    'access_codes': ('expiration_date', 'cases_completed', 'cases_correct'),
+    'user_case_logs': ('report_cases_completed_snapshot',),
+}
+INDEXES = [
+    ('ix_bounding_box_logs_activity', 'bounding_box_logs', ['activity_log_id']),
+    ('ix_activity_logs_code_type_ts', 'activity_logs', ['access_code_id', 'activity_type', 'timestamp']),
+    ('ix_radgame_report_logs_code_ts', 'radgame_report_logs', ['access_code_id', 'timestamp']),
+    ('ix_radgame_report_logs_code_sample_ts', 'radgame_report_logs', ['access_code_id', 'sample_id', 'timestamp']),
+    ('ix_user_case_logs_code_ts', 'user_case_logs', ['access_code_id', 'timestamp']),
+    ('ix_grading_jobs_status_created', 'grading_jobs', ['status', 'created_at']),
+    ('ix_grading_jobs_code_sample', 'grading_jobs', ['access_code_id', 'sample_id']),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    existing_tables = set(inspector.get_table_names())
+
+    for name, create in _tables().items():
+        if name not in existing_tables:
+            create()
+
+    added_timer_totals = False
+    for table, columns in ADOPTED_COLUMNS.items():
+        if table not in existing_tables:
+            continue
+        present = {c['name'] for c in inspector.get_columns(table)}
+        for name, column in columns.items():
+            if name not in present:
+                op.add_column(table, column())
+                added_timer_totals |= name in ('localize_time_ms', 'report_timer_checkpoint_ms')
+
+    for table, columns in OBSOLETE_COLUMNS.items():
+        if table not in existing_tables:
+            continue
+        present = {c['name'] for c in inspector.get_columns(table)}
+        obsolete = [name for name in columns if name in present]
+        if obsolete:
+            with op.batch_alter_table(table) as batch_op:
+                for name in obsolete:
+                    batch_op.drop_column(name)
+
+    for name, table, columns in INDEXES:
+        if table in existing_tables and name in {ix['name'] for ix in inspector.get_indexes(table)}:
+            continue
+        op.create_index(name, table, columns)
+
+    if added_timer_totals:
+        op.execute(
+            "UPDATE access_codes SET "
+            "localize_time_ms = (SELECT COALESCE(SUM(time_spent_ms), 0) FROM user_case_logs "
+            "WHERE user_case_logs.access_code_id = access_codes.code), "
+            "report_timer_checkpoint_ms = (SELECT COALESCE(MAX(timer_checkpoint_ms), 0) FROM radgame_report_logs "
+            "WHERE radgame_report_logs.access_code_id = access_codes.code)"
+        )
+
+
+def downgrade():
+    for name in ('grading_jobs', 'user_case_logs', 'radgame_report_logs', 'bounding_box_logs',
+                 'activity_logs', 'access_codes', 'admins'):
+        op.drop_table(name)
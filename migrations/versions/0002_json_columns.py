@@ -0,0 +1,164 @@
+"""JSON columns for selections, grading payloads and activity metadata, with indexed scalars
+
+Revision ID: 0002_json_columns
+Revises: 0001_baseline
+Create Date: 2026-10-17 00:00:00
+
+selections_json, green_summary, activity_metadata and result_json become JSON columns
+(JSONB on PostgreSQL). Stored text that is not valid JSON, such as the 'NA' placeholder
+for skipped cases, is kept as a JSON string. The scalars that analytics read are
+copied into their own indexed columns and backfilled from the existing documents.
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_json_columns'
+down_revision = '0001_baseline'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+
+def _json_type():
+    return sa.JSON(none_as_null=True).with_variant(postgresql.JSONB(none_as_null=True), 'postgresql')
+
+
+def _as_float(value):
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_int(value):
+    value = _as_float(value)
+    return int(value) if value is not None else None
+
+
+# same extraction as the @validates hooks in models.py, frozen here for the backfill
+def _activity_scalars(metadata):
+    metadata = metadata if isinstance(metadata, dict) else {}
+    return {
+        'iou_score': _as_float(metadata.get('iou_score')),
+        'images_processed': _as_int(metadata.get('images_processed')),
+        'session_time_ms': _as_int(metadata.get('session_time_ms')),
+    }
+
+
+def _report_scalars(summary):
+    summary = summary if isinstance(summary, dict) else {}
+    matched = summary.get('matched_findings')
+    errors = summary.get('errors')
+    return {
+        'matched_findings_count': len(matched) if isinstance(matched, list) else None,
+        'significant_error_count': (
+            sum(len(v) for v in errors.values() if isinstance(v, list)) if isinstance(errors, dict) else None
+        ),
+    }
+
+
+def _selection_scalars(selections):
+    is_object = isinstance(selections, dict)
+    boxes = selections.get('user_boxes') if is_object else None
+    boxes = [b for b in boxes if isinstance(b, dict)] if isinstance(boxes, list) else []
+    ious = [iou for iou in (_as_float(b.get('iou')) for b in boxes) if iou is not None]
+    return {
+        'user_box_count': len(boxes) if is_object else None,
+        'mean_box_iou': sum(ious) / len(ious) if ious else None,
+    }
+
+
+# table: (json column, nullable, scalar extractor, scalar columns)
+JSON_COLUMNS = {
+    'activity_logs': ('activity_metadata', True, _activity_scalars, [
+        sa.Column('iou_score', sa.Float(), nullable=True),
+        sa.Column('images_processed', sa.Integer(), nullable=True),
+        sa.Column('session_time_ms', sa.Integer(), nullable=True),
+    ]),
+    'radgame_report_logs': ('green_summary', True, _report_scalars, [
+        sa.Column('matched_findings_count', sa.Integer(), nullable=True),
+        sa.Column('significant_error_count', sa.Integer(), nullable=True),
+    ]),
+    'user_case_logs': ('selections_json', False, _selection_scalars, [
+        sa.Column('user_box_count', sa.Integer(), nullable=True),
+        sa.Column('mean_box_iou', sa.Float(), nullable=True),
+    ]),
+    'grading_jobs': ('result_json', True, None, []),
+}
+INDEXES = [
+    ('ix_activity_logs_type_iou', 'activity_logs', ['activity_type', 'iou_score']),
+    ('ix_radgame_report_logs_sample_errors', 'radgame_report_logs', ['sample_id', 'significant_error_count']),
+    ('ix_user_case_logs_case_iou', 'user_case_logs', ['case_id', 'mean_box_iou']),
+]
+
+
+# one keyset-paginated pass per table: quote text that is not JSON, and fill the scalar columns
+def _rewrite_documents(bind, table, column, extract, scalar_names):
+    assignments = [f"{column} = :document"] + [f"{name} = :{name}" for name in scalar_names]
+    update = sa.text(f"UPDATE {table} SET {', '.join(assignments)} WHERE id = :id")
+    last_id = None
+    while True:
+        sql = f"SELECT id, {column} FROM {table}"
+        if last_id is not None:
+            sql += " WHERE id > :last_id"
+        rows = bind.execute(sa.text(sql + f" ORDER BY id LIMIT {BATCH_SIZE}"), {'last_id': last_id}).fetchall()
+        if not rows:
+            return
+        updates = []
+        for row_id, text in rows:
+            document, value = text, None
+            if text is not None:
+                try:
+                    value = json.loads(text)
+                except (TypeError, ValueError):
+                    value = text
+                    document = json.dumps(text)
+            scalars = extract(value) if extract else {}
+            if document != text or any(v is not None for v in scalars.values()):
+                updates.append(dict(scalars, id=row_id, document=document))
+        if updates:
+            bind.execute(update, updates)
+        last_id = rows[-1][0]
+
+
+def upgrade():
+    bind = op.get_bind()
+    for table, (column, nullable, extract, scalars) in JSON_COLUMNS.items():
+        for scalar in scalars:
+            op.add_column(table, scalar)
+        _rewrite_documents(bind, table, column, extract, [scalar.name for scalar in scalars])
+        if bind.dialect.name == 'postgresql':
+            op.alter_column(table, column, type_=_json_type(), existing_type=sa.Text(),
+                            existing_nullable=nullable, postgresql_using=f"{column}::jsonb")
+        else:
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.alter_column(column, type_=_json_type(), existing_type=sa.Text(),
+                                      existing_nullable=nullable)
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade():
+    bind = op.get_bind()
+    for name, table, columns in INDEXES:
+        op.drop_index(name, table_name=table)
+    for table, (column, nullable, extract, scalars) in JSON_COLUMNS.items():
+        if bind.dialect.name == 'postgresql':
+            op.alter_column(table, column, type_=sa.Text(), existing_type=_json_type(),
+                            existing_nullable=nullable, postgresql_using=f"{column}::text")
+            for scalar in scalars:
+                op.drop_column(table, scalar.name)
+        else:
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.alter_column(column, type_=sa.Text(), existing_type=_json_type(),
+                                      existing_nullable=nullable)
+                for scalar in scalars:
+                    batch_op.drop_column(scalar.name)
@@ -1,10 +1,15 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 import json
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import validates
 from werkzeug.security import generate_password_hash, check_password_hash
 
 db = SQLAlchemy()
 
+# JSON documents: JSONB on PostgreSQL, JSON text on SQLite. None is stored as SQL NULL
+JSONDocument = db.JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), 'postgresql')
+
 # parse JSON from db with fallback
 def _safe_json_loads(value, default=None):
     if value is None:
@@ -23,6 +28,18 @@ def _safe_json_loads(value, default=None):
             return value
     return value
 
+def _as_float(value):
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _as_int(value):
+    value = _as_float(value)
+    return int(value) if value is not None else None
+
 class Admin(db.Model):
     __tablename__ = 'admins'
     
@@ -58,21 +75,32 @@ class AccessCode(db.Model):
     took_report_post = db.Column(db.Boolean, default=False)
     localize_cases_completed = db.Column(db.Integer, default=0)
     report_cases_completed = db.Column(db.Integer, default=0)
+    # running timer totals so submissions don't rescan every prior case row.
+    # localize: sum of user_case_logs.time_spent_ms; report: max radgame_report_logs.timer_checkpoint_ms
+    localize_time_ms = db.Column(db.Integer, default=0)
+    report_timer_checkpoint_ms = db.Column(db.Integer, default=0)
     
     activities = db.relationship('ActivityLog', backref='access_code', lazy=True)
 
-    def to_dict(self):
-        case_activities = ActivityLog.query.filter_by(
-            access_code_id=self.code,
-            activity_type='case_completion'
-        ).count()
-        
-        correct_cases = ActivityLog.query.filter_by(
-            access_code_id=self.code,
-            activity_type='case_completion',
-            is_correct=True
-        ).count()
-        
+    # {code: (case_completions, correct_completions)} in one grouped query, for all codes or the given ones
+    @staticmethod
+    def case_completion_stats(codes=None):
+        query = db.session.query(
+            ActivityLog.access_code_id,
+            db.func.count(ActivityLog.id),
+            db.func.sum(db.case((ActivityLog.is_correct.is_(True), 1), else_=0))
+        ).filter(ActivityLog.activity_type == 'case_completion')
+        if codes is not None:
+            query = query.filter(ActivityLog.access_code_id.in_(list(codes)))
+        rows = query.group_by(ActivityLog.access_code_id).all()
+        return {code: (int(total or 0), int(correct or 0)) for code, total, correct in rows}
+
+    # pass case_stats from case_completion_stats() when serializing many codes
+    def to_dict(self, case_stats=None):
+        if case_stats is None:
+            case_stats = AccessCode.case_completion_stats([self.code])
+        case_activities, correct_cases = case_stats.get(self.code, (0, 0))
+
         return {
             'code': self.code,
             'status': self.status,
@@ -90,6 +118,9 @@ class AccessCode(db.Model):
 
 class BoundingBoxLog(db.Model):
     __tablename__ = 'bounding_box_logs'
+    __table_args__ = (
+        db.Index('ix_bounding_box_logs_activity', 'activity_log_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     activity_log_id = db.Column(db.Integer, db.ForeignKey('activity_logs.id'), nullable=False)
@@ -111,6 +142,10 @@ class BoundingBoxLog(db.Model):
 
 class ActivityLog(db.Model):
     __tablename__ = 'activity_logs'
+    __table_args__ = (
+        db.Index('ix_activity_logs_code_type_ts', 'access_code_id', 'activity_type', 'timestamp'),
+        db.Index('ix_activity_logs_type_iou', 'activity_type', 'iou_score'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     access_code_id = db.Column(db.String(10), db.ForeignKey('access_codes.code'), nullable=False)
@@ -118,20 +153,35 @@ class ActivityLog(db.Model):
     case_id = db.Column(db.String(50), nullable=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     is_correct = db.Column(db.Boolean, nullable=True)
-    activity_metadata = db.Column(db.Text, nullable=True)
+    activity_metadata = db.Column(JSONDocument, nullable=True)
+    # scalars copied out of activity_metadata whenever it is set, so analytics aggregate them in SQL
+    iou_score = db.Column(db.Float, nullable=True)
+    images_processed = db.Column(db.Integer, nullable=True)
+    session_time_ms = db.Column(db.Integer, nullable=True)
 
     bounding_boxes = db.relationship('BoundingBoxLog', backref='activity', lazy=True)
 
+    @validates('activity_metadata')
+    def _copy_metadata_scalars(self, key, value):
+        metadata = value if isinstance(value, dict) else {}
+        self.iou_score = _as_float(metadata.get('iou_score'))
+        self.images_processed = _as_int(metadata.get('images_processed'))
+        self.session_time_ms = _as_int(metadata.get('session_time_ms'))
+        return value
+
     def set_metadata(self, data):
-        self.activity_metadata = json.dumps(data)
+        self.activity_metadata = data
+
+    # a copy of the stored metadata object; anything that is not an object comes back under 'raw'
+    def metadata_dict(self):
+        if self.activity_metadata is None or self.activity_metadata == '':
+            return {}
+        if isinstance(self.activity_metadata, dict):
+            return dict(self.activity_metadata)
+        return {'raw': self.activity_metadata}
 
     def get_metadata(self):
-        metadata = {}
-        if self.activity_metadata:
-            try:
-                metadata = json.loads(self.activity_metadata)
-            except Exception:
-                metadata = {'raw': self.activity_metadata}
+        metadata = self.metadata_dict()
         if self.bounding_boxes:
             metadata['bounding_boxes'] = {
                 'ground_truth': [box.to_dict() for box in self.bounding_boxes if box.is_ground_truth],
@@ -141,6 +191,12 @@ class ActivityLog(db.Model):
 
 class RadgameReportLog(db.Model):
     __tablename__ = 'radgame_report_logs'
+    # per-user history ordered by time, and the (code, case) lookup for duplicates / rescoring
+    __table_args__ = (
+        db.Index('ix_radgame_report_logs_code_ts', 'access_code_id', 'timestamp'),
+        db.Index('ix_radgame_report_logs_code_sample_ts', 'access_code_id', 'sample_id', 'timestamp'),
+        db.Index('ix_radgame_report_logs_sample_errors', 'sample_id', 'significant_error_count'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     access_code_id = db.Column(db.String(10), db.ForeignKey('access_codes.code'), nullable=False)
@@ -150,16 +206,26 @@ class RadgameReportLog(db.Model):
     llm_feedback = db.Column(db.Text, nullable=True)
     green_score = db.Column(db.Float, nullable=True)
     green_score_std = db.Column(db.Float, nullable=True)
-    green_summary = db.Column(db.Text, nullable=True)
+    green_summary = db.Column(JSONDocument, nullable=True)
     report_cases_completed_snapshot = db.Column(db.Integer, nullable=False, default=0)
     time_spent_ms = db.Column(db.Integer, nullable=False, default=0)
     timer_checkpoint_ms = db.Column(db.Integer, nullable=False, default=0)
+    # counts copied out of green_summary whenever it is set
+    matched_findings_count = db.Column(db.Integer, nullable=True)
+    significant_error_count = db.Column(db.Integer, nullable=True)
+
+    @validates('green_summary')
+    def _copy_summary_scalars(self, key, value):
+        summary = value if isinstance(value, dict) else {}
+        matched = summary.get('matched_findings')
+        errors = summary.get('errors')
+        self.matched_findings_count = len(matched) if isinstance(matched, list) else None
+        self.significant_error_count = (
+            sum(len(v) for v in errors.values() if isinstance(v, list)) if isinstance(errors, dict) else None
+        )
+        return value
 
     def to_dict(self):
-        try:
-            parsed_summary = json.loads(self.green_summary) if self.green_summary else None
-        except Exception:
-            parsed_summary = self.green_summary
         return {
             'id': self.id,
             'access_code_id': self.access_code_id,
@@ -169,7 +235,7 @@ class RadgameReportLog(db.Model):
             'llm_feedback': self.llm_feedback,
             'green_score': self.green_score,
             'green_score_std': self.green_score_std,
-            'green_summary': parsed_summary,
+            'green_summary': self.green_summary,
             'report_cases_completed_snapshot': self.report_cases_completed_snapshot,
             'time_spent_ms': self.time_spent_ms,
             'timer_checkpoint_ms': self.timer_checkpoint_ms
@@ -178,17 +244,44 @@ class RadgameReportLog(db.Model):
 
 class UserCaseLog(db.Model):
     __tablename__ = 'user_case_logs'
+    __table_args__ = (
+        db.Index('ix_user_case_logs_code_ts', 'access_code_id', 'timestamp'),
+        db.Index('ix_user_case_logs_case_iou', 'case_id', 'mean_box_iou'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     access_code_id = db.Column(db.String(10), db.ForeignKey('access_codes.code'), nullable=False)
     case_id = db.Column(db.String(128), nullable=False)
-    selections_json = db.Column(db.Text, nullable=False)
+    # selections object, or 'NA' for cases skipped without a submission
+    selections_json = db.Column(JSONDocument, nullable=False)
     time_spent_ms = db.Column(db.Integer, nullable=False, default=0)
     timer_checkpoint_ms = db.Column(db.Integer, nullable=False, default=0)
     correct_count = db.Column(db.Integer, nullable=False, default=0)
     incorrect_count = db.Column(db.Integer, nullable=False, default=0)
     localize_cases_completed_snapshot = db.Column(db.Integer, nullable=False, default=0)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # user box summary copied out of selections_json whenever it is set
+    user_box_count = db.Column(db.Integer, nullable=True)
+    mean_box_iou = db.Column(db.Float, nullable=True)
+
+    # the scalar columns for a selections document; also used by bulk UPDATEs, which skip @validates
+    @staticmethod
+    def selection_scalars(value):
+        selections = value if isinstance(value, dict) else {}
+        boxes = selections.get('user_boxes')
+        boxes = [b for b in boxes if isinstance(b, dict)] if isinstance(boxes, list) else []
+        ious = [iou for iou in (_as_float(b.get('iou')) for b in boxes) if iou is not None]
+        return {
+            'user_box_count': len(boxes) if isinstance(value, dict) else None,
+            'mean_box_iou': sum(ious) / len(ious) if ious else None,
+        }
+
+    @validates('selections_json')
+    def _copy_selection_scalars(self, key, value):
+        scalars = self.selection_scalars(value)
+        self.user_box_count = scalars['user_box_count']
+        self.mean_box_iou = scalars['mean_box_iou']
+        return value
 
     def to_dict(self):
         return {
@@ -202,4 +295,40 @@ class UserCaseLog(db.Model):
             'incorrect_count': self.incorrect_count,
             'localize_cases_completed_snapshot': self.localize_cases_completed_snapshot,
             'timestamp': self.timestamp.isoformat() if self.timestamp else None
-        }
\ No newline at end of file
+        }
+
+class GradingJob(db.Model):
+    __tablename__ = 'grading_jobs'
+    # worker claim order, and the in-flight job lookup for a (code, case)
+    __table_args__ = (
+        db.Index('ix_grading_jobs_status_created', 'status', 'created_at'),
+        db.Index('ix_grading_jobs_code_sample', 'access_code_id', 'sample_id'),
+    )
+
+    id = db.Column(db.String(36), primary_key=True)
+    access_code_id = db.Column(db.String(10), db.ForeignKey('access_codes.code'), nullable=False)
+    sample_id = db.Column(db.String(128), nullable=False)
+    findings = db.Column(db.Text, nullable=False)
+    time_spent_ms = db.Column(db.Integer, nullable=False, default=0)
+    # queued -> running -> done | failed
+    status = db.Column(db.String(16), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    worker_id = db.Column(db.String(64), nullable=True)
+    result_json = db.Column(JSONDocument, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'case_id': self.sample_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'result': _safe_json_loads(self.result_json),
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import shutil
+import time
+from itertools import groupby
+
+# columnar export of trainee logs for research analysis. the JSON documents
+# (UserCaseLog.selections_json, RadgameReportLog.green_summary, ActivityLog.activity_metadata)
+# are flattened here into typed columns and written as a hive-partitioned Parquet dataset:
+#   <output>/<table>/access_code=<code>/test_type=<type>/part-0.parquet
+# read the whole study with open_dataset() below, pandas.read_parquet or duckdb.
+# run with: python parquet_export.py -o exports/parquet
+
+PRACTICE = 'practice'
+EXPORT_BATCH_SIZE = 1000
+# test-phase tables from the study build; exported as-is when the database has them
+TEST_PHASE_TABLES = ('localize_test_case_logs', 'report_test_case_logs')
+PRACTICE_TABLES = ('localize_cases', 'localize_boxes', 'report_cases', 'activities')
+CRIMSON_ERROR_BUCKETS = ('a', 'b', 'c', 'd')
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("pyarrow not installed. Run: pip install pyarrow")
+    return pa, pq
+
+
+# partition columns (access_code, test_type) live in the directory names, not in the files
+def _schemas(pa):
+    ts = pa.timestamp('us')
+    return {
+        'localize_cases': pa.schema([
+            ('log_id', pa.int64()), ('case_id', pa.string()), ('timestamp', ts),
+            ('time_spent_ms', pa.int64()), ('timer_checkpoint_ms', pa.int64()),
+            ('correct_count', pa.int64()), ('incorrect_count', pa.int64()),
+            ('localize_cases_completed_snapshot', pa.int64()),
+            ('has_selections', pa.bool_()), ('selected_labels', pa.list_(pa.string())),
+            ('nonlocalizable_selected', pa.list_(pa.string())), ('user_box_count', pa.int64()),
+        ]),
+        'localize_boxes': pa.schema([
+            ('log_id', pa.int64()), ('case_id', pa.string()), ('timestamp', ts), ('box_index', pa.int64()),
+            ('label', pa.string()), ('x1', pa.float64()), ('y1', pa.float64()),
+            ('x2', pa.float64()), ('y2', pa.float64()), ('iou', pa.float64()),
+        ]),
+        'report_cases': pa.schema([
+            ('log_id', pa.int64()), ('sample_id', pa.string()), ('timestamp', ts), ('findings', pa.string()),
+            ('green_score', pa.float64()), ('green_score_std', pa.float64()),
+            ('time_spent_ms', pa.int64()), ('timer_checkpoint_ms', pa.int64()),
+            ('report_cases_completed_snapshot', pa.int64()), ('llm_feedback', pa.string()),
+            ('explanation', pa.string()), ('matched_findings', pa.list_(pa.string())),
+            ('matched_findings_count', pa.int64()),
+        ] + [(f'errors_{bucket}', pa.list_(pa.string())) for bucket in CRIMSON_ERROR_BUCKETS]
+          + [(f'errors_{bucket}_count', pa.int64()) for bucket in CRIMSON_ERROR_BUCKETS]),
+        'activities': pa.schema([
+            ('activity_id', pa.int64()), ('activity_type', pa.string()), ('case_id', pa.string()),
+            ('timestamp', ts), ('is_correct', pa.bool_()), ('image_id', pa.string()),
+            ('iou_score', pa.float64()), ('images_processed', pa.int64()), ('session_time_ms', pa.int64()),
+            ('user_box_count', pa.int64()), ('ground_truth_box_count', pa.int64()),
+        ]),
+    }
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _strings(values):
+    return [str(v) for v in (values or []) if v is not None] if isinstance(values, list) else []
+
+
+def _localize_rows(log):
+    selections = log.to_dict()['selections']
+    # 'NA' rows are cases the trainee skipped through without submitting
+    has_selections = isinstance(selections, dict)
+    selections = selections if has_selections else {}
+    user_boxes = [b for b in (selections.get('user_boxes') or []) if isinstance(b, dict)]
+    nonlocalizable = selections.get('nonlocalizable') or {}
+    case_row = {
+        'log_id': log.id,
+        'case_id': log.case_id,
+        'timestamp': log.timestamp,
+        'time_spent_ms': log.time_spent_ms,
+        'timer_checkpoint_ms': log.timer_checkpoint_ms,
+        'correct_count': log.correct_count,
+        'incorrect_count': log.incorrect_count,
+        'localize_cases_completed_snapshot': log.localize_cases_completed_snapshot,
+        'has_selections': has_selections,
+        'selected_labels': _strings(selections.get('localize_selected_labels')),
+        'nonlocalizable_selected': sorted(str(k) for k, v in nonlocalizable.items() if v)
+                                   if isinstance(nonlocalizable, dict) else [],
+        'user_box_count': len(user_boxes),
+    }
+    box_rows = []
+    for i, box in enumerate(user_boxes):
+        coords = box.get('coordinates') or []
+        coords = list(coords) + [None] * (4 - len(coords)) if isinstance(coords, list) else [None] * 4
+        box_rows.append({
+            'log_id': log.id,
+            'case_id': log.case_id,
+            'timestamp': log.timestamp,
+            'box_index': i,
+            'label': box.get('label'),
+            'x1': _float(coords[0]),
+            'y1': _float(coords[1]),
+            'x2': _float(coords[2]),
+            'y2': _float(coords[3]),
+            'iou': _float(box.get('iou')),
+        })
+    return case_row, box_rows
+
+
+def _report_row(log):
+    summary = log.to_dict()['green_summary']
+    summary = summary if isinstance(summary, dict) else {}
+    errors = summary.get('errors') if isinstance(summary.get('errors'), dict) else {}
+    matched = _strings(summary.get('matched_findings'))
+    row = {
+        'log_id': log.id,
+        'sample_id': log.sample_id,
+        'timestamp': log.timestamp,
+        'findings': log.findings,
+        'green_score': log.green_score,
+        'green_score_std': log.green_score_std,
+        'time_spent_ms': log.time_spent_ms,
+        'timer_checkpoint_ms': log.timer_checkpoint_ms,
+        'report_cases_completed_snapshot': log.report_cases_completed_snapshot,
+        'llm_feedback': log.llm_feedback,
+        'explanation': summary.get('explanation') if isinstance(summary.get('explanation'), str) else None,
+        'matched_findings': matched,
+        'matched_findings_count': len(matched),
+    }
+    for bucket in CRIMSON_ERROR_BUCKETS:
+        row[f'errors_{bucket}'] = _strings(errors.get(bucket))
+        row[f'errors_{bucket}_count'] = len(row[f'errors_{bucket}'])
+    return row
+
+
+def _activity_row(activity, metadata):
+    boxes = metadata.get('bounding_boxes') if isinstance(metadata.get('bounding_boxes'), dict) else {}
+    return {
+        'activity_id': activity.id,
+        'activity_type': activity.activity_type,
+        'case_id': activity.case_id,
+        'timestamp': activity.timestamp,
+        'is_correct': activity.is_correct,
+        'image_id': str(metadata['image_id']) if metadata.get('image_id') is not None else None,
+        'iou_score': activity.iou_score,
+        'images_processed': activity.images_processed,
+        'session_time_ms': activity.session_time_ms,
+        'user_box_count': len(boxes.get('user_submission') or []),
+        'ground_truth_box_count': len(boxes.get('ground_truth') or []),
+    }
+
+
+class PartitionedWriter:
+    def __init__(self, output_dir, schemas):
+        self.output_dir = output_dir
+        self.schemas = schemas
+        self.counts = {}
+        self.files = 0
+        self._pa, self._pq = _pyarrow()
+
+    # drop partitions a previous run left behind: the whole table, or only the given codes
+    def clear(self, table_name, codes=None):
+        table_dir = os.path.join(self.output_dir, table_name)
+        targets = [table_dir] if codes is None else [os.path.join(table_dir, f"access_code={code}") for code in codes]
+        for target in targets:
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+
+    def write(self, table_name, access_code, test_type, rows, schema=None):
+        if not rows:
+            return
+        schema = schema or self.schemas[table_name]
+        part_dir = os.path.join(self.output_dir, table_name, f"access_code={access_code}", f"test_type={test_type}")
+        os.makedirs(part_dir, exist_ok=True)
+        table = self._pa.Table.from_pylist(rows, schema=schema)
+        self._pq.write_table(table, os.path.join(part_dir, 'part-0.parquet'))
+        self.counts[table_name] = self.counts.get(table_name, 0) + len(rows)
+        self.files += 1
+
+
+def _by_code(query, batch_size):
+    return groupby(query.yield_per(batch_size), key=lambda row: row.access_code_id)
+
+
+def _test_phase_schema(pa, inspector, table_name):
+    from sqlalchemy import Boolean, Float, Integer
+    fields = []
+    for column in inspector.get_columns(table_name):
+        if column['name'] in ('access_code_id', 'test_type'):
+            continue
+        col_type = column['type']
+        if isinstance(col_type, Boolean):
+            pa_type = pa.bool_()
+        elif isinstance(col_type, Integer):
+            pa_type = pa.int64()
+        elif isinstance(col_type, Float):
+            pa_type = pa.float64()
+        else:
+            pa_type = pa.string()
+        fields.append((column['name'], pa_type))
+    return pa.schema(fields)
+
+
+def _coerce(value, pa_type, pa):
+    if value is None:
+        return None
+    if pa_type == pa.string():
+        return value if isinstance(value, str) else str(value)
+    if pa_type == pa.bool_():
+        return bool(value)
+    if pa_type == pa.int64():
+        return _int(value)
+    return _float(value)
+
+
+def export_parquet(output_dir, codes=None, batch_size=EXPORT_BATCH_SIZE):
+    """Write the partitioned dataset under output_dir; must run inside an app context.
+
+    codes limits the export to those access codes. Partitions from earlier runs are replaced:
+    every table is cleared first, or only the selected codes' partitions. Returns row counts per table.
+    """
+    from sqlalchemy import inspect, text
+    from app import _iter_activities_with_metadata
+    from models import db, ActivityLog, RadgameReportLog, UserCaseLog
+
+    pa, _ = _pyarrow()
+    writer = PartitionedWriter(output_dir, _schemas(pa))
+    codes = list(codes) if codes is not None else None
+    for table_name in PRACTICE_TABLES + TEST_PHASE_TABLES:
+        writer.clear(table_name, codes)
+    if codes is not None and not codes:
+        return writer.counts
+
+    def _scoped(model):
+        query = model.query
+        if codes is not None:
+            query = query.filter(model.access_code_id.in_(list(codes)))
+        return query.order_by(model.access_code_id, model.id)
+
+    for code, logs in _by_code(_scoped(UserCaseLog), batch_size):
+        case_rows, box_rows = [], []
+        for log in logs:
+            case_row, boxes = _localize_rows(log)
+            case_rows.append(case_row)
+            box_rows.extend(boxes)
+        writer.write('localize_cases', code, PRACTICE, case_rows)
+        writer.write('localize_boxes', code, PRACTICE, box_rows)
+
+    for code, logs in _by_code(_scoped(RadgameReportLog), batch_size):
+        writer.write('report_cases', code, PRACTICE, [_report_row(log) for log in logs])
+
+    activity_pairs = _iter_activities_with_metadata(_scoped(ActivityLog), batch_size)
+    for code, pairs in groupby(activity_pairs, key=lambda pair: pair[0].access_code_id):
+        writer.write('activities', code, PRACTICE, [_activity_row(a, m) for a, m in pairs])
+
+    inspector = inspect(db.engine)
+    existing = set(inspector.get_table_names())
+    for table_name in TEST_PHASE_TABLES:
+        if table_name not in existing:
+            continue
+        schema = _test_phase_schema(pa, inspector, table_name)
+        has_test_type = 'test_type' in {c['name'] for c in inspector.get_columns(table_name)}
+        sql = f"SELECT * FROM {table_name}"
+        params = {}
+        if codes is not None:
+            names = [f"c{i}" for i in range(len(codes))]
+            sql += f" WHERE access_code_id IN ({', '.join(':' + n for n in names)})"
+            params = dict(zip(names, codes))
+        sql += " ORDER BY access_code_id" + (", test_type" if has_test_type else "")
+        result = db.session.execute(text(sql), params).mappings()
+
+        def _partition(row):
+            return row['access_code_id'], (row['test_type'] if has_test_type else 'test')
+
+        for (code, test_type), rows in groupby(result, key=_partition):
+            writer.write(table_name, code, test_type or 'unknown', [
+                {field.name: _coerce(row.get(field.name), field.type, pa) for field in schema} for row in rows
+            ], schema)
+    return writer.counts
+
+
+# open one exported table as a pyarrow dataset, keeping access codes as strings
+def open_dataset(output_dir, table_name):
+    pa, _ = _pyarrow()
+    import pyarrow.dataset as ds
+    partitioning = ds.partitioning(pa.schema([('access_code', pa.string()), ('test_type', pa.string())]), flavor='hive')
+    return ds.dataset(os.path.join(output_dir, table_name), format='parquet', partitioning=partitioning)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export trainee logs as a partitioned Parquet dataset')
+    parser.add_argument('-o', '--output', default=os.path.join('exports', 'parquet'), help='Output directory')
+    parser.add_argument('--code', action='append', help='Only export this access code (repeatable)')
+    parser.add_argument('--clean', action='store_true', help='Remove the whole output directory first, not just the partitions being rewritten')
+    args = parser.parse_args()
+
+    import app as radgame
+    flask_app = radgame.create_app()
+    if args.clean and os.path.isdir(args.output):
+        shutil.rmtree(args.output)
+    started = time.perf_counter()
+    with flask_app.app_context():
+        try:
+            counts = export_parquet(args.output, codes=args.code)
+        except ImportError as err:
+            raise SystemExit(str(err))
+    summary = ', '.join(f"{name}={count}" for name, count in sorted(counts.items())) or 'no rows'
+    print(f"Parquet export to {args.output} in {time.perf_counter() - started:.2f}s: {summary}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import bindparam, select, update
+
+from config import LOCALIZE_IOU_THRESHOLD, LOCALIZE_MATCHER
+from models import db, UserCaseLog
+from scores.localize_score import MATCHERS
+
+# re-scores historical localize case logs (user_case_logs.selections_json) against the current
+# ground truth.
+#   compare: report how many cases a different matcher or IoU threshold would change
+#   rescore: write the current matcher / threshold's counts and per-box IoUs back to the table
+
+CHUNK_SIZE = 1000
+
+
+# user_case_logs rows (id, case_id, selections, correct, incorrect) in id order, one keyset chunk at a time
+def iter_case_logs(chunk_size=CHUNK_SIZE, after_id=0):
+    last_id = after_id
+    while True:
+        rows = db.session.execute(
+            select(UserCaseLog.id, UserCaseLog.case_id, UserCaseLog.selections_json,
+                   UserCaseLog.correct_count, UserCaseLog.incorrect_count)
+            .where(UserCaseLog.id > last_id).order_by(UserCaseLog.id).limit(chunk_size)
+        ).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+
+# score every case log with the baseline and candidate settings; returns (stats, changed examples).
+# skipped cases (selections stored as 'NA') are counted but not scored
+def compare_matchers(baseline='greedy', candidate='optimal', iou_thresh=0.3, candidate_iou_thresh=None,
+                     chunk_size=CHUNK_SIZE, max_examples=10):
+    import app as radgame
+    if candidate_iou_thresh is None:
+        candidate_iou_thresh = iou_thresh
+    stats = Counter()
+    examples = []
+    for rows in iter_case_logs(chunk_size):
+        scored = [row for row in rows if isinstance(row.selections_json, dict)]
+        stats['skipped'] += len(rows) - len(scored)
+        items = [(row.case_id, row.selections_json) for row in scored]
+        before = radgame._compute_case_scores_batch(items, iou_thresh, baseline)
+        started = time.perf_counter()
+        after = radgame._compute_case_scores_batch(items, candidate_iou_thresh, candidate)
+        stats['candidate_ms'] += (time.perf_counter() - started) * 1000
+        for row, old, new in zip(scored, before, after):
+            stats['cases'] += 1
+            if (row.correct_count, row.incorrect_count) != old[:2]:
+                stats['stored_differs'] += 1
+            if old[:2] == new[:2]:
+                continue
+            stats['changed'] += 1
+            stats['correct_up' if new[0] > old[0] else 'correct_down' if new[0] < old[0] else 'incorrect_only'] += 1
+            if len(examples) < max_examples:
+                examples.append({'id': row.id, 'case_id': row.case_id, 'before': old[:2], 'after': new[:2]})
+    return stats, examples
+
+
+# runs in the worker processes: re-score one chunk of (id, case_id, selections, correct, incorrect)
+# and return (rows scored, [(id, case_id, old counts, new counts, enriched boxes)] for rows that changed)
+def _score_chunk(rows, matcher, iou_thresh):
+    import app as radgame
+    scores = radgame._compute_case_scores_batch([(case_id, selections) for _, case_id, selections, _, _ in rows],
+                                                iou_thresh, matcher)
+    changes = []
+    for (row_id, case_id, selections, correct, incorrect), (new_correct, new_incorrect, boxes) in zip(rows, scores):
+        if (new_correct, new_incorrect) != (correct, incorrect) or boxes != (selections.get('user_boxes') or []):
+            changes.append((row_id, case_id, (correct, incorrect), (new_correct, new_incorrect), boxes))
+    return len(rows), changes
+
+
+# one executemany UPDATE for a chunk's changed rows; selections_json keeps everything but the
+# re-scored user_boxes, and the scalar columns are filled as UserCaseLog's @validates would
+def _write_changes(changes, selections_by_id):
+    if not changes:
+        return 0
+    table = UserCaseLog.__table__
+    stmt = update(table).where(table.c.id == bindparam('b_id')).values(
+        correct_count=bindparam('b_correct'),
+        incorrect_count=bindparam('b_incorrect'),
+        selections_json=bindparam('b_selections'),
+        user_box_count=bindparam('b_user_box_count'),
+        mean_box_iou=bindparam('b_mean_box_iou'),
+    )
+    params = []
+    for row_id, _, _, (correct, incorrect), boxes in changes:
+        selections = dict(selections_by_id[row_id], user_boxes=boxes)
+        scalars = UserCaseLog.selection_scalars(selections)
+        params.append({
+            'b_id': row_id, 'b_correct': correct, 'b_incorrect': incorrect, 'b_selections': selections,
+            'b_user_box_count': scalars['user_box_count'], 'b_mean_box_iou': scalars['mean_box_iou'],
+        })
+    db.session.execute(stmt, params)
+    return len(params)
+
+
+def _load_checkpoint(path, matcher, iou_thresh):
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('matcher') != matcher or checkpoint.get('iou_thresh') != iou_thresh:
+        raise ValueError(f"Checkpoint {path} is for matcher={checkpoint.get('matcher')} "
+                         f"iou_thresh={checkpoint.get('iou_thresh')}, not matcher={matcher} iou_thresh={iou_thresh}")
+    return checkpoint
+
+
+# written after every committed chunk (tmp file + rename, so a crash never leaves half a checkpoint)
+def _save_checkpoint(path, matcher, iou_thresh, last_id, stats):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'matcher': matcher, 'iou_thresh': iou_thresh, 'last_id': last_id,
+                   'stats': dict(stats), 'updated_at': datetime.utcnow().isoformat()}, f)
+    os.replace(tmp_path, path)
+
+
+# re-score user_case_logs with the given matcher / threshold and write changed rows back.
+# chunks are read in id order and scored by `workers` processes (inline when workers <= 1) while
+# the next chunks are read; results are written in id order, one UPDATE batch and commit per chunk.
+# dry_run writes nothing and reports every changed row to on_diff(id, case_id, old, new) instead.
+# with a checkpoint path, the last committed id is recorded per chunk and resume continues after it.
+def rescore_case_logs(matcher=LOCALIZE_MATCHER, iou_thresh=LOCALIZE_IOU_THRESHOLD, chunk_size=CHUNK_SIZE,
+                      workers=1, dry_run=False, checkpoint_path=None, resume=False, on_diff=None):
+    import app as radgame
+    if matcher not in MATCHERS:
+        raise ValueError(f"Unknown matcher: {matcher} (expected one of {', '.join(MATCHERS)})")
+    stats = Counter()
+    after_id = 0
+    if resume and checkpoint_path and os.path.exists(checkpoint_path):
+        checkpoint = _load_checkpoint(checkpoint_path, matcher, iou_thresh)
+        after_id = checkpoint['last_id']
+        stats.update(checkpoint.get('stats', {}))
+        print(f"[Rescore] Resuming after case log {after_id}")
+    # load the case index before the pool starts so forked workers inherit it
+    radgame.cases.localize_cases_map
+
+    def finish(last_id, selections_by_id, scored, changes):
+        stats['scored'] += scored
+        stats['changed'] += len(changes)
+        stats['counts_changed'] += sum(1 for change in changes if change[2] != change[3])
+        for row_id, case_id, old, new, _ in changes:
+            if on_diff and old != new:
+                on_diff(row_id, case_id, old, new)
+        if not dry_run:
+            stats['updated'] += _write_changes(changes, selections_by_id)
+            db.session.commit()
+            if checkpoint_path:
+                _save_checkpoint(checkpoint_path, matcher, iou_thresh, last_id, stats)
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    pending = deque()
+    try:
+        for rows in iter_case_logs(chunk_size, after_id):
+            scored = [tuple(row) for row in rows if isinstance(row.selections_json, dict)]
+            stats['skipped'] += len(rows) - len(scored)
+            selections_by_id = {row[0]: row[2] for row in scored}
+            if executor is None:
+                finish(rows[-1].id, selections_by_id, *_score_chunk(scored, matcher, iou_thresh))
+                continue
+            pending.append((rows[-1].id, selections_by_id, executor.submit(_score_chunk, scored, matcher, iou_thresh)))
+            # keep a couple of chunks queued per worker without reading the whole table ahead
+            while len(pending) > workers * 2:
+                last_id, selections_by_id, future = pending.popleft()
+                finish(last_id, selections_by_id, *future.result())
+        while pending:
+            last_id, selections_by_id, future = pending.popleft()
+            finish(last_id, selections_by_id, *future.result())
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    return stats
+
+
+def _print_compare(args, stats, examples, elapsed):
+    cases = stats['cases']
+    candidate_thresh = args.iou_thresh if args.candidate_iou_thresh is None else args.candidate_iou_thresh
+    print(f"Re-scored {cases} case logs in {elapsed:.2f}s ({stats['skipped']} skipped without a submission)")
+    if not cases:
+        return
+    print(f"{args.baseline}@{args.iou_thresh} -> {args.candidate}@{candidate_thresh}: "
+          f"{stats['changed']} changed ({stats['changed'] / cases:.2%})")
+    print(f"  more correct: {stats['correct_up']}, fewer correct: {stats['correct_down']}, "
+          f"incorrect count only: {stats['incorrect_only']}")
+    print(f"  stored counts differ from {args.baseline}@{args.iou_thresh}: {stats['stored_differs']}")
+    print(f"  {args.candidate} scoring: {stats['candidate_ms'] / cases * 1000:.1f} us/case")
+    for example in examples:
+        print(f"  log {example['id']} {example['case_id']}: "
+              f"correct/incorrect {example['before'][0]}/{example['before'][1]} -> {example['after'][0]}/{example['after'][1]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-score historical localize case logs')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    compare = commands.add_parser('compare', help='Report how many cases another matcher or threshold would change')
+    compare.add_argument('--baseline', choices=sorted(MATCHERS), default='greedy', help='Matcher the cases are compared against')
+    compare.add_argument('--candidate', choices=sorted(MATCHERS), default='optimal', help='Matcher to evaluate')
+    compare.add_argument('--iou-thresh', type=float, default=LOCALIZE_IOU_THRESHOLD, help='IoU threshold for the baseline')
+    compare.add_argument('--candidate-iou-thresh', type=float, help='IoU threshold for the candidate (default: --iou-thresh)')
+    compare.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Case logs scored per batch')
+    compare.add_argument('--examples', type=int, default=10, help='Changed cases to list')
+
+    rescore = commands.add_parser('rescore', help='Write re-scored counts and box IoUs back to user_case_logs')
+    rescore.add_argument('--matcher', choices=sorted(MATCHERS), default=LOCALIZE_MATCHER,
+                         help='Box matcher (default: RADGAME_LOCALIZE_MATCHER)')
+    rescore.add_argument('--iou-thresh', type=float, default=LOCALIZE_IOU_THRESHOLD,
+                         help='IoU threshold (default: RADGAME_LOCALIZE_IOU_THRESHOLD)')
+    rescore.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Case logs per batch / UPDATE')
+    rescore.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Scoring processes (1 = inline)')
+    rescore.add_argument('--dry-run', action='store_true', help='Report the changes without writing them')
+    rescore.add_argument('--diff-out', help='Write every changed count as a JSON line to this file')
+    rescore.add_argument('--max-diffs', type=int, default=20, help='Changed counts to print')
+    rescore.add_argument('--checkpoint', help='Record progress here after each committed chunk')
+    rescore.add_argument('--resume', action='store_true', help='Continue after the id recorded in --checkpoint')
+    args = parser.parse_args()
+    if getattr(args, 'resume', False) and not args.checkpoint:
+        parser.error('--resume needs --checkpoint')
+
+    import app as radgame
+    flask_app = radgame.create_app()
+    started = time.perf_counter()
+    if args.command == 'compare':
+        with flask_app.app_context():
+            stats, examples = compare_matchers(args.baseline, args.candidate, args.iou_thresh,
+                                               args.candidate_iou_thresh, args.chunk_size, args.examples)
+        _print_compare(args, stats, examples, time.perf_counter() - started)
+        return
+
+    diff_file = open(args.diff_out, 'w') if args.diff_out else None
+    printed = Counter()
+
+    def on_diff(row_id, case_id, old, new):
+        if diff_file:
+            diff_file.write(json.dumps({'id': row_id, 'case_id': case_id, 'correct': [old[0], new[0]],
+                                        'incorrect': [old[1], new[1]]}) + '\n')
+        if printed['diffs'] < args.max_diffs:
+            printed['diffs'] += 1
+            print(f"  log {row_id} {case_id}: correct/incorrect {old[0]}/{old[1]} -> {new[0]}/{new[1]}")
+
+    try:
+        with flask_app.app_context():
+            stats = rescore_case_logs(args.matcher, args.iou_thresh, args.chunk_size, args.workers,
+                                      args.dry_run, args.checkpoint, args.resume, on_diff)
+    except ValueError as err:
+        raise SystemExit(str(err))
+    finally:
+        if diff_file:
+            diff_file.close()
+    elapsed = time.perf_counter() - started
+    print(f"{'Dry run: ' if args.dry_run else ''}{stats['scored']} case logs re-scored with "
+          f"{args.matcher}@{args.iou_thresh} in {elapsed:.2f}s ({stats['skipped']} skipped without a submission)")
+    print(f"  counts changed: {stats['counts_changed']}, box IoUs only: {stats['changed'] - stats['counts_changed']}")
+    if args.dry_run:
+        print(f"  rows that would be updated: {stats['changed']}")
+    else:
+        print(f"  rows updated: {stats['updated']}")
+
+
+if __name__ == "__main__":
+    main()
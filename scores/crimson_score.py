@@ -0,0 +1,227 @@
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+
+import json
+import re
+
+from scores.grade_cache import GradeCache, make_grade_key
+from scores.llm_backend import deadline_client, default_llm_client
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+CRIMSON_MODEL = "o3"
+# bump whenever the prompt text changes so cached grades are not reused
+CRIMSON_PROMPT_VERSION = "crimson-v1"
+CRIMSON_SYSTEM_PROMPT = "You are a helpful assistant that provides radiology report grades."
+
+ERROR_BUCKETS = ('a', 'b', 'c', 'd')
+
+
+def build_crimson_prompt(reference: str, hypothesis: str, age_str: str, indication_str: str) -> str:
+    return (f'''
+                Objective:
+
+                Evaluate the accuracy of a candidate radiology report in comparison to a reference
+                radiology report composed by expert radiologists. Only include positive findings, not normal findings. 
+                Do not include notes unrelated to clinical findings. 
+                
+                Process Overview:
+                You will be presented with:
+                1. The criteria for making a judgment.
+                2. The reference radiology report.
+                3. The candidate radiology report.
+                4. The desired format for your assessment.
+                
+                1. Criteria for Judgment:
+                For each candidate report, determine only the clinically significant errors.
+
+                Errors can fall into one of these categories:
+                    a) False report of a finding in the candidate.
+                    b) Missing a finding present in the reference.
+                    c) Misidentification of a finding's anatomic location/position.
+                    d) Misassessment of the severity of a finding.
+
+                Note: Concentrate on the clinical findings rather than the report's writing style.
+                Evaluate only the findings that appear in both reports. 
+                
+                Patient Context:
+                    Age: {age_str}
+                    Indication: {indication_str}
+
+                IMPORTANT NOTES: 
+                    - Evaluate only positive findings, not normal findings. If a finding is normal, it should not be counted in the errors.
+                    - Ignore all references to prior findings and studies. DO NOT COUNT THEM AS ERRORS.
+                    - Do NOT penalize the candidate report for omitting specific numeric measurements (e.g., size or dimensions of a nodule/lesion) if the underlying finding is correctly identified. Missing measurements alone is fine since the user writing the candidate report can't measure. They should only be penalized for missing the finding itself.
+                    - Do NOT penalize omission of age-appropriate findings that are NOT clinically significant in the context of the indication and patient age.
+                    - Do NOT hallucinate or infer findings absent from both reports.
+             
+                2. Reference Report:
+                {reference}
+           
+                3. Candidate Report:
+                {hypothesis}
+            
+                4. Reporting Your Assessment:
+                Format your output as a JSON. Follow this specific format for your output, even if no errors are found:
+                ```
+                {{
+                    "Explanation": "<Explanation>",
+                    "ClinicallySignificantErrors": {{
+                        "a": ["<Error 1>", "<Error 2>", "...", "<Error n>"],
+                        "b": ["<Error 1>", "<Error 2>", "...", "<Error n>"],
+                        "c": ["<Error 1>", "<Error 2>", "...", "<Error n>"],
+                        "d": ["<Error 1>", "<Error 2>", "...", "<Error n>"]
+                    }},
+                    "MatchedFindings": ["<Finding 1>", "<Finding 2>", "...", "<Finding n>"]
+                }}
+                '''
+    )
+
+
+# normalize error buckets to arrays and compute GREEN score from matched findings and errors
+def parse_crimson_response(response_data: Dict[str, Any]) -> Dict[str, Any]:
+    raw_errors = response_data.get('ClinicallySignificantErrors') or {}
+    errors = {k: list(raw_errors.get(k, []) or []) for k in ERROR_BUCKETS}
+    matched_findings: List[str] = list(response_data.get('MatchedFindings') or [])
+
+    total_matched = len(matched_findings)
+    total_sig_errors = sum(len(errors[k]) for k in ERROR_BUCKETS)
+    if total_sig_errors == 0:
+        green_score = 1.0
+    else:
+        green_score = total_matched / (total_matched + total_sig_errors)
+
+    return {
+        'summary': response_data.get('Explanation'),
+        'errors': errors,
+        'matched_findings': matched_findings,
+        'green_score': green_score,
+        'green_score_std': 1 - green_score,  # std_score is the inverse of green_score
+        'raw_model_json': response_data
+    }
+
+
+def get_crimson_score(candidate_findings: str, reference_findings: str, age_str: str, indication_str: str,
+                      openai_client: Optional["OpenAI"] = None, timeout: Optional[float] = None,
+                      cache: Optional[GradeCache] = None) -> Dict[str, Any]:
+    openai_client = openai_client or default_llm_client()
+
+    cache_key = None
+    if cache is not None:
+        cache_key = make_grade_key(candidate_findings, reference_findings, age_str, indication_str,
+                                   CRIMSON_PROMPT_VERSION, CRIMSON_MODEL)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return parse_crimson_response(cached)
+
+    prompt = build_crimson_prompt(
+        f"Findings: {reference_findings}",
+        f"Findings: {candidate_findings}",
+        age_str,
+        indication_str
+    )
+
+    request_options = {"timeout": timeout} if timeout is not None else {}
+    completion = deadline_client(openai_client, timeout).chat.completions.create(
+        model=CRIMSON_MODEL,
+        messages=[
+            {"role": "system", "content": CRIMSON_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        response_format={"type": "json_object"},
+        **request_options
+    )
+
+    print(f"OpenAI completion response: {completion.choices[0].message.content}")
+    response_data = json.loads(completion.choices[0].message.content)
+    if cache is not None:
+        cache.put(cache_key, response_data, CRIMSON_PROMPT_VERSION, CRIMSON_MODEL)
+    return parse_crimson_response(response_data)
+
+
+_EXPLANATION_RE = re.compile(r'"Explanation"\s*:\s*"((?:[^"\\]|\\.)*)(")?', re.S)
+_PARTIAL_UNICODE_ESCAPE_RE = re.compile(r'\\u[0-9a-fA-F]{0,3}$')
+
+
+# pulls the Explanation string out of a JSON document that is still being streamed
+class ExplanationExtractor:
+    def __init__(self):
+        self.buffer = ''
+        self.emitted = 0
+        self.done = False
+
+    def feed(self, delta: str) -> str:
+        if self.done:
+            return ''
+        self.buffer += delta
+        match = _EXPLANATION_RE.search(self.buffer)
+        if not match:
+            return ''
+        raw = _PARTIAL_UNICODE_ESCAPE_RE.sub('', match.group(1))
+        try:
+            text = json.loads(f'"{raw}"')
+        except ValueError:
+            return ''
+        if match.group(2):
+            self.done = True
+        new_text = text[self.emitted:]
+        self.emitted = len(text)
+        return new_text
+
+
+def stream_crimson_score(candidate_findings: str, reference_findings: str, age_str: str, indication_str: str,
+                         openai_client: Optional["OpenAI"] = None, timeout: Optional[float] = None,
+                         cache: Optional[GradeCache] = None) -> Iterator[Tuple[str, Any]]:
+    """Yield ('explanation', text) as the model streams, then ('grade', grade)."""
+    openai_client = openai_client or default_llm_client()
+
+    cache_key = None
+    if cache is not None:
+        cache_key = make_grade_key(candidate_findings, reference_findings, age_str, indication_str,
+                                   CRIMSON_PROMPT_VERSION, CRIMSON_MODEL)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            grade = parse_crimson_response(cached)
+            if grade['summary']:
+                yield 'explanation', grade['summary']
+            yield 'grade', grade
+            return
+
+    prompt = build_crimson_prompt(
+        f"Findings: {reference_findings}",
+        f"Findings: {candidate_findings}",
+        age_str,
+        indication_str
+    )
+
+    request_options = {"timeout": timeout} if timeout is not None else {}
+    stream = deadline_client(openai_client, timeout).chat.completions.create(
+        model=CRIMSON_MODEL,
+        messages=[
+            {"role": "system", "content": CRIMSON_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        response_format={"type": "json_object"},
+        stream=True,
+        **request_options
+    )
+
+    parts = []
+    extractor = ExplanationExtractor()
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content or ''
+        if not delta:
+            continue
+        parts.append(delta)
+        text = extractor.feed(delta)
+        if text:
+            yield 'explanation', text
+
+    content = ''.join(parts)
+    print(f"OpenAI completion response: {content}")
+    response_data = json.loads(content)
+    if cache is not None:
+        cache.put(cache_key, response_data, CRIMSON_PROMPT_VERSION, CRIMSON_MODEL)
+    yield 'grade', parse_crimson_response(response_data)
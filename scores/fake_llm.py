@@ -0,0 +1,128 @@
+import hashlib
+import json
+import re
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+from scores.crimson_score import CRIMSON_SYSTEM_PROMPT, ERROR_BUCKETS
+from scores.style_score import STYLE_SYSTEM_PROMPT
+
+
+# deterministic stand-in for the OpenAI client used by grading workers and tests.
+# exposes the same chat.completions.create(...) surface and returns schema-valid
+# CRIMSON / StyleScore JSON derived from a digest of the prompt.
+
+# prompts sent by generate_report_dataset.py. that script pulls in pandas, so the
+# markers are repeated here rather than imported; keep them in sync.
+FINDINGS_SYSTEM_PROMPT = "You are an AI assistant acting as an X-ray radiologist."
+TRIAGE_INSTRUCTION = "Respond with exactly KEEP or REMOVE."
+
+_REPORT_RE = re.compile(r"REPORT: <(.*)>", re.DOTALL)
+_NEGATIVE_RE = re.compile(r"^(no|normal|negative|unremarkable|clear)\b", re.IGNORECASE)
+_PRIOR_RE = re.compile(r"\b(prior|previous|compared|comparison|unchanged|again noted|interval|stable)\b", re.IGNORECASE)
+
+def _digest(text: str) -> bytes:
+    return hashlib.sha256((text or '').encode('utf-8')).digest()
+
+
+def fake_crimson_response(prompt: str) -> Dict[str, Any]:
+    d = _digest(prompt)
+    matched = [f"Finding {i + 1}" for i in range(d[0] % 4)]
+    errors: Dict[str, List[str]] = {k: [] for k in ERROR_BUCKETS}
+    for i in range(d[1] % 3):
+        bucket = ERROR_BUCKETS[d[2 + i] % len(ERROR_BUCKETS)]
+        errors[bucket].append(f"Error {i + 1}")
+    return {
+        "Explanation": f"Deterministic grade: {len(matched)} matched finding(s), "
+                       f"{sum(len(v) for v in errors.values())} clinically significant error(s).",
+        "ClinicallySignificantErrors": errors,
+        "MatchedFindings": matched
+    }
+
+
+def fake_style_response(prompt: str) -> Dict[str, Any]:
+    d = _digest(prompt)
+    levels = (0, 0.5, 1)
+    systematic = levels[d[0] % 3]
+    organization = levels[d[1] % 3]
+    return {
+        "systematic_evaluation_score": systematic,
+        "organization_language_score": organization,
+        "systematic_evaluation_recommendation": "" if systematic == 1 else "Review each major chest region in turn.",
+        "organization_language_recommendation": "" if organization == 1 else "Use complete sentences and clinical terms."
+    }
+
+
+# positive findings are the report sentences that don't read as negatives
+def fake_findings_response(prompt: str) -> List[str]:
+    m = _REPORT_RE.search(prompt)
+    sentences = [x.strip() for x in re.split(r"[.\n]", m.group(1) if m else '') if x.strip()]
+    return [x for x in sentences if not _NEGATIVE_RE.match(x)]
+
+
+def fake_triage_response(prompt: str) -> str:
+    findings = prompt.split("Findings:", 1)[-1]
+    return "REMOVE" if _PRIOR_RE.search(findings) else "KEEP"
+
+
+# routes on the exact prompts each caller sends, so unrelated text that merely
+# mentions grading never gets a CRIMSON answer
+def fake_response_for(messages: List[Dict[str, str]]) -> Any:
+    systems = [m.get('content', '') for m in messages if m.get('role') == 'system']
+    prompt = "\n".join(m.get('content', '') for m in messages if m.get('role') != 'system')
+    if STYLE_SYSTEM_PROMPT in systems:
+        return fake_style_response(prompt)
+    if CRIMSON_SYSTEM_PROMPT in systems:
+        return fake_crimson_response(prompt)
+    if FINDINGS_SYSTEM_PROMPT in systems:
+        return fake_findings_response(prompt)
+    if TRIAGE_INSTRUCTION in prompt:
+        return fake_triage_response(prompt)
+    raise ValueError("fake LLM backend does not recognise this prompt")
+
+
+# message content as the API would return it: JSON for structured answers, bare text otherwise
+def fake_content_for(messages: List[Dict[str, str]]) -> str:
+    response = fake_response_for(messages)
+    return response if isinstance(response, str) else json.dumps(response)
+
+
+def _completion(content: str, model: str):
+    message = SimpleNamespace(role='assistant', content=content)
+    return SimpleNamespace(model=model, choices=[SimpleNamespace(index=0, message=message, finish_reason='stop')])
+
+
+def _stream_chunks(content: str, model: str, latency_s: float, chunk_size: int):
+    pieces = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)] or ['']
+    for piece in pieces:
+        if latency_s:
+            time.sleep(latency_s / len(pieces))
+        delta = SimpleNamespace(role='assistant', content=piece)
+        yield SimpleNamespace(model=model, choices=[SimpleNamespace(index=0, delta=delta, finish_reason=None)])
+
+
+class _FakeCompletions:
+    def __init__(self, owner: "FakeLLMClient"):
+        self._owner = owner
+
+    def create(self, model: str = "o3", messages=None, stream: bool = False, **kwargs):
+        self._owner.calls += 1
+        content = fake_content_for(messages or [])
+        if stream:
+            return _stream_chunks(content, model, self._owner.latency_s, self._owner.stream_chunk_size)
+        if self._owner.latency_s:
+            time.sleep(self._owner.latency_s)
+        return _completion(content, model)
+
+
+class FakeLLMClient:
+    def __init__(self, latency_s: float = 0.0, stream_chunk_size: int = 8):
+        self.latency_s = latency_s
+        self.stream_chunk_size = stream_chunk_size
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=_FakeCompletions(self))
+
+    # mirrors OpenAI.with_options; nothing here retries or times out
+    def with_options(self, **kwargs) -> "FakeLLMClient":
+        return self
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# content-addressed cache for LLM grades, shared by the web app and the study
+# export scripts. keys are a stable digest of everything that determines the
+# grade, so identical reports for the same case are answered without an API call.
+
+
+def normalize_report_text(text: Any) -> str:
+    if text is None:
+        return ''
+    return ' '.join(str(text).split()).lower()
+
+
+def exact_report_text(text: Any) -> str:
+    return '' if text is None else str(text).strip()
+
+
+# normalize=False keys on the exact text (only trimmed), for grades that depend on formatting
+def make_grade_key(candidate: Any, reference: Any, age: Any, indication: Any, prompt_version: str, model: str,
+                   normalize: bool = True) -> str:
+    clean = normalize_report_text if normalize else exact_report_text
+    parts = [
+        clean(candidate),
+        clean(reference),
+        clean(age),
+        clean(indication),
+        prompt_version,
+        model
+    ]
+    return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+
+# lookups should not take sqlite's write lock, which is shared by every process using the file:
+# last_used_at (and the per-row hit count) is only refreshed once it is this stale, hit/miss
+# counters are kept in memory and flushed at most this often, and eviction runs every N puts
+TOUCH_INTERVAL_S = 60.0
+STATS_FLUSH_INTERVAL_S = 30.0
+EVICT_EVERY_PUTS = 100
+
+
+class GradeCache:
+    def __init__(self, path: str, max_entries: int = 50000, ttl_seconds: Optional[float] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._pending: Dict[str, int] = {}
+        self._last_flush = time.time()
+        self._puts = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS grades ("
+            " key TEXT PRIMARY KEY,"
+            " prompt_version TEXT NOT NULL,"
+            " model TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_used_at REAL NOT NULL,"
+            " hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_grades_last_used ON grades (last_used_at)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL DEFAULT 0)")
+
+    def _bump(self, name: str, amount: int = 1):
+        self._pending[name] = self._pending.get(name, 0) + amount
+
+    # write the in-memory counters to the stats table; caller holds the lock
+    def _flush_stats(self, now: float):
+        pending = [(name, value) for name, value in self._pending.items() if value]
+        self._pending = {}
+        self._last_flush = now
+        if pending:
+            self._conn.executemany(
+                "INSERT INTO stats (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                pending
+            )
+
+    def _maybe_flush_stats(self, now: float):
+        if now - self._last_flush >= STATS_FLUSH_INTERVAL_S:
+            self._flush_stats(now)
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return bool(self.ttl_seconds) and (now - created_at) > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT payload, created_at, last_used_at FROM grades WHERE key = ?",
+                                     (key,)).fetchone()
+            if row and self._expired(row[1], now):
+                self._conn.execute("DELETE FROM grades WHERE key = ?", (key,))
+                row = None
+            if not row:
+                self._bump('misses')
+                self._maybe_flush_stats(now)
+                return None
+            # LRU order only needs minute resolution, so per-row hits count refreshes, not every lookup
+            if now - row[2] >= TOUCH_INTERVAL_S:
+                self._conn.execute("UPDATE grades SET last_used_at = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self._bump('hits')
+            self._maybe_flush_stats(now)
+        try:
+            return json.loads(row[0])
+        except Exception:
+            return None
+
+    def put(self, key: str, payload: Dict[str, Any], prompt_version: str, model: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO grades (key, prompt_version, model, payload, created_at, last_used_at, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (key, prompt_version, model, json.dumps(payload), now, now)
+            )
+            self._puts += 1
+            if self._puts % EVICT_EVERY_PUTS == 1:
+                self._evict(now)
+            self._maybe_flush_stats(now)
+
+    # drop expired entries, then least recently used ones beyond max_entries.
+    # runs on the first put and every EVICT_EVERY_PUTS after, so the table can briefly overshoot
+    def _evict(self, now: float):
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM grades WHERE created_at < ?", (now - self.ttl_seconds,))
+        if self.max_entries:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM grades").fetchone()
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM grades WHERE key IN (SELECT key FROM grades ORDER BY last_used_at ASC LIMIT ?)",
+                    (overflow,)
+                )
+                self._bump('evictions', overflow)
+
+    # remove cached grades produced by a given prompt version (and optionally model)
+    def invalidate(self, prompt_version: str, model: Optional[str] = None) -> int:
+        with self._lock:
+            if model is None:
+                cur = self._conn.execute("DELETE FROM grades WHERE prompt_version = ?", (prompt_version,))
+            else:
+                cur = self._conn.execute("DELETE FROM grades WHERE prompt_version = ? AND model = ?",
+                                         (prompt_version, model))
+            return cur.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._flush_stats(time.time())
+            counters = dict(self._conn.execute("SELECT name, value FROM stats").fetchall())
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM grades").fetchone()
+        return {
+            'entries': int(entries),
+            'hits': int(counters.get('hits', 0)),
+            'misses': int(counters.get('misses', 0)),
+            'evictions': int(counters.get('evictions', 0))
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush_stats(time.time())
+            self._conn.close()
@@ -0,0 +1,58 @@
+import os
+import threading
+from typing import Optional
+
+from config import LLM_BACKEND, LLM_STANDIN_URL, LLM_FAKE_LATENCY_S
+
+try:
+    from secretcodes import OPENAI_API_KEY as SECRET_FILE_KEY
+except ImportError:
+    SECRET_FILE_KEY = None
+
+# single place that decides which chat-completions client grading talks to.
+# every backend exposes the OpenAI surface (client.chat.completions.create), so
+# callers never branch on the backend.
+
+LLM_BACKENDS = ('openai', 'standin', 'fake')
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def get_llm_client(backend: Optional[str] = None, api_key: Optional[str] = None, base_url: Optional[str] = None):
+    backend = (backend or LLM_BACKEND).lower()
+    if backend not in LLM_BACKENDS:
+        raise ValueError(f"Unknown LLM backend: {backend} (expected one of {', '.join(LLM_BACKENDS)})")
+
+    if backend == 'fake':
+        from scores.fake_llm import FakeLLMClient
+        return FakeLLMClient(latency_s=LLM_FAKE_LATENCY_S)
+
+    try:
+        from openai import OpenAI
+    except ImportError:
+        raise RuntimeError("openai package not installed. Run: pip install openai")
+
+    if backend == 'standin':
+        # the stand-in ignores the key, but the SDK insists on one
+        return OpenAI(api_key=api_key or 'standin', base_url=base_url or LLM_STANDIN_URL)
+
+    api_key = api_key or os.environ.get('OPENAI_API_KEY') or SECRET_FILE_KEY
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY not set in environment or secretcodes.py")
+    return OpenAI(api_key=api_key, base_url=base_url) if base_url else OpenAI(api_key=api_key)
+
+
+# a call bounded by a timeout must not be retried inside the SDK (default max_retries=2),
+# or one request can hold a grading thread for about three times its timeout
+def deadline_client(client, timeout: Optional[float]):
+    return client.with_options(max_retries=0) if timeout is not None else client
+
+
+# lazily built process-wide client for callers that don't pass one in
+def default_llm_client():
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = get_llm_client()
+        return _default_client
@@ -0,0 +1,263 @@
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# optional: scipy's assignment solver for the 'optimal' matcher; a built-in one is used otherwise
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+# localization scoring shared by the app, the analytics export and make_localize_test_scores.py.
+# IoU is evaluated for whole arrays of box pairs at once with NumPy broadcasting instead of
+# one pair at a time; boxes are [x1, y1, x2, y2].
+
+
+def box_array(boxes) -> np.ndarray:
+    return np.asarray(boxes, dtype=float).reshape(-1, 4)
+
+
+# IoU of boxes_a[i] and boxes_b[i] for any pair of broadcastable (..., 4) arrays
+def _iou(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    overlap_wh = np.minimum(boxes_a[..., 2:], boxes_b[..., 2:]) - np.maximum(boxes_a[..., :2], boxes_b[..., :2])
+    intersection = overlap_wh[..., 0] * overlap_wh[..., 1]
+    area_a = np.maximum(boxes_a[..., 2:] - boxes_a[..., :2], 0).prod(axis=-1)
+    area_b = np.maximum(boxes_b[..., 2:] - boxes_b[..., :2], 0).prod(axis=-1)
+    union = area_a + area_b - intersection
+    overlap = (overlap_wh > 0).all(axis=-1) & (union > 0)
+    return np.divide(intersection, union, out=np.zeros(intersection.shape), where=overlap)
+
+
+# (len(boxes_a), len(boxes_b)) IoU matrix
+def iou_matrix(boxes_a, boxes_b) -> np.ndarray:
+    boxes_a, boxes_b = box_array(boxes_a), box_array(boxes_b)
+    return _iou(boxes_a[:, None, :], boxes_b[None, :, :])
+
+
+# IoU of aligned pairs, boxes_a[i] with boxes_b[i]
+def paired_iou(boxes_a, boxes_b) -> np.ndarray:
+    return _iou(box_array(boxes_a), box_array(boxes_b))
+
+
+# every (a, b) index pair whose integer keys are equal, a-major and in input order within a key;
+# this is how many cases / labels are scored in a single IoU pass
+def keyed_pairs(keys_a, keys_b) -> Tuple[np.ndarray, np.ndarray]:
+    keys_a = np.asarray(keys_a, dtype=np.int64)
+    keys_b = np.asarray(keys_b, dtype=np.int64)
+    if not len(keys_a) or not len(keys_b):
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    order = np.argsort(keys_b, kind='stable')
+    sorted_b = keys_b[order]
+    start = np.searchsorted(sorted_b, keys_a, side='left')
+    counts = np.searchsorted(sorted_b, keys_a, side='right') - start
+    a_idx = np.repeat(np.arange(len(keys_a)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return a_idx, order[np.repeat(start, counts) + offsets]
+
+
+# IoU of every same-key (a, b) pair across all keys in one pass: (a_idx, b_idx, iou)
+def keyed_iou(keys_a, boxes_a, keys_b, boxes_b) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    a_idx, b_idx = keyed_pairs(keys_a, keys_b)
+    return a_idx, b_idx, paired_iou(box_array(boxes_a)[a_idx], box_array(boxes_b)[b_idx])
+
+
+# for each user box, whether a GT box with the same key overlaps it with IoU > threshold
+def matched_user_boxes(user_keys, user_boxes, gt_keys, gt_boxes, threshold=0.4) -> np.ndarray:
+    matched = np.zeros(len(user_keys), dtype=bool)
+    user_idx, _, iou = keyed_iou(user_keys, user_boxes, gt_keys, gt_boxes)
+    matched[user_idx[iou > threshold]] = True
+    return matched
+
+
+# greedy one-to-one assignment over a (gt, user) IoU matrix: each GT box in order takes the
+# unused user box with the highest positive IoU (first on ties) if it reaches the threshold.
+# returns the matched user index per GT box (-1 when unmatched)
+def greedy_match(iou, threshold) -> List[int]:
+    rows = iou.tolist() if isinstance(iou, np.ndarray) else iou
+    used = set()
+    matches = []
+    for row in rows:
+        best_iou = 0.0
+        best = -1
+        for j, value in enumerate(row):
+            if j not in used and value > best_iou:
+                best_iou = value
+                best = j
+        if best >= 0 and best_iou >= threshold:
+            used.add(best)
+            matches.append(best)
+        else:
+            matches.append(-1)
+    return matches
+
+
+# min-cost assignment of each row to a distinct column (rows <= columns), Hungarian method with
+# potentials; O(rows^2 * columns), used when scipy is not installed
+def _hungarian(cost) -> List[int]:
+    n, m = len(cost), len(cost[0])
+    inf = float('inf')
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    owner = [0] * (m + 1)  # 1-based row assigned to each column, 0 = free
+    way = [0] * (m + 1)
+    for i in range(1, n + 1):
+        owner[0] = i
+        j0 = 0
+        minv = [inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            row = cost[owner[j0] - 1]
+            ui = u[owner[j0]]
+            delta = inf
+            j1 = 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    cur = row[j - 1] - ui - v[j]
+                    if cur < minv[j]:
+                        minv[j] = cur
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[owner[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if owner[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+    assignment = [-1] * n
+    for j in range(1, m + 1):
+        if owner[j]:
+            assignment[owner[j] - 1] = j - 1
+    return assignment
+
+
+# (row, column) pairs of a max-weight assignment over a dense weight matrix
+def _max_weight_assignment(weights) -> List[Tuple[int, int]]:
+    if linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(np.asarray(weights, dtype=float), maximize=True)
+        return list(zip(rows.tolist(), cols.tolist()))
+    if len(weights) <= len(weights[0]):
+        return [(i, j) for i, j in enumerate(_hungarian([[-w for w in row] for row in weights]))]
+    transposed = [[-row[j] for row in weights] for j in range(len(weights[0]))]
+    return [(i, j) for j, i in enumerate(_hungarian(transposed))]
+
+
+# optimal one-to-one assignment over a (gt, user) IoU matrix, independent of box order: matches
+# as many GT boxes as possible at the threshold and, among those assignments, maximizes the total
+# IoU. returns the matched user index per GT box (-1 when unmatched)
+def optimal_match(iou, threshold) -> List[int]:
+    rows = iou.tolist() if isinstance(iou, np.ndarray) else iou
+    matches = [-1] * len(rows)
+    if not rows or not rows[0]:
+        return matches
+    # every match is worth more than any IoU total, so the match count is maximized first
+    bonus = min(len(rows), len(rows[0])) + 1.0
+    weights = [[bonus + value if value > 0 and value >= threshold else 0.0 for value in row] for row in rows]
+    if len(rows) == 1 or len(rows[0]) == 1:
+        # one GT box or one user box: the single best pair is optimal
+        best = max(((value, i, j) for i, row in enumerate(weights) for j, value in enumerate(row)),
+                   key=lambda t: t[0])
+        if best[0] > 0:
+            matches[best[1]] = best[2]
+        return matches
+    for i, j in _max_weight_assignment(weights):
+        if weights[i][j] > 0:
+            matches[i] = j
+    return matches
+
+
+MATCHERS = {'greedy': greedy_match, 'optimal': optimal_match}
+
+
+# [x1, y1, x2, y2] as floats, or None when the coordinates are not four numbers
+def parse_box(coords):
+    if not isinstance(coords, (list, tuple)) or len(coords) != 4:
+        return None
+    try:
+        return [float(coords[0]), float(coords[1]), float(coords[2]), float(coords[3])]
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_user_box(box):
+    label = box.get('label')
+    coords = box.get('coordinates') or []
+    parsed = parse_box(coords) if label else None
+    return label, (coords if parsed is None else parsed), parsed
+
+
+# score the drawn boxes of many localize cases in one IoU pass.
+# each item is (gt_boxes_by_label, user_boxes): GT boxes per localizable label (box lists or
+# (n, 4) arrays, e.g. the ones prebuilt with the case index), and the trainee's
+# [{'label', 'coordinates'}] list. returns (correct, incorrect, enriched_boxes) per item, where
+# every GT box matched at the threshold is correct, every missed GT box and every unmatched or
+# unknown-label user box is incorrect, and each user box carries its matched (or best) IoU.
+# matcher is a MATCHERS key: 'greedy' (GT order) or 'optimal'
+def score_cases(items: Sequence[Tuple[Dict[str, list], list]], iou_thresh=0.3,
+                matcher='greedy') -> List[Tuple[int, int, list]]:
+    if matcher not in MATCHERS:
+        raise ValueError(f"Unknown matcher: {matcher} (expected one of {', '.join(MATCHERS)})")
+    match = MATCHERS[matcher]
+    results = []
+    groups = []  # (result index, GT box count, enriched user box indexes)
+    user_keys, user_boxes, gt_keys, gt_chunks = [], [], [], []
+    for gt_by_label, boxes in items:
+        enriched = []
+        grouped = {}
+        for box in boxes or []:
+            label, coords, parsed = _parse_user_box(box)
+            if parsed is not None:
+                grouped.setdefault(label, []).append(len(enriched))
+            enriched.append({'label': label, 'coordinates': coords, 'iou': 0.0})
+        incorrect = sum(len(idxs) for label, idxs in grouped.items() if label not in gt_by_label)
+        results.append([0, incorrect, enriched])
+        for label, gts in gt_by_label.items():
+            key = len(groups)
+            idxs = grouped.get(label, [])
+            gts = box_array(gts)
+            groups.append((len(results) - 1, len(gts), idxs))
+            gt_keys.extend([key] * len(gts))
+            gt_chunks.append(gts)
+            for i in idxs:
+                user_keys.append(key)
+                user_boxes.append(enriched[i]['coordinates'])
+
+    gt_boxes = np.concatenate(gt_chunks) if gt_chunks else np.zeros((0, 4))
+    iou = keyed_iou(gt_keys, gt_boxes, user_keys, user_boxes)[2].tolist()
+    # pairs are GT-major per key, so each label's (gt, user) matrix is one contiguous block
+    position = 0
+    for result_index, n_gt, idxs in groups:
+        result = results[result_index]
+        enriched = result[2]
+        n_user = len(idxs)
+        block = iou[position:position + n_gt * n_user]
+        position += n_gt * n_user
+        matrix = [block[g * n_user:(g + 1) * n_user] for g in range(n_gt)]
+        matches = match(matrix, iou_thresh)
+        for g, j in enumerate(matches):
+            if j >= 0:
+                enriched[idxs[j]]['iou'] = float(matrix[g][j])
+                result[0] += 1
+            else:
+                result[1] += 1
+        matched = set(matches)
+        for j, i in enumerate(idxs):
+            if j not in matched:
+                enriched[i]['iou'] = float(max((row[j] for row in matrix), default=0.0))
+                result[1] += 1
+    return [(int(correct), int(incorrect), enriched) for correct, incorrect, enriched in results]
+
+
+def score_case(gt_boxes_by_label: Dict[str, list], user_boxes: list, iou_thresh=0.3,
+               matcher='greedy') -> Tuple[int, int, list]:
+    return score_cases([(gt_boxes_by_label, user_boxes)], iou_thresh, matcher)[0]
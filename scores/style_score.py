@@ -1,9 +1,19 @@
-from typing import List, Literal
+from typing import TYPE_CHECKING, List, Literal, Optional
 from pydantic import BaseModel, Field
-from openai import OpenAI
 
 import json
 
+from scores.grade_cache import GradeCache, make_grade_key
+from scores.llm_backend import deadline_client, default_llm_client
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+STYLE_MODEL = "o3"
+# bump whenever the prompt text or cache key changes so cached style scores are not reused
+STYLE_PROMPT_VERSION = "style-v2"
+STYLE_SYSTEM_PROMPT = "You are a radiology education expert that evaluates the writing style and structure of radiology reports.  Return only valid JSON."
+
 # structured output for style scoring
 class StyleScoreResponse(BaseModel):
     systematic_evaluation_score: Literal[0, 0.5, 1]
@@ -16,7 +26,18 @@ class StyleScoreResponse(BaseModel):
         description="Recommendation for organization and language (empty if score is 1)"
     )
 
-def get_style_score(candidate_report: str, openai_client: OpenAI) -> StyleScoreResponse:
+def get_style_score(candidate_report: str, openai_client: Optional["OpenAI"] = None, timeout: Optional[float] = None,
+                    cache: Optional[GradeCache] = None) -> StyleScoreResponse:
+    openai_client = openai_client or default_llm_client()
+
+    cache_key = None
+    if cache is not None:
+        # style grades capitalization, line breaks and layout, so the key keeps the text as written
+        cache_key = make_grade_key(candidate_report, '', None, None, STYLE_PROMPT_VERSION, STYLE_MODEL,
+                                   normalize=False)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return StyleScoreResponse(**cached)
 
     prompt = f'''
     Objective:
@@ -57,24 +78,27 @@ def get_style_score(candidate_report: str, openai_client: OpenAI) -> StyleScoreR
     }}
     '''
     
-    completion = openai_client.chat.completions.create(
-        model="o3",
+    request_options = {"timeout": timeout} if timeout is not None else {}
+    completion = deadline_client(openai_client, timeout).chat.completions.create(
+        model=STYLE_MODEL,
         messages=[
-            {
-                "role": "system", 
-                "content": "You are a radiology education expert that evaluates the writing style and structure of radiology reports.  Return only valid JSON."
-            },
+            {"role": "system", "content": STYLE_SYSTEM_PROMPT},
             {"role": "user", "content": prompt}
         ],
-        response_format={ "type": "json_object" }
+        response_format={ "type": "json_object" },
+        **request_options
     )
     
     response_data = json.loads(completion.choices[0].message.content)
-    return StyleScoreResponse(**response_data)
+    style_response = StyleScoreResponse(**response_data)
+    if cache is not None:
+        cache.put(cache_key, style_response.model_dump(), STYLE_PROMPT_VERSION, STYLE_MODEL)
+    return style_response
 
 
-def calculate_style_score(candidate_report: str, openai_client: OpenAI):
+def calculate_style_score(candidate_report: str, openai_client: Optional["OpenAI"] = None, timeout: Optional[float] = None,
+                          cache: Optional[GradeCache] = None):
 
-    style_response = get_style_score(candidate_report, openai_client)
+    style_response = get_style_score(candidate_report, openai_client, timeout=timeout, cache=cache)
 
     return style_response, ((float(style_response.systematic_evaluation_score) + float(style_response.organization_language_score))/2.0)*100.0
@@ -3,10 +3,17 @@ import pandas as pd
 import argparse
 from pathlib import Path
 import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, Any
 from openpyxl.utils import get_column_letter
 from openpyxl.styles import Alignment
 from secretcodes import OPENAI_API_KEY
+from config import GRADE_CACHE_PATH
+from scores.grade_cache import GradeCache, make_grade_key
+from scores.llm_backend import LLM_BACKENDS, get_llm_client
+from utils.report_writers import REPORT_WRITERS, is_wrap_column, open_report_writer, order_columns
 
 # progress bar fallback
 try:
@@ -21,18 +28,94 @@ try:
 except Exception:
     openai = None
 
-try:
-    from openai import OpenAI
-    _HAS_NEW_OPENAI = True
-except Exception:
-    OpenAI = None
-    _HAS_NEW_OPENAI = False
+EMPTY_SCORE = {'score': None, 'errors': {'a': [], 'b': [], 'c': [], 'd': []}, 'matched_findings': [], 'summary': ''}
+
+# Map error categories to descriptive names
+ERROR_LABELS = {
+    'a': 'False Finding',          # False report of a finding
+    'b': 'Missing Finding',        # Missing a finding present in reference
+    'c': 'Location Error',         # Misidentification of location
+    'd': 'Severity Error'          # Misassessment of severity
+}
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+def _enum(items):
+    if not items:
+        return ''
+    # Numbered list each on new line: 1) item
+    return '\n'.join(f"{i}. {v}" for i, v in enumerate(items, 1))
+
+
+# rate limits, timeouts and transient server errors are retried with backoff
+def _is_retryable_error(err) -> bool:
+    if openai is not None:
+        retryable = tuple(getattr(openai, name) for name in ('RateLimitError', 'APITimeoutError', 'APIConnectionError')
+                          if hasattr(openai, name))
+        if retryable and isinstance(err, retryable):
+            return True
+    return getattr(err, 'status_code', None) in RETRYABLE_STATUS_CODES
+
+
+def _retry_after_seconds(err):
+    response = getattr(err, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+def build_case_rows(df):
+    """Pair each case's first pre and post report, in sorted case order.
+
+    The (case -> pre row, post row) lookups are built in one grouped pass
+    instead of re-filtering the frame for every case.
+    """
+    firsts = df.drop_duplicates(subset=['Case', 'Test Type'], keep='first')
+    lookups = {
+        test_type: dict(zip(group['Case'], group.to_dict('records')))
+        for test_type, group in firsts.groupby('Test Type', sort=False)
+    }
+    pre_lookup = lookups.get('pre', {})
+    post_lookup = lookups.get('post', {})
+    rows = []
+    for case_idx in sorted(set(pre_lookup) | set(post_lookup)):
+        case_pre = pre_lookup.get(case_idx)
+        case_post = post_lookup.get(case_idx)
+        ref_row = case_pre if case_pre is not None else case_post
+        rows.append({
+            'case_idx': case_idx,
+            'ground_truth': ref_row['Ground Truth'] or '',
+            'age': ref_row['Age'],
+            'indication': ref_row['Indication'],
+            'pre_text': case_pre['Report Text'] if case_pre is not None else '',
+            'post_text': case_post['Report Text'] if case_post is not None else '',
+        })
+    return rows
+
+
+# the study prompt differs slightly from the app's CRIMSON prompt, so its grades are cached separately
+STUDY_PROMPT_VERSION = 'crimson-study-v1'
 
 class ParticipantReportProcessor:
-    def __init__(self, cases_json_path, image_links_json_path=None, ground_truth_csv_path=None):
+    def __init__(self, cases_json_path, image_links_json_path=None, ground_truth_csv_path=None,
+                 grade_cache_path=GRADE_CACHE_PATH, prompt_version=STUDY_PROMPT_VERSION,
+                 max_concurrency=8, max_retries=5, backoff_base_s=2.0, backoff_max_s=60.0, llm_backend=None):
         self.cases_json_path = Path(cases_json_path)
         self.dataset_data = self._load_cases_json()
         self.model_name = 'o3'
+        # in-flight LLM request limit and rate-limit backoff
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.prompt_version = prompt_version
+        # on-disk cache survives re-runs and can be shared between analysts via a common path
+        self.grade_cache = GradeCache(grade_cache_path) if grade_cache_path else None
+        # (case_id, test_type, error) for reports that could not be scored; listed at the end of a run
+        self.scoring_failures = []
 
         if image_links_json_path:
             with open(image_links_json_path, 'r') as f:
@@ -61,14 +144,12 @@ class ParticipantReportProcessor:
         self._score_cache: Dict[str, Dict[str, Any]] = {}
 
         self._client = None
-        api_key = OPENAI_API_KEY
-        if _HAS_NEW_OPENAI and api_key:
-            try:
-                self._client = OpenAI(api_key=api_key)
-            except Exception as e:
-                print(f"[WARN] Failed to init OpenAI client: {e}")
-        elif _HAS_NEW_OPENAI and not api_key:
-            print("[WARN] OPENAI_API_KEY not set. Falling back to heuristic scoring only.")
+        try:
+            self._client = get_llm_client(llm_backend, api_key=OPENAI_API_KEY)
+        except ValueError as e:
+            print(f"[WARN] {e}. Falling back to heuristic scoring only.")
+        except Exception as e:
+            print(f"[WARN] Failed to init LLM client: {e}")
     
     def _load_cases_json(self):
         if not self.cases_json_path.exists():
@@ -109,8 +190,9 @@ class ParticipantReportProcessor:
         
         return participant_code, processed_cases
     
-    def _make_cache_key(self, case_id: str, text: str, truth: str, test_type: str) -> str:
-        return f"{case_id}:::{test_type}:::{hash(text)}:::{hash(truth)}"
+    # content digest, stable across processes (unlike the salted built-in hash())
+    def _make_cache_key(self, text: str, truth: str, age: Any, indication: Any) -> str:
+        return make_grade_key(text, truth, age, indication, self.prompt_version, self.model_name)
 
     def _llm_score(self, case_id: str, candidate: str, truth: str, age: Any, indication: Any, test_type: str) -> Dict[str, Any]:
         if not candidate or not truth:
@@ -120,9 +202,14 @@ class ParticipantReportProcessor:
                 'matched_findings': [],
                 'summary': 'Empty candidate or ground truth.'
             }
-        cache_key = self._make_cache_key(case_id, candidate, truth, test_type)
+        cache_key = self._make_cache_key(candidate, truth, age, indication)
         if cache_key in self._score_cache:
             return self._score_cache[cache_key]
+        if self.grade_cache is not None:
+            cached = self.grade_cache.get(cache_key)
+            if cached is not None:
+                self._score_cache[cache_key] = cached
+                return cached
         age_str = str(age) if age not in (None, '', 'nan') else 'Unknown'
         indication_str = indication if indication else 'None provided'
         reference = f"Findings: {truth}"
@@ -215,8 +302,140 @@ class ParticipantReportProcessor:
         }
         
         self._score_cache[cache_key] = result
+        if self.grade_cache is not None:
+            self.grade_cache.put(cache_key, result, self.prompt_version, self.model_name)
         return result
     
+    def _llm_score_with_backoff(self, case_id: str, candidate: str, truth: str, age: Any, indication: Any, test_type: str) -> Dict[str, Any]:
+        delay = self.backoff_base_s
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._llm_score(case_id, candidate, truth, age, indication, test_type)
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable_error(e):
+                    raise
+                wait = _retry_after_seconds(e) or delay * (1 + random.random())
+                print(f"[WARN] {type(e).__name__} scoring {case_id} ({test_type}); retrying in {wait:.1f}s")
+                time.sleep(wait)
+                delay = min(delay * 2, self.backoff_max_s)
+
+    def score_reports(self, tasks):
+        """Score (key, (case_id, text, truth, age, indication, test_type)) tasks with bounded concurrency.
+
+        Identical reports are graded once. Returns {key: score payload}. A report whose grading
+        fails gets EMPTY_SCORE with the error as its summary and is added to scoring_failures,
+        so one bad response does not abort the run.
+        """
+        by_cache_key = {}
+        for key, args in tasks:
+            _, text, truth, age, indication, _ = args
+            by_cache_key.setdefault(self._make_cache_key(text, truth, age, indication), (args, []))[1].append(key)
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, self.max_concurrency)) as pool:
+            futures, task_args = {}, {}
+            for args, keys in by_cache_key.values():
+                future = pool.submit(self._llm_score_with_backoff, *args)
+                futures[future] = keys
+                task_args[future] = args
+            for future in tqdm(as_completed(futures), total=len(futures), desc='Scoring reports'):
+                try:
+                    payload = future.result()
+                except Exception as e:
+                    case_id, _, _, _, _, test_type = task_args[future]
+                    print(f"[WARN] {type(e).__name__} scoring {case_id} ({test_type}); recording an empty score")
+                    self.scoring_failures.append((case_id, test_type, f"{type(e).__name__}: {e}"))
+                    payload = dict(EMPTY_SCORE, summary=f"Scoring failed: {type(e).__name__}: {e}")
+                for key in futures[future]:
+                    results[key] = payload
+        return results
+
+    def _print_scoring_failures(self):
+        if not self.scoring_failures:
+            return
+        print(f"[WARN] {len(self.scoring_failures)} report(s) could not be scored and were written with empty scores:")
+        for case_id, test_type, error in self.scoring_failures:
+            print(f"  case {case_id} ({test_type}): {error}")
+
+    def _build_final_row(self, case_row, pre_score_payload, post_score_payload):
+        case_idx = case_row['case_idx']
+        ground_truth = case_row['ground_truth']
+        final_row = {
+            'Case': case_idx,
+            'Image Link': self.image_links.get(case_idx, ''),
+            'Age': case_row['age'],
+            'Indication': case_row['indication'],
+            'Ground Truth': ground_truth,
+            'Report_pre': case_row['pre_text'],
+            'Score_pre': pre_score_payload['score'],
+            'Matched Findings (pre)': _enum(pre_score_payload['matched_findings']),
+            'Ground Truth (repeat)': ground_truth,  # duplicated immediately after pre matched findings
+            'Report_post': case_row['post_text'],
+            'Score_post': post_score_payload['score'],
+            'Matched Findings (post)': _enum(post_score_payload['matched_findings']),
+        }
+
+        # Add descriptive error columns (prefixed with pre/post)
+        for cat, label in ERROR_LABELS.items():
+            pre_errs = pre_score_payload['errors'].get(cat, [])
+            post_errs = post_score_payload['errors'].get(cat, [])
+            final_row[f"pre {label}"] = _enum(pre_errs)
+            final_row[f"post {label}"] = _enum(post_errs)
+        return final_row
+
+    def _score_tasks(self, p_idx, case_rows):
+        tasks = []
+        for row in case_rows:
+            for test_type in ('pre', 'post'):
+                text = row[f'{test_type}_text']
+                if text:
+                    tasks.append(((p_idx, row['case_idx'], test_type),
+                                  (row['case_idx'], text, row['ground_truth'], row['age'], row['indication'], test_type)))
+        return tasks
+
+    def _participant_rows(self, p_idx, case_rows, scores):
+        return [
+            self._build_final_row(
+                row,
+                scores.get((p_idx, row['case_idx'], 'pre'), EMPTY_SCORE),
+                scores.get((p_idx, row['case_idx'], 'post'), EMPTY_SCORE)
+            )
+            for row in case_rows
+        ]
+
+    def export_report(self, participant_json_paths, output_path, fmt='xlsx-stream'):
+        """Stream participants to a write-only xlsx, CSV or Parquet file.
+
+        Each participant is scored and written before the next one is read,
+        so memory stays flat and no per-cell formatting pass is needed.
+        """
+        if isinstance(participant_json_paths, str):
+            participant_json_paths = [participant_json_paths]
+
+        written = {}
+        writer = open_report_writer(fmt, output_path)
+        try:
+            for p_idx, participant_json_path in enumerate(tqdm(participant_json_paths, desc='Participants')):
+                participant_code, processed_cases = self.process_participant_json(participant_json_path)
+                if not processed_cases:
+                    print(f"No valid cases found for participant {participant_code}")
+                    continue
+                case_rows = build_case_rows(pd.DataFrame(processed_cases))
+                scores = self.score_reports(self._score_tasks(p_idx, case_rows))
+                final_data = self._participant_rows(p_idx, case_rows, scores)
+                writer.write_participant(participant_code, final_data)
+                written[participant_code] = len(final_data)
+                print(f"Processed {participant_json_path} -> {participant_code} ({len(final_data)} cases)")
+        finally:
+            writer.close()
+
+        if self.grade_cache is not None:
+            print(f"Grade cache: {self.grade_cache.stats()}")
+        self._print_scoring_failures()
+        print(f"{fmt} report created: {output_path}")
+        print(f"Total participants: {len(written)}")
+        return written
+
     def create_excel_report(self, participant_json_paths, output_path):
         """Create Excel file with participant data."""
         if isinstance(participant_json_paths, str):
@@ -224,93 +443,31 @@ class ParticipantReportProcessor:
 
         all_data = {}
 
-        for participant_json_path in tqdm(participant_json_paths, desc='Participants'):
+        # pass 1: collect every (participant, case, test_type) report that needs a grade
+        participants = []
+        tasks = []
+        for p_idx, participant_json_path in enumerate(participant_json_paths):
             participant_code, processed_cases = self.process_participant_json(participant_json_path)
             if not processed_cases:
                 print(f"No valid cases found for participant {participant_code}")
                 continue
+            case_rows = build_case_rows(pd.DataFrame(processed_cases))
+            participants.append((p_idx, participant_json_path, participant_code, case_rows))
+            tasks.extend(self._score_tasks(p_idx, case_rows))
 
-            df = pd.DataFrame(processed_cases)
-            pre_cases = df[df['Test Type'] == 'pre'].copy()
-            post_cases = df[df['Test Type'] == 'post'].copy()
-            final_data = []
-            case_indices = sorted(df['Case'].unique())
-
-            for case_idx in tqdm(case_indices, desc=f'Cases {participant_code}', leave=False):
-                case_pre = pre_cases[pre_cases['Case'] == case_idx]
-                case_post = post_cases[post_cases['Case'] == case_idx]
-                if case_pre.empty and case_post.empty:
-                    continue
-                ref_row = case_pre.iloc[0] if not case_pre.empty else case_post.iloc[0]
-                ground_truth = ref_row['Ground Truth'] or ''
-                age = ref_row['Age']
-                indication = ref_row['Indication']
-                pre_text = case_pre.iloc[0]['Report Text'] if not case_pre.empty else ''
-                post_text = case_post.iloc[0]['Report Text'] if not case_post.empty else ''
-
-                pre_score_payload = self._llm_score(case_idx, pre_text, ground_truth, age, indication, 'pre') if pre_text else {
-                    'score': None, 'errors': {'a': [], 'b': [], 'c': [], 'd': []}, 'matched_findings': [], 'summary': ''
-                }
-                post_score_payload = self._llm_score(case_idx, post_text, ground_truth, age, indication, 'post') if post_text else {
-                    'score': None, 'errors': {'a': [], 'b': [], 'c': [], 'd': []}, 'matched_findings': [], 'summary': ''
-                }
-
-                # Map error categories to descriptive names
-                error_labels = {
-                    'a': 'False Finding',          # False report of a finding
-                    'b': 'Missing Finding',        # Missing a finding present in reference
-                    'c': 'Location Error',         # Misidentification of location
-                    'd': 'Severity Error'          # Misassessment of severity
-                }
-
-                def _enum(items):
-                    if not items:
-                        return ''
-                    # Numbered list each on new line: 1) item
-                    return '\n'.join(f"{i}. {v}" for i, v in enumerate(items, 1))
-
-                final_row = {
-                    'Case': case_idx,
-                    'Image Link': self.image_links.get(case_idx, ''),
-                    'Age': age,
-                    'Indication': indication,
-                    'Ground Truth': ground_truth,
-                    'Report_pre': pre_text,
-                    'Score_pre': pre_score_payload['score'],
-                    'Matched Findings (pre)': _enum(pre_score_payload['matched_findings']),
-                    'Ground Truth (repeat)': ground_truth,  # duplicated immediately after pre matched findings
-                    'Report_post': post_text,
-                    'Score_post': post_score_payload['score'],
-                    'Matched Findings (post)': _enum(post_score_payload['matched_findings']),
-                }
-
-                # Add descriptive error columns (prefixed with pre/post)
-                for cat, label in error_labels.items():
-                    pre_errs = pre_score_payload['errors'].get(cat, [])
-                    post_errs = post_score_payload['errors'].get(cat, [])
-                    final_row[f"pre {label}"] = _enum(pre_errs)
-                    final_row[f"post {label}"] = _enum(post_errs)
-
-                final_data.append(final_row)
+        # pass 2: grade all reports in parallel
+        scores = self.score_reports(tasks)
 
+        # pass 3: assemble per-participant sheets in the original order
+        for p_idx, participant_json_path, participant_code, case_rows in participants:
+            final_data = self._participant_rows(p_idx, case_rows, scores)
             all_data[participant_code] = pd.DataFrame(final_data)
             print(f"Processed {participant_json_path} -> {participant_code} ({len(final_data)} cases)")
 
         with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
             for participant_code, df in all_data.items():
                 # Explicit column ordering to preserve original intended sequence
-                # User-requested primary ordering (exact sequence from final_row construction)
-                # Assemble desired order: pre core block + pre errors, then post core + post errors
-                pre_core = [
-                    'Case', 'Image Link', 'Age', 'Indication', 'Ground Truth',
-                    'Report_pre', 'Score_pre', 'Matched Findings (pre)'
-                ]
-                pre_errors = ['pre False Finding', 'pre Missing Finding', 'pre Location Error', 'pre Severity Error']
-                post_core = ['Ground Truth (repeat)', 'Report_post', 'Score_post', 'Matched Findings (post)']
-                post_errors = ['post False Finding', 'post Missing Finding', 'post Location Error', 'post Severity Error']
-                desired = [c for c in pre_core + pre_errors + post_core + post_errors if c in df.columns]
-                leftover = [c for c in df.columns if c not in desired]
-                df = df[desired + leftover]
+                df = df[order_columns(df.columns)]
                 df.to_excel(writer, sheet_name=participant_code, index=False)
                 worksheet = writer.sheets[participant_code]
 
@@ -321,7 +478,7 @@ class ParticipantReportProcessor:
                     cell.value = 'View Image'
                     cell.style = 'Hyperlink'
 
-                wrap_cols = {c for c in df.columns if any(k in c.lower() for k in ['report', 'ground truth', 'error', 'matched', 'finding'])}
+                wrap_cols = {c for c in df.columns if is_wrap_column(c)}
                 for col_idx, col_name in enumerate(df.columns, start=1):
                     try:
                         values = df[col_name].astype(str).tolist()
@@ -335,6 +492,9 @@ class ParticipantReportProcessor:
                             c = worksheet.cell(row=row_num, column=col_idx)
                             c.alignment = Alignment(wrap_text=True, vertical='top')
 
+        if self.grade_cache is not None:
+            print(f"Grade cache: {self.grade_cache.stats()}")
+        self._print_scoring_failures()
         print(f"Excel report created: {output_path}")
         print(f"Total participants: {len(all_data)}")
         return all_data
@@ -357,14 +517,36 @@ def main():
                        help='Path to JSON file containing case_id to image link mapping')
     parser.add_argument('-g', '--ground-truth-csv',
                        help='Path to ground truth CSV (Case,Age,Indication,Ground Truth)')
+    parser.add_argument('--grade-cache', default=GRADE_CACHE_PATH,
+                       help='SQLite grade cache path (point analysts at a shared file to reuse grades)')
+    parser.add_argument('--no-grade-cache', action='store_true',
+                       help='Disable the persistent grade cache')
+    parser.add_argument('--prompt-version', default=STUDY_PROMPT_VERSION,
+                       help='Prompt version recorded with, and used to look up, cached grades')
+    parser.add_argument('-f', '--format', choices=['xlsx'] + sorted(REPORT_WRITERS), default='xlsx',
+                       help='xlsx (formatted, in memory) or a streaming format: xlsx-stream, csv, parquet')
+    parser.add_argument('-j', '--max-concurrency', type=int, default=8,
+                       help='Maximum number of reports graded in parallel')
+    parser.add_argument('--invalidate-prompt-version', action='append', default=[],
+                       help='Drop cached grades for this prompt version before running (repeatable)')
+    parser.add_argument('--llm-backend', choices=LLM_BACKENDS,
+                       help='LLM backend (defaults to RADGAME_LLM_BACKEND, else openai)')
     
     args = parser.parse_args()
   
     processor = ParticipantReportProcessor(
         args.cases_json,
         args.image_links,
-        ground_truth_csv_path=args.ground_truth_csv
+        ground_truth_csv_path=args.ground_truth_csv,
+        grade_cache_path=None if args.no_grade_cache else args.grade_cache,
+        prompt_version=args.prompt_version,
+        max_concurrency=args.max_concurrency,
+        llm_backend=args.llm_backend
     )
+    if processor.grade_cache is not None:
+        for version in args.invalidate_prompt_version:
+            removed = processor.grade_cache.invalidate(version)
+            print(f"Invalidated {removed} cached grades for prompt version {version}")
     
     json_dir = Path(args.json_dir)
     json_files = list(json_dir.glob("*.json"))
@@ -375,8 +557,11 @@ def main():
     
     print(f"Found {len(json_files)} JSON files in {args.json_dir}")
     
-    processor.create_excel_report(json_files, args.output)
-    print(f"\nSuccess! Generated Excel report: {args.output}")
+    if args.format == 'xlsx':
+        processor.create_excel_report(json_files, args.output)
+    else:
+        processor.export_report(json_files, args.output, fmt=args.format)
+    print(f"\nSuccess! Generated {args.format} report: {args.output}")
 
 
 if __name__ == "__main__":
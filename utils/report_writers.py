@@ -0,0 +1,144 @@
+import csv
+from typing import Any, Dict, Iterable, List
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment
+from openpyxl.utils import get_column_letter
+
+# streaming writers for participant report exports. rows are written as each
+# participant is scored, so memory stays flat and no pass over finished cells
+# is needed to size columns or set alignment.
+
+# Assemble desired order: pre core block + pre errors, then post core + post errors
+PRE_CORE = [
+    'Case', 'Image Link', 'Age', 'Indication', 'Ground Truth',
+    'Report_pre', 'Score_pre', 'Matched Findings (pre)'
+]
+PRE_ERRORS = ['pre False Finding', 'pre Missing Finding', 'pre Location Error', 'pre Severity Error']
+POST_CORE = ['Ground Truth (repeat)', 'Report_post', 'Score_post', 'Matched Findings (post)']
+POST_ERRORS = ['post False Finding', 'post Missing Finding', 'post Location Error', 'post Severity Error']
+REPORT_COLUMNS = PRE_CORE + PRE_ERRORS + POST_CORE + POST_ERRORS
+SCORE_COLUMNS = {'Score_pre', 'Score_post'}
+
+WRAP_KEYWORDS = ['report', 'ground truth', 'error', 'matched', 'finding']
+WRAP_COLUMN_WIDTH = 60
+MAX_COLUMN_WIDTH = 80
+
+
+def is_wrap_column(column: str) -> bool:
+    return any(k in column.lower() for k in WRAP_KEYWORDS)
+
+
+def order_columns(columns: Iterable[str]) -> List[str]:
+    columns = list(columns)
+    desired = [c for c in REPORT_COLUMNS if c in columns]
+    return desired + [c for c in columns if c not in desired]
+
+
+# fixed widths chosen up front; write-only sheets can't be resized after rows are written
+def column_width(column: str) -> int:
+    if is_wrap_column(column):
+        return WRAP_COLUMN_WIDTH
+    return max(12, min(len(column), MAX_COLUMN_WIDTH) + 2)
+
+
+class StreamingXlsxWriter:
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self._workbook = Workbook(write_only=True)
+        self._wrap = Alignment(wrap_text=True, vertical='top')
+
+    def write_participant(self, participant_code: str, rows: List[Dict[str, Any]]):
+        columns = order_columns(rows[0].keys()) if rows else list(REPORT_COLUMNS)
+        sheet = self._workbook.create_sheet(title=participant_code)
+        for col_idx, column in enumerate(columns, start=1):
+            sheet.column_dimensions[get_column_letter(col_idx)].width = column_width(column)
+        wrap_flags = [is_wrap_column(c) for c in columns]
+
+        sheet.append([self._cell(sheet, column, wrap) for column, wrap in zip(columns, wrap_flags)])
+        for row in rows:
+            cells = []
+            for column, wrap in zip(columns, wrap_flags):
+                value = row.get(column)
+                if column == 'Image Link':
+                    cell = WriteOnlyCell(sheet, value='View Image')
+                    cell.hyperlink = value
+                    cell.style = 'Hyperlink'
+                else:
+                    cell = self._cell(sheet, value, wrap)
+                cells.append(cell)
+            sheet.append(cells)
+
+    def _cell(self, sheet, value, wrap):
+        cell = WriteOnlyCell(sheet, value=value)
+        if wrap:
+            cell.alignment = self._wrap
+        return cell
+
+    def close(self):
+        self._workbook.save(self.output_path)
+
+
+class CsvReportWriter:
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self._file = open(output_path, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._header_written = False
+
+    def write_participant(self, participant_code: str, rows: List[Dict[str, Any]]):
+        columns = list(REPORT_COLUMNS)
+        if not self._header_written:
+            self._writer.writerow(['Participant'] + columns)
+            self._header_written = True
+        for row in rows:
+            self._writer.writerow([participant_code] + ['' if row.get(c) is None else row.get(c) for c in columns])
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetReportWriter:
+    def __init__(self, output_path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("pyarrow not installed. Run: pip install pyarrow")
+        self._pa = pa
+        fields = [pa.field('Participant', pa.string())]
+        for column in REPORT_COLUMNS:
+            fields.append(pa.field(column, pa.float64() if column in SCORE_COLUMNS else pa.string()))
+        self._schema = pa.schema(fields)
+        self._writer = pq.ParquetWriter(output_path, self._schema)
+
+    def write_participant(self, participant_code: str, rows: List[Dict[str, Any]]):
+        if not rows:
+            return
+        data = {'Participant': [participant_code] * len(rows)}
+        for column in REPORT_COLUMNS:
+            values = [row.get(column) for row in rows]
+            if column in SCORE_COLUMNS:
+                data[column] = [None if v is None else float(v) for v in values]
+            else:
+                data[column] = [None if v is None else str(v) for v in values]
+        # one row group per participant
+        self._writer.write_table(self._pa.Table.from_pydict(data, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+REPORT_WRITERS = {
+    'xlsx-stream': StreamingXlsxWriter,
+    'csv': CsvReportWriter,
+    'parquet': ParquetReportWriter,
+}
+
+
+def open_report_writer(fmt: str, output_path):
+    if fmt not in REPORT_WRITERS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    return REPORT_WRITERS[fmt](output_path)